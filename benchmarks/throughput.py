@@ -0,0 +1,180 @@
+"""
+End-to-end throughput benchmark against a local fake Bot API.
+
+Every scenario logs records as fast as possible through a real
+``TelegramHandler`` talking HTTP to ``tgbot_logging.testing.FakeBotAPI``,
+waits until every record has been acknowledged and reports:
+
+* emit latency percentiles on the logging thread
+* delivered records per second, from the first emit to the last ack
+* Bot API calls per delivered record
+* peak traced memory, from a second run under ``tracemalloc``
+
+Usage::
+
+    python benchmarks/throughput.py              # full matrix
+    python benchmarks/throughput.py --quick      # fewer records, e.g. for CI
+    python benchmarks/throughput.py --json results.json
+
+Per-chat rate limiting is off, so the numbers show the handler and not
+Telegram's quotas.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, NamedTuple
+
+from tgbot_logging import TelegramHandler
+from tgbot_logging.testing import FakeBotAPI
+
+# Longest wait for the last acknowledgement (seconds)
+DRAIN_TIMEOUT = 120.0
+
+
+class Scenario(NamedTuple):
+    name: str
+    batch_size: int
+    chats: int = 1
+    max_concurrent_chats: int = 8
+    latency: float = 0.02
+    retry_after_rate: float = 0.0
+    error_rate: float = 0.0
+
+
+SCENARIOS = [
+    Scenario("unbatched", batch_size=1),
+    Scenario("batch 10", batch_size=10),
+    Scenario("batch 50", batch_size=50),
+    Scenario("batch 50, 8 chats", batch_size=50, chats=8),
+    Scenario(
+        "batch 50, 8 chats, serial", batch_size=50, chats=8, max_concurrent_chats=1
+    ),
+    Scenario("batch 50, faults", batch_size=50, retry_after_rate=0.05, error_rate=0.02),
+]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Return the q-th percentile of sorted values (nearest rank)."""
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def delivered(handler: TelegramHandler) -> int:
+    chats = handler.metrics_snapshot()["chats"].values()
+    return sum(chat["sent"] for chat in chats)
+
+
+def run(scenario: Scenario, records: int, trace_memory: bool) -> Dict[str, Any]:
+    """Run one scenario and return its measurements."""
+    with FakeBotAPI(
+        latency=scenario.latency,
+        retry_after_rate=scenario.retry_after_rate,
+        retry_after=1,
+        error_rate=scenario.error_rate,
+        seed=1,
+    ) as api:
+        handler = TelegramHandler(
+            token=api.token,
+            chat_ids=[str(1000 + i) for i in range(scenario.chats)],
+            base_url=api.base_url,
+            batch_size=scenario.batch_size,
+            batch_interval=0.1,
+            max_concurrent_chats=scenario.max_concurrent_chats,
+            rate_limit=False,
+            retry_delay=0.1,
+            max_retries=5,
+        )
+        logger = logging.getLogger(f"benchmark.{scenario.name}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        # Let the token check and connection prewarm finish
+        time.sleep(0.2)
+
+        if trace_memory:
+            tracemalloc.start()
+        latencies = []
+        start = time.perf_counter()
+        for i in range(records):
+            emit_start = time.perf_counter()
+            logger.info("Benchmark record %d of %d", i, records)
+            latencies.append(time.perf_counter() - emit_start)
+
+        expected = records * scenario.chats
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while delivered(handler) < expected and time.monotonic() < deadline:
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - start
+        peak_memory = 0
+        if trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        sent = delivered(handler)
+        logger.removeHandler(handler)
+        handler.close()
+
+    latencies.sort()
+    return {
+        "scenario": scenario.name,
+        "records": expected,
+        "delivered": sent,
+        "emit_p50_us": percentile(latencies, 50) * 1e6,
+        "emit_p99_us": percentile(latencies, 99) * 1e6,
+        "emit_max_us": latencies[-1] * 1e6,
+        "records_per_second": sent / elapsed,
+        "api_calls_per_record": api.calls["sendMessage"] / max(1, sent),
+        "peak_memory_kib": peak_memory / 1024,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, default=5000, help="records per run")
+    parser.add_argument("--quick", action="store_true", help="run 500 records")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument(
+        "--scenario", action="append", help="only run scenarios with this name"
+    )
+    args = parser.parse_args()
+    records = 500 if args.quick else args.records
+
+    columns = (
+        ("scenario", "{:<28}"),
+        ("emit_p50_us", "{:>9.1f}"),
+        ("emit_p99_us", "{:>9.1f}"),
+        ("emit_max_us", "{:>10.1f}"),
+        ("records_per_second", "{:>10.0f}"),
+        ("api_calls_per_record", "{:>10.3f}"),
+        ("peak_memory_kib", "{:>10.0f}"),
+    )
+    print(
+        f"{'scenario':<28}{'p50 µs':>9}{'p99 µs':>9}{'max µs':>10}"
+        f"{'rec/s':>10}{'calls/rec':>10}{'peak KiB':>10}"
+    )
+
+    results = []
+    for scenario in SCENARIOS:
+        if args.scenario and scenario.name not in args.scenario:
+            continue
+        result = run(scenario, records, trace_memory=False)
+        result["peak_memory_kib"] = run(scenario, records, trace_memory=True)[
+            "peak_memory_kib"
+        ]
+        results.append(result)
+        print("".join(fmt.format(result[key]) for key, fmt in columns))
+        if result["delivered"] < result["records"]:
+            print(f"  only {result['delivered']} of {result['records']} delivered")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r["delivered"] == r["records"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
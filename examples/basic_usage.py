@@ -35,8 +35,8 @@ def main():
     logger.warning("This is a warning message")
     logger.error("This is an error message")
 
-    # HTML formatting example
-    logger.info("Message with <b>bold text</b> and <i>italic text</i>")
+    # fmt is HTML; record text is escaped and shown as written
+    logger.info("Comparison a < b & c")
 
     # Batching example
     for i in range(10):
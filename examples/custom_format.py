@@ -6,26 +6,26 @@ from tgbot_logging import TelegramHandler
 
 def minimal_format(record: logging.LogRecord, context: dict) -> str:
     """Minimal format: message and level only."""
-    return f"[{record.levelname}] {record.getMessage()}"
+    return f"[{record.levelname}] {context['escape'](record.getMessage())}"
 
 
 def detailed_format(record: logging.LogRecord, context: dict) -> str:
     """Detailed format with additional information."""
     # Use formatter from context
     timestamp = context["formatter"].formatTime(record)
+    escape = context["escape"]
 
     parts = [
-        f"🏢 <b>[{context['project_name']}]</b>",
+        f"🏢 <b>[{escape(context['project_name'])}]</b>",
         f"{context['level_emojis'].get(record.levelno, '🔵')}",
         f"<b>{record.levelname}</b>",
         f"[{timestamp}]",
-        f"\n📍 {record.pathname}:{record.lineno}",
-        f"\n💬 {record.getMessage()}",
+        f"\n📍 {escape(record.pathname)}:{record.lineno}",
+        f"\n💬 {escape(record.getMessage())}",
     ]
     if record.exc_info:
-        parts.append(
-            f"\n⚠️ <code>{context['formatter'].formatException(record.exc_info)}</code>"
-        )
+        exception = context["formatter"].formatException(record.exc_info)
+        parts.append(f"\n⚠️ <code>{escape(exception)}</code>")
     return " ".join(parts)
 
 
@@ -44,8 +44,8 @@ def monitoring_format(record: logging.LogRecord, context: dict) -> str:
 
     return (
         f"{level_colors.get(record.levelname, '⚪️')} "
-        f"<b>[{context['project_name']}]</b> "
-        f"{record.getMessage()} "
+        f"<b>[{context['escape'](context['project_name'])}]</b> "
+        f"{context['escape'](record.getMessage())} "
         f"| {timestamp} "
         f"| {record.threadName}"
     )
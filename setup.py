@@ -39,7 +39,7 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=[
-        "python-telegram-bot>=20.0",
+        "python-telegram-bot>=21.6",
         "python-dotenv>=0.19.0",
     ],
     extras_require={
@@ -0,0 +1,469 @@
+"""
+One Telegram sender per host for multi-process servers.
+
+With gunicorn or uvicorn every worker process would otherwise run its own
+``TelegramHandler``, each with its own loop, ``Bot``, queues and view of the
+rate limits. Together they exceed the bot's quotas and cannot batch or
+coalesce across workers.
+
+Instead, workers attach a ``ForwardingHandler``, which encodes each record
+into a compact frame and streams it over a Unix socket from a background
+thread, so logging never waits on the socket. A single ``Aggregator``, e.g.
+started in the gunicorn master, receives the records and hands them to one
+``TelegramHandler``, which then batches, coalesces, rate-limits and sends
+for the whole host::
+
+    # gunicorn.conf.py
+    def when_ready(server):
+        handler = TelegramHandler(token=TOKEN, chat_ids=CHAT_IDS, batch_size=20)
+        server.aggregator = Aggregator(handler, "/run/myapp/telegram.sock").start()
+
+    def post_worker_init(worker):
+        logging.getLogger().addHandler(ForwardingHandler("/run/myapp/telegram.sock"))
+
+Unix sockets are not available on Windows.
+"""
+
+import json
+import logging
+import os
+import queue
+import selectors
+import socket
+import struct
+import time
+from threading import Event, Lock, Thread
+from typing import Any, Dict, List, Optional
+
+# Encoding version, sent as the first byte of every frame's payload; version 1
+# frames carry no extra attributes and are still accepted
+WIRE_VERSION = 2
+_WIRE_VERSIONS = (1, 2)
+
+# Every frame is a 4-byte big-endian payload length followed by the payload
+_FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 256 * 1024
+
+# Record attributes sent to the aggregator, in wire order
+FIELDS = (
+    "name",
+    "levelno",
+    "levelname",
+    "msg",
+    "created",
+    "msecs",
+    "pathname",
+    "filename",
+    "module",
+    "lineno",
+    "funcName",
+    "process",
+    "processName",
+    "thread",
+    "threadName",
+    "exc_text",
+    "stack_info",
+)
+
+# Attributes every record has; any others were added, e.g. through ``extra``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {
+    "message",
+    "asctime",
+}
+
+# Types of added attributes that are forwarded; nested values that JSON cannot
+# represent are sent as strings
+_EXTRA_TYPES = (str, int, float, bool, type(None), list, tuple, dict)
+
+# Longest message and traceback forwarded (characters); longer ones are cut
+MAX_TEXT_LENGTH = 16384
+
+DEFAULT_MAX_QUEUE_SIZE = 10000
+MAX_FRAMES_PER_WRITE = 256
+RECONNECT_INTERVAL = 1.0  # seconds
+SEND_TIMEOUT = 5.0  # seconds
+CLOSE_TIMEOUT = 5.0  # seconds
+POLL_INTERVAL = 0.5  # seconds
+
+
+def _truncate(text: Optional[str], keep_end: bool = False) -> Optional[str]:
+    if text is None or len(text) <= MAX_TEXT_LENGTH:
+        return text
+    if keep_end:
+        # The end of a traceback names the exception
+        return "…" + text[-(MAX_TEXT_LENGTH - 1) :]
+    return text[: MAX_TEXT_LENGTH - 1] + "…"
+
+
+def _extras(record: logging.LogRecord) -> Dict[str, Any]:
+    """Return the attributes added to a record that can be sent as JSON."""
+    return {
+        key: value
+        for key, value in vars(record).items()
+        if key not in _RECORD_ATTRIBUTES
+        and not key.startswith("_")
+        and isinstance(value, _EXTRA_TYPES)
+    }
+
+
+def _encode_payload(values: List[Any]) -> bytes:
+    return bytes((WIRE_VERSION,)) + json.dumps(
+        values, ensure_ascii=False, separators=(",", ":"), default=str
+    ).encode("utf-8")
+
+
+def encode_record(
+    record: logging.LogRecord, formatter: Optional[logging.Formatter] = None
+) -> bytes:
+    """
+    Encode a record into a frame for the aggregator.
+
+    The message is interpolated and a traceback is formatted here, as
+    neither arguments nor traceback objects can be sent to another process.
+    Attributes added to the record, e.g. through ``extra``, are sent along
+    if they are JSON values, and left out if the frame would be too large.
+
+    Args:
+        record (logging.LogRecord): Record to encode
+        formatter (logging.Formatter): Formatter for the traceback
+
+    Returns:
+        bytes: Frame including its length header
+
+    Raises:
+        ValueError: If the record does not fit into a frame even without its
+            added attributes
+    """
+    values = [getattr(record, field, None) for field in FIELDS]
+    values[FIELDS.index("msg")] = _truncate(record.getMessage())
+    exc_text = record.exc_text
+    if record.exc_info and not exc_text:
+        exc_text = (formatter or logging.Formatter()).formatException(record.exc_info)
+    values[FIELDS.index("exc_text")] = _truncate(exc_text, keep_end=True)
+    values[FIELDS.index("stack_info")] = _truncate(record.stack_info, keep_end=True)
+    extras = _extras(record)
+    payload = _encode_payload(values + [extras])
+    if len(payload) > MAX_FRAME_SIZE and extras:
+        payload = _encode_payload(values + [{}])
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError("Record is too large to forward")
+    return _FRAME_HEADER.pack(len(payload)) + payload
+
+
+def decode_record(payload: bytes) -> logging.LogRecord:
+    """
+    Decode the payload of a frame sent by ``ForwardingHandler``.
+
+    Raises:
+        ValueError: If the payload is not a record of a known version
+    """
+    if not payload or payload[0] not in _WIRE_VERSIONS:
+        raise ValueError("Unknown record encoding")
+    values = json.loads(payload[1:].decode("utf-8"))
+    has_extras = payload[0] >= 2
+    if not isinstance(values, list) or len(values) != len(FIELDS) + has_extras:
+        raise ValueError("Malformed record")
+    attributes: Dict[str, Any] = {}
+    if has_extras:
+        if not isinstance(values[-1], dict):
+            raise ValueError("Malformed record")
+        attributes.update(values.pop())
+    attributes.update(zip(FIELDS, values))
+    attributes["args"] = None
+    attributes["exc_info"] = None
+    return logging.makeLogRecord(attributes)
+
+
+class ForwardingHandler(logging.Handler):
+    """Sends records to an ``Aggregator`` over a Unix socket."""
+
+    def __init__(
+        self,
+        socket_path: str,
+        level: int = logging.NOTSET,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+    ):
+        """
+        Initialize the handler.
+
+        Args:
+            socket_path (str): Path of the aggregator's socket
+            level (int): Logging level
+            max_queue_size (int): Maximum number of records waiting to be sent;
+                further records are dropped
+        """
+        super().__init__(level)
+        self.socket_path = socket_path
+        self.max_queue_size = max(1, max_queue_size)
+        self.dropped_records = 0
+        self._dropped_lock = Lock()
+        self._failing = False
+        self._start()
+
+    def _start(self) -> None:
+        """Start the sender thread of the current process."""
+        self._pid = os.getpid()
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(self.max_queue_size)
+        self._thread = Thread(target=self._forward, daemon=True)
+        self._thread.start()
+
+    def _drop(self, count: int = 1) -> None:
+        with self._dropped_lock:
+            self.dropped_records += count
+
+    def _report(self, error: Exception) -> None:
+        # Report once per outage rather than for every record
+        if not self._failing:
+            self._failing = True
+            print(f"Error forwarding records to {self.socket_path}: {str(error)}")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        Queue a record for the aggregator.
+
+        Records are dropped and counted in ``dropped_records`` when the queue
+        is full or the aggregator cannot be reached.
+        """
+        if self._pid != os.getpid():
+            # Threads do not survive a fork, e.g. with gunicorn's preload_app
+            self._start()
+        try:
+            frame = encode_record(record, self.formatter)
+        except Exception as e:
+            print(f"Error encoding record: {str(e)}")
+            self._drop()
+            return
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            self._drop()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(SEND_TIMEOUT)
+            sock.connect(self.socket_path)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _forward(self) -> None:
+        """Send queued frames, several per write, until closed."""
+        sock: Optional[socket.socket] = None
+        retry_at = 0.0
+        closing = False
+        while not closing:
+            frames: List[bytes] = []
+            frame = self._queue.get()
+            while frame is not None:
+                frames.append(frame)
+                if len(frames) >= MAX_FRAMES_PER_WRITE:
+                    break
+                try:
+                    frame = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            closing = frame is None
+            if not frames:
+                continue
+
+            try:
+                if sock is None:
+                    if time.monotonic() < retry_at:
+                        self._drop(len(frames))
+                        continue
+                    sock = self._connect()
+                sock.sendall(b"".join(frames))
+                self._failing = False
+            except OSError as e:
+                self._drop(len(frames))
+                self._report(e)
+                if sock is not None:
+                    sock.close()
+                    sock = None
+                retry_at = time.monotonic() + RECONNECT_INTERVAL
+
+        if sock is not None:
+            sock.close()
+
+    def close(self) -> None:
+        """Send the queued records, waiting up to ``CLOSE_TIMEOUT``, and stop."""
+        try:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                try:
+                    self._queue.put(None, timeout=CLOSE_TIMEOUT)
+                    self._thread.join(timeout=CLOSE_TIMEOUT)
+                except queue.Full:
+                    pass
+        finally:
+            super().close()
+
+
+class _Connection:
+    __slots__ = ("sock", "buffer", "skip")
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.buffer = bytearray()
+        # Bytes of an oversized frame still to be discarded
+        self.skip = 0
+
+
+class Aggregator:
+    """Receives records from ``ForwardingHandler`` workers and passes them to one handler."""
+
+    def __init__(self, handler: logging.Handler, socket_path: str, backlog: int = 128):
+        """
+        Initialize the aggregator.
+
+        Args:
+            handler (logging.Handler): Handler that sends the records, usually a
+                ``TelegramHandler``; its level and filters apply
+            socket_path (str): Path to bind the socket to; a stale socket left by a
+                previous run is replaced
+            backlog (int): Maximum number of pending worker connections
+
+        Raises:
+            OSError: If another aggregator is already listening on the path
+        """
+        self.handler = handler
+        self.socket_path = socket_path
+        self.received = 0
+        self.invalid = 0
+        self._stop = Event()
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._connections: Dict[int, _Connection] = {}
+
+        self._remove_stale_socket()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.bind(socket_path)
+            self._socket.listen(backlog)
+            self._socket.setblocking(False)
+        except Exception:
+            self._socket.close()
+            raise
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._socket, selectors.EVENT_READ)
+
+    def _remove_stale_socket(self) -> None:
+        """Remove a socket file nobody listens on any more."""
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except ConnectionRefusedError:
+            os.unlink(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise OSError(f"An aggregator is already listening on {self.socket_path}")
+
+    def start(self) -> "Aggregator":
+        """Start receiving records on a background thread."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._serve, daemon=True)
+                self._thread.start()
+        return self
+
+    def _serve(self) -> None:
+        """Accept workers and read their records until closed."""
+        while not self._stop.is_set():
+            for key, _ in self._selector.select(timeout=POLL_INTERVAL):
+                if key.fileobj is self._socket:
+                    self._accept()
+                else:
+                    self._read(self._connections[key.fd])
+
+    def _accept(self) -> None:
+        try:
+            sock, _ = self._socket.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        self._connections[sock.fileno()] = _Connection(sock)
+        self._selector.register(sock, selectors.EVENT_READ)
+
+    def _disconnect(self, connection: _Connection) -> None:
+        self._selector.unregister(connection.sock)
+        del self._connections[connection.sock.fileno()]
+        connection.sock.close()
+
+    def _read(self, connection: _Connection) -> None:
+        try:
+            data = connection.sock.recv(MAX_FRAME_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._disconnect(connection)
+            return
+
+        buffer = connection.buffer
+        buffer += data
+        offset = 0
+        while True:
+            if connection.skip:
+                skipped = min(connection.skip, len(buffer) - offset)
+                connection.skip -= skipped
+                offset += skipped
+                if connection.skip:
+                    break
+            if len(buffer) - offset < _FRAME_HEADER.size:
+                break
+            (length,) = _FRAME_HEADER.unpack_from(buffer, offset)
+            if length > MAX_FRAME_SIZE:
+                # Skip the frame without buffering it; the stream stays in sync
+                print("Error reading forwarded records: frame too large, skipped")
+                self.invalid += 1
+                connection.skip = length
+                offset += _FRAME_HEADER.size
+                continue
+            end = offset + _FRAME_HEADER.size + length
+            if len(buffer) < end:
+                break
+            self._handle(bytes(buffer[offset + _FRAME_HEADER.size : end]))
+            offset = end
+        del buffer[:offset]
+
+    def _handle(self, payload: bytes) -> None:
+        try:
+            record = decode_record(payload)
+        except Exception as e:
+            self.invalid += 1
+            print(f"Error decoding forwarded record: {str(e)}")
+            return
+
+        self.received += 1
+        # Loggers check handler levels before calling handle()
+        if record.levelno < self.handler.level:
+            return
+        try:
+            self.handler.handle(record)
+        except Exception as e:
+            print(f"Error handling forwarded record: {str(e)}")
+
+    def close(self) -> None:
+        """
+        Stop receiving and remove the socket.
+
+        The handler is not closed; it may still hold records to send.
+        """
+        self._stop.set()
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=POLL_INTERVAL * 4)
+        for connection in list(self._connections.values()):
+            self._disconnect(connection)
+        self._selector.close()
+        self._socket.close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
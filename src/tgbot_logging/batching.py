@@ -0,0 +1,94 @@
+"""
+Adaptive batch window driven by observed traffic.
+
+A fixed ``batch_interval`` is a compromise: at quiet times it only delays
+records that will never share a request, and during bursts records are
+sent before enough of them have arrived to fill one. ``AdaptiveBatcher``
+estimates the arrival rate with an exponentially weighted moving average
+and picks the window from it:
+
+* when fewer than ``MIN_EXPECTED_RECORDS`` records are expected within the
+  longest allowed wait, holding cannot save a request and the window is 0;
+* otherwise the window is the time a full batch takes to arrive, capped at
+  ``max_window``;
+* every ``RetryAfter`` from Telegram doubles a throttle factor that pushes
+  the window towards ``max_window``, and successful sends let it decay.
+
+The handler never holds a record longer than its level's latency budget,
+whatever the window.
+"""
+
+import math
+import time
+from threading import Lock
+from typing import Optional
+
+# Below this many expected records per window, batching is not worth a delay
+MIN_EXPECTED_RECORDS = 2.0
+MAX_THROTTLE = 8.0
+THROTTLE_DECAY = 0.9
+
+
+class AdaptiveBatcher:
+    """Estimates the arrival rate and derives the batch window from it."""
+
+    def __init__(
+        self,
+        max_batch_size: int,
+        max_window: float,
+        time_constant: float = 10.0,
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            max_batch_size (int): Records per request the window aims for
+            max_window (float): Longest window (seconds)
+            time_constant (float): How quickly the rate estimate follows changes (seconds)
+        """
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_window = max(0.0, max_window)
+        self.time_constant = max(0.001, time_constant)
+        self.throttle = 1.0
+        self._rate = 0.0
+        self._last_arrival: Optional[float] = None
+        self._lock = Lock()
+
+    def _decayed(self, now: float) -> float:
+        if self._last_arrival is None:
+            return 0.0
+        elapsed = max(0.0, now - self._last_arrival)
+        return self._rate * math.exp(-elapsed / self.time_constant)
+
+    def observe_arrival(self, now: Optional[float] = None) -> None:
+        """Count an incoming record."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._rate = self._decayed(now) + 1.0 / self.time_constant
+            self._last_arrival = now
+
+    def arrival_rate(self, now: Optional[float] = None) -> float:
+        """Return the estimated arrival rate in records per second."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._decayed(now)
+
+    def observe_throttle(self) -> None:
+        """Record a ``RetryAfter`` from Telegram."""
+        with self._lock:
+            self.throttle = min(MAX_THROTTLE, self.throttle * 2)
+
+    def observe_success(self) -> None:
+        """Record a successful send."""
+        with self._lock:
+            self.throttle = max(1.0, self.throttle * THROTTLE_DECAY)
+
+    def window(self, now: Optional[float] = None) -> float:
+        """Return how long records may currently be held to batch them (seconds)."""
+        rate = self.arrival_rate(now)
+        if rate * self.max_window < MIN_EXPECTED_RECORDS:
+            window = 0.0
+        else:
+            window = min(self.max_window, self.max_batch_size / rate)
+        # Being throttled means requests are scarcer than latency
+        return max(window, self.max_window * (1 - 1 / self.throttle))
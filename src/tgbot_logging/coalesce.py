@@ -0,0 +1,128 @@
+"""
+Coalescing of duplicate log records.
+
+When a dependency goes down, the same error tends to be logged thousands of
+times a minute. ``Coalescer`` fingerprints records by logger name, level and
+unformatted message template (``record.msg``, before ``%`` arguments are
+applied), lets the first record of each fingerprint through and only counts
+the repeats that arrive within ``window`` seconds. Once the window closes
+the handler sends one summary for them instead of thousands of messages.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import List, NamedTuple, Optional, Tuple
+
+Fingerprint = Tuple[str, int, str]
+
+
+class CoalescedRecord(NamedTuple):
+    """Repeats of one fingerprint collapsed over a window."""
+
+    record: logging.LogRecord  # the most recent record
+    count: int  # records seen in the window, including the first
+    first_seen: float  # ``record.created`` of the first record
+    last_seen: float  # ``record.created`` of the most recent record
+
+
+class _Entry:
+    __slots__ = ("record", "count", "first_seen", "last_seen", "expires")
+
+    def __init__(self, record: logging.LogRecord, expires: float):
+        self.record = record
+        self.count = 1
+        self.first_seen = self.last_seen = record.created
+        self.expires = expires
+
+    def summary(self) -> CoalescedRecord:
+        return CoalescedRecord(self.record, self.count, self.first_seen, self.last_seen)
+
+
+class Coalescer:
+    """Collapses repeated records within a time window."""
+
+    def __init__(self, window: float = 60.0, max_fingerprints: int = 1000):
+        """
+        Initialize the coalescer.
+
+        Args:
+            window (float): How long repeats of a record are collapsed (seconds)
+            max_fingerprints (int): Maximum number of fingerprints tracked at once;
+                the oldest window is closed early to make room
+        """
+        self.window = max(0.0, window)
+        self.max_fingerprints = max(1, max_fingerprints)
+        self.suppressed = 0
+        # Every window has the same length, so insertion order is expiry order
+        self._entries: "OrderedDict[Fingerprint, _Entry]" = OrderedDict()
+        self._closed: List[CoalescedRecord] = []
+        self._lock = Lock()
+
+    @staticmethod
+    def fingerprint(record: logging.LogRecord) -> Fingerprint:
+        """Return the key under which repeats of a record are collapsed."""
+        return record.name, record.levelno, str(record.msg)
+
+    def admit(self, record: logging.LogRecord) -> bool:
+        """
+        Track a record and decide whether it should be sent now.
+
+        Args:
+            record (logging.LogRecord): Incoming record
+
+        Returns:
+            bool: True for the first record of a window, False for a repeat
+        """
+        key = self.fingerprint(record)
+        with self._lock:
+            self._expire(record.created)
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.record = record
+                entry.count += 1
+                entry.last_seen = max(entry.last_seen, record.created)
+                self.suppressed += 1
+                return False
+
+            if len(self._entries) >= self.max_fingerprints:
+                self._close(next(iter(self._entries)))
+            self._entries[key] = _Entry(record, record.created + self.window)
+            return True
+
+    def _close(self, key: Fingerprint) -> None:
+        """End the window for ``key`` and keep its summary if it had repeats."""
+        entry = self._entries.pop(key)
+        if entry.count > 1:
+            self._closed.append(entry.summary())
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires > now:
+                break
+            self._close(key)
+
+    def collect(self, now: Optional[float] = None) -> List[CoalescedRecord]:
+        """
+        Return the summaries of windows that have closed since the last call.
+
+        Args:
+            now (float): Current time, defaults to ``time.time()``
+
+        Returns:
+            List[CoalescedRecord]: Windows that saw repeats, oldest first
+        """
+        with self._lock:
+            self._expire(time.time() if now is None else now)
+            closed, self._closed = self._closed, []
+            return closed
+
+    def collect_all(self) -> List[CoalescedRecord]:
+        """Close every open window and return the summaries, e.g. on shutdown."""
+        with self._lock:
+            while self._entries:
+                self._close(next(iter(self._entries)))
+            closed, self._closed = self._closed, []
+            return closed
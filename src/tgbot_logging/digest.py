@@ -0,0 +1,241 @@
+"""
+Periodic digests of high-volume record streams.
+
+For INFO or WARNING streams the individual messages rarely matter, their
+volume does. ``Digest`` aggregates records in memory instead of forwarding
+them and the handler sends one summary per interval: counts per level and
+logger, the most frequent message templates and a few sample messages.
+
+Memory does not grow with the number of records. Each level and logger
+pair holds one counter, the templates are tracked with the Space-Saving
+algorithm in at most ``max_templates`` slots, with a min-heap to find the
+least frequent one in logarithmic time, and the samples are a fixed
+size reservoir. A level that passes its spike threshold within an interval
+is escalated: its records are delivered immediately for the rest of the
+interval.
+"""
+
+import heapq
+import logging
+import random
+import time
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+TOP_TEMPLATES = 5
+SAMPLES = 3
+MAX_TEXT_LENGTH = 200
+
+# (logger name, level, unformatted message template)
+TemplateKey = Tuple[str, int, str]
+
+
+def _shorten(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) > MAX_TEXT_LENGTH:
+        text = text[: MAX_TEXT_LENGTH - 1] + "…"
+    return text
+
+
+class TemplateCount(NamedTuple):
+    """A frequent message template and its count in the interval."""
+
+    name: str
+    levelno: int
+    template: str
+    count: int
+    error: int  # the count may be overestimated by up to this much
+
+
+class DigestSummary(NamedTuple):
+    """Everything a digest aggregated over one interval."""
+
+    start: float
+    end: float
+    total: int
+    counts: Dict[int, Dict[str, int]]  # level -> logger -> records
+    templates: List[TemplateCount]  # most frequent first
+    samples: List[str]
+    escalated: Dict[int, float]  # level -> time it passed its threshold
+
+
+class Digest:
+    """Aggregates records into a periodic summary in constant space."""
+
+    def __init__(
+        self,
+        spike_thresholds: Optional[Dict[int, int]] = None,
+        max_templates: int = 100,
+        top_templates: int = TOP_TEMPLATES,
+        samples: int = SAMPLES,
+    ):
+        """
+        Initialize the digest.
+
+        Args:
+            spike_thresholds (Dict[int, int]): Records of a level absorbed per
+                interval; further records of the level are delivered immediately
+            max_templates (int): Number of templates tracked; the most frequent
+                ones are counted exactly unless there are more templates than this
+            top_templates (int): Number of templates listed in a summary
+            samples (int): Number of sample messages kept per interval
+        """
+        self.spike_thresholds = dict(spike_thresholds or {})
+        self.max_templates = max(1, max_templates)
+        self.top_templates = max(0, top_templates)
+        self.samples = max(0, samples)
+        self._random = random.Random()
+        self._lock = Lock()
+        self._reset(time.time())
+
+    def _reset(self, now: float) -> None:
+        self._start = now
+        self._total = 0
+        self._counts: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._level_totals: Dict[int, int] = defaultdict(int)
+        # Space-Saving: template -> [count, error]
+        self._templates: Dict[TemplateKey, List[int]] = {}
+        # One (count, template) entry per template; counts only grow, so an
+        # entry may lag behind and is refreshed when it reaches the top
+        self._heap: List[Tuple[int, TemplateKey]] = []
+        self._samples: List[str] = []
+        self._escalated: Dict[int, float] = {}
+
+    def add(self, record: logging.LogRecord) -> bool:
+        """
+        Count a record.
+
+        Args:
+            record (logging.LogRecord): Incoming record
+
+        Returns:
+            bool: True if the record's level is escalated and the record should
+            be delivered now, False if the digest absorbed it
+        """
+        levelno = record.levelno
+        with self._lock:
+            if levelno in self._escalated:
+                return True
+            threshold = self.spike_thresholds.get(levelno)
+            if threshold and self._level_totals[levelno] >= threshold:
+                self._escalated[levelno] = record.created
+                return True
+
+            self._total += 1
+            self._counts[levelno][record.name] += 1
+            self._level_totals[levelno] += 1
+
+            key = (record.name, levelno, str(record.msg))
+            slot = self._templates.get(key)
+            if slot is not None:
+                slot[0] += 1
+            elif len(self._templates) < self.max_templates:
+                self._templates[key] = [1, 0]
+                heapq.heappush(self._heap, (1, key))
+            else:
+                # Replace the least frequent template and inherit its count
+                # as the possible overestimate
+                count, smallest = self._heap[0]
+                while self._templates[smallest][0] != count:
+                    heapq.heapreplace(
+                        self._heap, (self._templates[smallest][0], smallest)
+                    )
+                    count, smallest = self._heap[0]
+                del self._templates[smallest]
+                self._templates[key] = [count + 1, count]
+                heapq.heapreplace(self._heap, (count + 1, key))
+
+            # Reservoir sampling: every record is kept with equal probability
+            if len(self._samples) < self.samples:
+                self._samples.append(self._sample(record))
+            elif self.samples:
+                index = self._random.randrange(self._total)
+                if index < self.samples:
+                    self._samples[index] = self._sample(record)
+        return False
+
+    @staticmethod
+    def _sample(record: logging.LogRecord) -> str:
+        try:
+            message = record.getMessage()
+        except Exception:
+            message = str(record.msg)
+        return _shorten(f"{record.levelname} {record.name}: {message}")
+
+    def collect(self, now: Optional[float] = None) -> Optional[DigestSummary]:
+        """
+        Return the summary of the interval that just ended and start a new one.
+
+        Args:
+            now (float): End of the interval, defaults to ``time.time()``
+
+        Returns:
+            Optional[DigestSummary]: None if no records were absorbed
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._total:
+                self._start = now
+                return None
+            top = sorted(
+                self._templates.items(), key=lambda item: item[1][0], reverse=True
+            )[: self.top_templates]
+            summary = DigestSummary(
+                start=self._start,
+                end=now,
+                total=self._total,
+                counts={
+                    levelno: dict(loggers)
+                    for levelno, loggers in sorted(self._counts.items())
+                },
+                templates=[
+                    TemplateCount(name, levelno, _shorten(template), count, error)
+                    for (name, levelno, template), (count, error) in top
+                ],
+                samples=list(self._samples),
+                escalated=dict(self._escalated),
+            )
+            self._reset(now)
+            return summary
+
+
+def format_digest(summary: DigestSummary, datefmt: str = "%H:%M:%S") -> str:
+    """
+    Render a digest summary as plain text.
+
+    Args:
+        summary (DigestSummary): Result of ``Digest.collect``
+        datefmt (str): Format of the interval's start and end times
+
+    Returns:
+        str: Summary lines, to be escaped for the parse mode
+    """
+    start = time.strftime(datefmt, time.localtime(summary.start))
+    end = time.strftime(datefmt, time.localtime(summary.end))
+    lines = [f"📊 Digest {start}–{end}: {summary.total:,} records"]
+
+    for levelno, loggers in summary.counts.items():
+        busiest = sorted(loggers.items(), key=lambda item: item[1], reverse=True)
+        shown = ", ".join(f"{name} {count:,}" for name, count in busiest[:3])
+        if len(busiest) > 3:
+            shown += f", {len(busiest) - 3} more"
+        line = f"{logging.getLevelName(levelno)}: {sum(loggers.values()):,} ({shown})"
+        if levelno in summary.escalated:
+            escalated = time.strftime(
+                datefmt, time.localtime(summary.escalated[levelno])
+            )
+            line += f", sent immediately since {escalated}"
+        lines.append(line)
+
+    if summary.templates:
+        lines.append("Top templates:")
+        for template in summary.templates:
+            approximate = "≤" if template.error else ""
+            lines.append(
+                f"{approximate}{template.count:,} × {template.name}: {template.template}"
+            )
+    if summary.samples:
+        lines.append("Samples:")
+        lines.extend(summary.samples)
+    return "\n".join(lines)
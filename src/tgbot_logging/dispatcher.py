@@ -0,0 +1,203 @@
+"""
+Process-wide dispatcher shared by every TelegramHandler for a bot token.
+
+By default each handler runs its own event loop thread, sender thread and
+``Bot`` with its own connection pool. Services that attach many handlers
+(one per subsystem) can opt into ``shared_dispatcher=True`` instead: all
+handlers for the same token then share one loop thread, one sender thread,
+one ``Bot`` (and with it one HTTP connection pool) and one rate limiter,
+while each handler keeps its own queues, formatting and settings.
+"""
+
+import asyncio
+import time
+import weakref
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from telegram import Bot
+from telegram.error import InvalidToken
+
+from .ratelimit import RateLimiter
+from .transport import DEFAULT_BASE_URL, PooledHTTPXRequest
+
+if TYPE_CHECKING:
+    from .handler import TelegramHandler
+
+# How long the sender waits when no handler is registered (seconds)
+IDLE_INTERVAL = 1.0
+
+
+class Dispatcher:
+    """Runs the sender loop for all handlers that share a bot token."""
+
+    _instances: Dict[str, "Dispatcher"] = {}
+    _instances_lock = Lock()
+
+    def __init__(
+        self,
+        token: str,
+        request_kwargs: Optional[Dict[str, Any]] = None,
+        prewarm: bool = True,
+        base_url: str = DEFAULT_BASE_URL,
+    ):
+        """
+        Initialize the dispatcher and start its threads.
+
+        Use :meth:`acquire` rather than creating dispatchers directly.
+
+        Args:
+            token (str): Telegram Bot API token
+            request_kwargs (Dict): Settings for ``PooledHTTPXRequest``
+            prewarm (bool): Validate the token and open a connection in the background
+            base_url (str): Bot API endpoint the token is appended to
+        """
+        self.token = token
+        self.bot = Bot(
+            token=token,
+            base_url=base_url,
+            request=PooledHTTPXRequest(**(request_kwargs or {})),
+        )
+        self.rate_limiter = RateLimiter()
+        self.wakeup = Event()
+        self.handlers: List["weakref.ReferenceType[TelegramHandler]"] = []
+        self._handlers_lock = Lock()
+        self._stopped = Event()
+        self.token_valid: Optional[bool] = None
+        self._validation_error: Optional[Exception] = None
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = Thread(
+            target=self._run_event_loop, name="tgbot-logging-loop", daemon=True
+        )
+        self.loop_thread.start()
+        self.sender_thread = Thread(
+            target=self._sender, name="tgbot-logging-sender", daemon=True
+        )
+        self.sender_thread.start()
+
+        if prewarm:
+            asyncio.run_coroutine_threadsafe(self._prewarm(), self.loop)
+
+    @classmethod
+    def acquire(
+        cls,
+        token: str,
+        handler: "TelegramHandler",
+        request_kwargs: Optional[Dict[str, Any]] = None,
+        prewarm: bool = True,
+        base_url: str = DEFAULT_BASE_URL,
+    ) -> "Dispatcher":
+        """
+        Return the dispatcher for ``token`` and register ``handler`` with it.
+
+        The transport settings and base URL of the handler that creates the
+        dispatcher apply to the shared connection pool.
+        """
+        with cls._instances_lock:
+            dispatcher = cls._instances.get(token)
+            if dispatcher is None:
+                dispatcher = cls._instances[token] = cls(
+                    token, request_kwargs, prewarm, base_url
+                )
+            dispatcher._register(handler)
+        return dispatcher
+
+    def release(self, handler: "TelegramHandler") -> None:
+        """Unregister ``handler`` and stop the dispatcher once none are left."""
+        with Dispatcher._instances_lock:
+            if self._unregister(handler):
+                return
+            if Dispatcher._instances.get(self.token) is self:
+                del Dispatcher._instances[self.token]
+        self.stop()
+
+    def _register(self, handler: "TelegramHandler") -> None:
+        with self._handlers_lock:
+            self.handlers.append(weakref.ref(handler))
+            token_valid, error = self.token_valid, self._validation_error
+        # Pass on a validation result that arrived before this handler
+        if token_valid:
+            handler.token_valid = True
+        elif error is not None:
+            handler._report_validation_error(error)
+
+    def _unregister(self, handler: "TelegramHandler") -> int:
+        """Remove ``handler`` and return the number of handlers still registered."""
+        with self._handlers_lock:
+            self.handlers = [
+                ref
+                for ref in self.handlers
+                if ref() is not None and ref() is not handler
+            ]
+            return len(self.handlers)
+
+    def _live_handlers(self) -> List["TelegramHandler"]:
+        with self._handlers_lock:
+            handlers = [ref() for ref in self.handlers]
+        return [
+            handler
+            for handler in handlers
+            if handler is not None and not handler._is_shutting_down.is_set()
+        ]
+
+    async def _prewarm(self) -> None:
+        """Validate the token and open a pooled connection ahead of the first message."""
+        try:
+            await self.bot.initialize()
+            for handler in self._set_validation_result(True, None):
+                handler.token_valid = True
+        except InvalidToken as e:
+            for handler in self._set_validation_result(False, e):
+                handler._report_validation_error(e)
+        except Exception as e:
+            print(f"Error warming up connection: {str(e)}")
+
+    def _set_validation_result(
+        self, token_valid: bool, error: Optional[Exception]
+    ) -> List["TelegramHandler"]:
+        """Store the validation result and return the handlers to notify."""
+        with self._handlers_lock:
+            self.token_valid, self._validation_error = token_valid, error
+            handlers = [ref() for ref in self.handlers]
+        return [handler for handler in handlers if handler is not None]
+
+    def _run_event_loop(self) -> None:
+        """Run the shared event loop."""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _sender(self) -> None:
+        """Wake on new messages or when the next handler is due and flush every handler."""
+        while not self._stopped.is_set():
+            handlers = self._live_handlers()
+            timeout = min(
+                (handler._wait_timeout() for handler in handlers), default=IDLE_INTERVAL
+            )
+            next_wake = time.monotonic() + timeout
+            for handler in handlers:
+                handler._next_wake = next_wake
+            self.wakeup.wait(timeout=timeout)
+            self.wakeup.clear()
+            if self._stopped.is_set():
+                break
+
+            for handler in self._live_handlers():
+                asyncio.run_coroutine_threadsafe(handler._process_queue(), self.loop)
+
+    def stop(self) -> None:
+        """Stop the sender, shut the bot down and stop the loop."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self.wakeup.set()
+
+        async def shutdown() -> None:
+            try:
+                await self.bot.shutdown()
+            except Exception as e:
+                print(f"Error shutting down bot: {str(e)}")
+            finally:
+                self.loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop)
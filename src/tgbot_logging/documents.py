@@ -0,0 +1,82 @@
+"""
+Oversized records sent as compressed document uploads.
+
+A record with a deep traceback or a large payload would take many split
+``sendMessage`` calls. Instead it can go out as one ``sendDocument`` call:
+the caption is a short headline cut from the start of the record, and the
+attached ``.txt.gz`` file holds the whole record as plain text.
+"""
+
+import gzip
+import io
+import time
+from typing import NamedTuple, Optional
+
+from .escaping import escape
+from .packer import headline, plain_text, visible_length
+
+# Telegram's limit for document captions, after entity parsing
+MAX_CAPTION_LENGTH = 1024
+HEADLINE_LENGTH = 300
+
+# zlib's default trade-off between speed and size
+COMPRESS_LEVEL = 6
+
+
+class Document(NamedTuple):
+    """A record prepared for ``sendDocument``."""
+
+    caption: str
+    filename: str
+    content: bytes  # gzip data
+
+
+def build_document(
+    text: str,
+    parse_mode: Optional[str] = None,
+    created: Optional[float] = None,
+    headline_length: int = HEADLINE_LENGTH,
+) -> Document:
+    """
+    Prepare a formatted record for upload as a gzip-compressed text file.
+
+    The file is compressed straight into an in-memory buffer whose bytes are
+    taken without a copy. Wrapping them in ``io.BytesIO`` for an upload does
+    not copy them either, so one compressed file can be sent to every chat.
+
+    Args:
+        text (str): Formatted record with markup
+        parse_mode (str): 'HTML', 'MarkdownV2' or None
+        created (float): Creation time of the record, used in the file name
+        headline_length (int): Maximum visible length of the caption's headline
+
+    Returns:
+        Document: Caption, file name and compressed content
+    """
+    head, cut = headline(
+        text, min(headline_length, MAX_CAPTION_LENGTH - 100), parse_mode
+    )
+    plain = plain_text(text, parse_mode)
+    note = f"… {len(plain):,} characters, full record attached"
+    caption = f"{head.rstrip()}\n{escape(note, parse_mode)}" if cut else head
+
+    content = io.BytesIO()
+    with gzip.GzipFile(
+        fileobj=content, mode="wb", compresslevel=COMPRESS_LEVEL, mtime=0
+    ) as f:
+        f.write(plain.encode("utf-8"))
+
+    stamp = time.strftime(
+        "%Y%m%d-%H%M%S", time.localtime(time.time() if created is None else created)
+    )
+    return Document(caption, f"log-{stamp}.txt.gz", content.getvalue())
+
+
+def is_oversized(text: str, threshold: int, parse_mode: Optional[str] = None) -> bool:
+    """Return whether ``text`` should be sent as a document."""
+    # A character counts at most two UTF-16 units, so short text is not measured
+    return (
+        threshold > 0
+        and 2 * len(text) > threshold
+        and visible_length(text, parse_mode) > threshold
+    )
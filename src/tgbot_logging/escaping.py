@@ -0,0 +1,185 @@
+"""
+Escaping of plain text for Telegram's HTML and MarkdownV2 parse modes.
+
+Telegram rejects a whole message ("can't parse entities") when its text
+contains markup characters that do not form valid entities, such as a
+stray ``<`` in HTML or an unescaped ``.`` in MarkdownV2. Every piece of
+plain text that ends up in a message therefore has to be escaped.
+
+Escaping runs for every record, so it uses translation tables built once at
+import time instead of a regular expression substitution per call, and
+returns text without any special characters (most log messages) unchanged
+after a single scan.
+"""
+
+import re
+import string
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Pattern,
+    Tuple,
+)
+
+HTML = "HTML"
+MARKDOWN_V2 = "MarkdownV2"
+
+# Characters with a meaning in each parse mode, see
+# https://core.telegram.org/bots/api#formatting-options
+HTML_SPECIAL = "&<>"
+MARKDOWN_V2_SPECIAL = "\\_*[]()~`>#+-=|{}.!"
+# Inside pre and code entities only these are special in MarkdownV2
+MARKDOWN_V2_PRE_SPECIAL = "\\`"
+
+_HTML_ENTITIES = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
+
+
+def _table(special: str, replacements: Optional[Dict[str, str]] = None):
+    """Build a translation table and a pattern finding any special character."""
+    replacements = replacements or {char: "\\" + char for char in special}
+    table = str.maketrans(replacements)
+    pattern = re.compile(f"[{re.escape(special)}]")
+    return table, pattern
+
+
+_TABLES: Dict[Tuple[Optional[str], bool], Tuple[Dict[int, str], Pattern]] = {
+    (HTML, False): _table(HTML_SPECIAL, _HTML_ENTITIES),
+    (HTML, True): _table(HTML_SPECIAL, _HTML_ENTITIES),
+    (MARKDOWN_V2, False): _table(MARKDOWN_V2_SPECIAL),
+    (MARKDOWN_V2, True): _table(MARKDOWN_V2_PRE_SPECIAL),
+}
+
+
+def escape(text: str, parse_mode: Optional[str], pre: bool = False) -> str:
+    """
+    Escape plain text for a parse mode.
+
+    Args:
+        text (str): Plain text
+        parse_mode (str): 'HTML', 'MarkdownV2' or None; text is returned as is
+            for None and unknown modes
+        pre (bool): Whether the text goes inside a pre or code entity
+
+    Returns:
+        str: Text that renders as the original characters
+    """
+    tables = _TABLES.get((parse_mode, pre))
+    if tables is None:
+        return text
+    table, special = tables
+    # Most log messages have nothing to escape
+    if special.search(text) is None:
+        return text
+    return text.translate(table)
+
+
+# A literal and the field following it, if any
+_Piece = Tuple[str, Optional[str]]
+
+# A %-style field as accepted by logging.PercentStyle, or an escaped percent
+_PERCENT_FIELD = re.compile(
+    r"%\(\w+\)[#0+ -]*\d*(?:\.\d+)?[diouxefgcrsa]|%%", re.IGNORECASE
+)
+
+
+def _percent_pieces(fmt: str) -> Iterator[_Piece]:
+    """Split a %-style format into literals and the fields after them."""
+    literal = []
+    position = 0
+    for match in _PERCENT_FIELD.finditer(fmt):
+        literal.append(fmt[position : match.start()])
+        position = match.end()
+        if match.group() == "%%":
+            literal.append("%")
+            continue
+        yield "".join(literal), match.group()
+        literal = []
+    literal.append(fmt[position:])
+    yield "".join(literal), None
+
+
+def _brace_pieces(fmt: str) -> Iterator[_Piece]:
+    """Split a {}-style format into literals and the fields after them."""
+    for literal, name, spec, conversion in string.Formatter().parse(fmt):
+        if name is None:
+            yield literal, None
+            continue
+        field = "{" + name
+        if conversion:
+            field += "!" + conversion
+        if spec:
+            field += ":" + spec
+        yield literal, field + "}"
+
+
+def _dollar_pieces(fmt: str) -> Iterator[_Piece]:
+    """Split a $-style format into literals and the fields after them."""
+    literal = []
+    position = 0
+    for match in string.Template.pattern.finditer(fmt):
+        literal.append(fmt[position : match.start()])
+        position = match.end()
+        if match.group("escaped") is not None:
+            literal.append("$")
+        elif match.group("invalid") is not None:
+            # A stray '$', which Formatter rejects unless validate=False
+            literal.append(match.group())
+        else:
+            yield "".join(literal), match.group()
+            literal = []
+    literal.append(fmt[position:])
+    yield "".join(literal), None
+
+
+# How each logging style splits its format and fills in one field
+_STYLES: Dict[
+    str, Tuple[Callable[[str], Iterator[_Piece]], Callable[[str, Any], str]]
+] = {
+    "%": (_percent_pieces, lambda field, values: field % values),
+    "{": (_brace_pieces, lambda field, values: field.format_map(values)),
+    "$": (
+        _dollar_pieces,
+        lambda field, values: string.Template(field).substitute(values),
+    ),
+}
+
+
+class EscapedTemplate:
+    """
+    A format string that is markup, filled in with escaped field values.
+
+    The literal parts, e.g. ``<b>`` in ``"<b>%(levelname)s</b> %(message)s"``,
+    are kept as they are and only the values filled into the fields, such as
+    the message and the logger name, are escaped. The template is split into
+    literals and fields once instead of for every record.
+    """
+
+    def __init__(self, fmt: str, parse_mode: Optional[str], style: str = "%"):
+        """
+        Compile a template.
+
+        Args:
+            fmt (str): Format string such as ``"<b>%(levelname)s</b>: %(message)s"``
+            parse_mode (str): 'HTML', 'MarkdownV2' or None
+            style (str): '%', '{' or '$', as for ``logging.Formatter``
+        """
+        self.fmt = fmt
+        self.parse_mode = parse_mode
+        split, self._fill = _STYLES[style]
+        self._pieces: List[_Piece] = list(split(fmt))
+
+    def format(self, values: Mapping[str, Any]) -> str:
+        """Fill in escaped field values, e.g. from ``record.__dict__``."""
+        parse_mode = self.parse_mode
+        fill = self._fill
+        parts = []
+        for literal, field in self._pieces:
+            parts.append(literal)
+            if field is not None:
+                parts.append(escape(fill(field, values), parse_mode))
+        return "".join(parts)
@@ -10,7 +10,7 @@ Args:
     batch_size (int): Number of messages to batch before sending (default: 1)
     batch_interval (float): Maximum time to wait before sending a batch (seconds)
     max_retries (int): Maximum number of retries for failed messages (default: 3)
-    retry_delay (float): Delay between retries (seconds) (default: 1.0)
+    retry_delay (float): Base delay between retries, doubled on each attempt (seconds) (default: 1.0)
     project_name (str): Project name to identify logs source (default: None)
     project_emoji (str): Emoji to use for project (default: '🔷')
     add_hashtags (bool): Whether to add project hashtag to messages (default: True)
@@ -20,27 +20,185 @@ Args:
     include_level_emoji (bool): Whether to include level emoji (default: True)
     datefmt (str): Custom date format for timestamps (default: None)
     test_mode (bool): Whether to run in test mode (default: False)
+    max_queue_size (int): Maximum number of queued messages per chat, 0 for no limit (default: 0)
+    max_queue_bytes (int): Maximum total size of queued messages per chat in bytes, 0 for no limit (default: 0)
+    overflow_policy (str): What to do when a queue is full: 'drop_oldest', 'drop_newest',
+        'block' or 'downsample' (default: 'drop_oldest')
+    overflow_timeout (float): How long the 'block' policy waits for room (seconds) (default: 1.0)
+    downsample_rate (int): Keep one in this many messages under the 'downsample' policy (default: 10)
+    max_message_length (int): Maximum visible length of a sent message, capped at
+        Telegram's limit of 4096 UTF-16 code units (default: 4096)
+    max_concurrent_chats (int): Maximum number of chats sent to at the same time (default: 8)
+    rate_limit (bool): Whether to schedule sends within Telegram's quotas (default: True,
+        except in test mode)
+    rate_limiter (RateLimiter): Custom rate limiter, e.g. with tuned quotas (default: None)
+    max_retry_delay (float): Upper bound for the exponential retry delay (seconds) (default: 30.0)
+    max_inline_retry_after (float): Longest RetryAfter penalty waited out inline; longer
+        penalties park the chat while other chats keep sending (seconds) (default: 1.0)
+    shared_dispatcher (bool): Share one event loop, sender thread, Bot connection pool and
+        rate limiter with every other handler for the same token (default: False)
+    connection_pool_size (int): Maximum number of open HTTP connections (default: 8)
+    keepalive_expiry (float): Seconds an idle connection is kept open (default: 30.0)
+    connect_timeout (float): Timeout for establishing a connection (seconds) (default: 5.0)
+    read_timeout (float): Timeout for reading a response (seconds) (default: 5.0)
+    write_timeout (float): Timeout for sending a request (seconds) (default: 5.0)
+    pool_timeout (float): Timeout for getting a connection from the pool (seconds) (default: 1.0)
+    http2 (bool): Use HTTP/2 if the h2 package is installed (default: False)
+    prewarm (bool): Validate the token and open a connection in the background so the
+        first message does not pay for the TLS handshake (default: True)
+    on_validation_error (Callable): Called with the exception if the token turns out
+        to be invalid; errors are printed if not set (default: None)
+    spool_dir (str): Directory for a durable on-disk spool; queued messages are written
+        there and replayed after a crash or restart. Each handler needs its own
+        directory (default: None, messages are only kept in memory)
+    spool_segment_size (int): Size of each spool segment file in bytes (default: 4 MiB)
+    spool_fsync (str): When the spool is flushed to disk: 'always', 'interval' or
+        'never' (default: 'interval')
+    spool_fsync_interval (float): Seconds between spool flushes in 'interval' mode
+        (default: 1.0)
+    coalesce_window (float): Collapse repeats of a record (same logger, level and message
+        template) within this many seconds into one summary; 0 disables (default: 0)
+    coalesce_max_fingerprints (int): Maximum number of distinct records tracked for
+        coalescing at once (default: 1000)
+    exception_window (float): Fingerprint exceptions by type and stack; send the first
+        occurrence in full and aggregate repeats into one one-line reference per this
+        many seconds. Records with exceptions then skip coalescing; 0 disables (default: 0)
+    exception_max_fingerprints (int): Maximum number of distinct exceptions remembered
+        (default: 1000)
+    digest_interval (float): Absorb records below digest_level into a digest sent once
+        per this many seconds: counts per level and logger, top message templates and
+        a few samples; 0 disables (default: 0)
+    digest_level (int): Records at or above this level are always sent as usual
+        (default: logging.ERROR)
+    digest_spike_thresholds (Dict[int, int]): Records of a level absorbed per interval,
+        e.g. {logging.WARNING: 100}; further records of that level are sent immediately
+        until the interval ends (default: None, no limit)
+    digest_max_templates (int): Number of message templates counted per interval
+        (default: 100)
+    live_status (bool): Show records below live_level in one status message per chat,
+        with counters per level and the last live_lines records, edited in place
+        instead of sending new messages (default: False)
+    live_level (int): Records at or above this level are sent as usual
+        (default: logging.ERROR)
+    live_lines (int): Number of recent records shown in the status (default: 10)
+    live_interval (float): Minimum time between edits of a status message (seconds)
+        (default: 5.0)
+    live_pin (bool): Pin each new status message; needs the right to pin messages in
+        groups and channels (default: True)
+    max_records_per_minute (int): Maximum number of records sent per minute for each
+        logger and message template; 0 for no limit (default: 0)
+    sample_rates (Dict[int, float]): Share of records kept per level, e.g.
+        {logging.DEBUG: 0.01, logging.INFO: 0.1} (default: None, keep everything)
+    stages (List[RecordStage]): Custom stages that may suppress records before they
+        are formatted, run after the built-in ones (default: None)
+    latency_budgets (Dict[int, float]): Longest time a record of each level may wait
+        before it is sent (seconds), e.g. DEFAULT_LATENCY_BUDGETS. Records are sent
+        earliest deadline first and held until their deadline is within one
+        batch_interval so they batch better (default: None, send right away)
+    adaptive_batching (bool): Tune the batch window from the observed arrival rate and
+        RetryAfter feedback instead of using batch_interval as is. batch_size is then
+        the most records packed into a request and batch_interval the longest a
+        record is held unless latency_budgets says otherwise (default: False)
+    escape_text (bool): Escape the values filled into fmt, e.g. the message, for
+        parse_mode, so that '<', '&' or '.' in a record cannot break it. fmt itself
+        is markup and is sent as written (default: True)
+    deferred_formatting (bool): Only take a cheap snapshot of each record (interpolated
+        message and raw exception) on the logging thread and render it on the sender,
+        after coalescing and sampling. Records are spooled once rendered (default: False)
+    base_url (str): Bot API endpoint the token is appended to, e.g. for a local Bot API
+        server or tgbot_logging.testing.FakeBotAPI (default: 'https://api.telegram.org/bot')
+    document_threshold (int): Send records longer than this visible length as one
+        sendDocument call: a short headline as the caption and the whole record as a
+        gzip-compressed .txt attachment, instead of several split messages; 0 disables
+        (default: 0)
 """
 
+import io
 import logging
 import asyncio
 import time
 import sys
 import signal
+import random
 import threading
-from typing import Optional, Union, List, Dict, Callable, Any, NoReturn
-from collections import defaultdict
+from typing import (
+    Optional,
+    Union,
+    List,
+    Dict,
+    Callable,
+    Any,
+    Awaitable,
+    NoReturn,
+    Tuple,
+)
+from collections import Counter, defaultdict, deque
 from telegram import Bot
-from telegram.error import TelegramError, RetryAfter, TimedOut, InvalidToken
-from queue import Queue
+from telegram.error import (
+    BadRequest,
+    Forbidden,
+    TelegramError,
+    RetryAfter,
+    TimedOut,
+    InvalidToken,
+)
 from threading import Thread, Lock, Event
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from contextlib import asynccontextmanager
+from functools import partial
+from .queues import (
+    LaneQueue,
+    QueuedMessage,
+    DROP_OLDEST,
+    OVERFLOW_POLICIES,
+)
+from .packer import MAX_MESSAGE_LENGTH, SEPARATOR, pack_messages, plain_text
+from .ratelimit import RateLimiter
+from .dispatcher import Dispatcher
+from .transport import (
+    DEFAULT_BASE_URL,
+    DEFAULT_KEEPALIVE_EXPIRY,
+    DEFAULT_POOL_SIZE,
+    PooledHTTPXRequest,
+)
+from .spool import Spool, DEFAULT_SEGMENT_SIZE, FSYNC_INTERVAL
+from .coalesce import Coalescer, CoalescedRecord
+from .stages import RecordStage, FingerprintRateLimit, LevelSampler
+from .batching import AdaptiveBatcher
+from .rendering import MessageRenderer, snapshot
+from .metrics import HandlerMetrics, prometheus_text
+from .escaping import escape
+from .documents import Document, build_document, is_oversized
+from .tracebacks import ExceptionRepeats, ExceptionTracker, exception_summary
+from .digest import Digest, format_digest
+from .live import LiveMessage, LiveStatus
 
 # Constants for shutdown
 SHUTDOWN_TIMEOUT = 30  # seconds
 FLUSH_TIMEOUT = 5  # seconds
 
+# Errors that sending the same request again cannot fix, e.g. markup Telegram
+# cannot parse, a message that is too long or a chat the bot was removed from
+PERMANENT_ERRORS = (BadRequest, Forbidden)
+
+# Labels listed in a suppressed records summary
+SUPPRESSED_SUMMARY_LINES = 5
+
+# Shortest time the sender sleeps between rounds (seconds)
+MIN_SENDER_WAIT = 0.005
+
+# Records awaiting deferred formatting before the logging thread renders them itself
+MAX_DEFERRED_RECORDS = 10000
+
+# Suggested latency budgets per level (seconds) for latency_budgets
+DEFAULT_LATENCY_BUDGETS = {
+    logging.CRITICAL: 0.5,
+    logging.ERROR: 2.0,
+    logging.WARNING: 10.0,
+    logging.INFO: 30.0,
+    logging.DEBUG: 60.0,
+}
+
 
 class TelegramHandler(logging.Handler):
     """A handler class which sends logging records to a Telegram chat using a bot."""
@@ -76,6 +234,53 @@ class TelegramHandler(logging.Handler):
         include_level_emoji: bool = True,
         datefmt: Optional[str] = None,
         test_mode: bool = False,
+        max_queue_size: int = 0,
+        max_queue_bytes: int = 0,
+        overflow_policy: str = DROP_OLDEST,
+        overflow_timeout: float = 1.0,
+        downsample_rate: int = 10,
+        max_message_length: int = MAX_MESSAGE_LENGTH,
+        max_concurrent_chats: int = 8,
+        rate_limit: bool = True,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_retry_delay: float = 30.0,
+        max_inline_retry_after: float = 1.0,
+        shared_dispatcher: bool = False,
+        connection_pool_size: int = DEFAULT_POOL_SIZE,
+        keepalive_expiry: Optional[float] = DEFAULT_KEEPALIVE_EXPIRY,
+        connect_timeout: Optional[float] = 5.0,
+        read_timeout: Optional[float] = 5.0,
+        write_timeout: Optional[float] = 5.0,
+        pool_timeout: Optional[float] = 1.0,
+        http2: bool = False,
+        prewarm: bool = True,
+        on_validation_error: Optional[Callable[[Exception], None]] = None,
+        spool_dir: Optional[str] = None,
+        spool_segment_size: int = DEFAULT_SEGMENT_SIZE,
+        spool_fsync: str = FSYNC_INTERVAL,
+        spool_fsync_interval: float = 1.0,
+        coalesce_window: float = 0.0,
+        coalesce_max_fingerprints: int = 1000,
+        exception_window: float = 0.0,
+        exception_max_fingerprints: int = 1000,
+        digest_interval: float = 0.0,
+        digest_level: int = logging.ERROR,
+        digest_spike_thresholds: Optional[Dict[int, int]] = None,
+        digest_max_templates: int = 100,
+        live_status: bool = False,
+        live_level: int = logging.ERROR,
+        live_lines: int = 10,
+        live_interval: float = 5.0,
+        live_pin: bool = True,
+        max_records_per_minute: int = 0,
+        sample_rates: Optional[Dict[int, float]] = None,
+        stages: Optional[List[RecordStage]] = None,
+        latency_budgets: Optional[Dict[int, float]] = None,
+        adaptive_batching: bool = False,
+        escape_text: bool = True,
+        deferred_formatting: bool = False,
+        base_url: str = DEFAULT_BASE_URL,
+        document_threshold: int = 0,
     ):
         """Initialize the handler."""
         super().__init__(level)
@@ -98,14 +303,134 @@ class TelegramHandler(logging.Handler):
         self.include_project_name = include_project_name
         self.include_level_emoji = include_level_emoji
         self.datefmt = datefmt
+        self.escape_text = escape_text
         self.test_mode = test_mode
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy {overflow_policy!r}, "
+                f"expected one of {', '.join(OVERFLOW_POLICIES)}"
+            )
+        self.max_queue_size = max(0, max_queue_size)
+        self.max_queue_bytes = max(0, max_queue_bytes)
+        self.overflow_policy = overflow_policy
+        self.overflow_timeout = max(0.0, overflow_timeout)
+        self.downsample_rate = max(1, downsample_rate)
+        self.max_message_length = min(MAX_MESSAGE_LENGTH, max(1, max_message_length))
+        self.max_concurrent_chats = max(1, max_concurrent_chats)
+        self.document_threshold = max(0, document_threshold)
+
+        # Test mode talks to mock bots, so it only limits with an explicit limiter
+        custom_rate_limiter = rate_limiter is not None
+        if rate_limiter is None and rate_limit and not test_mode:
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter if rate_limit else None
+        self.max_retry_delay = max(self.retry_delay, max_retry_delay)
+        self.max_inline_retry_after = max(0.0, max_inline_retry_after)
+
+        # Counters and histograms, see metrics_snapshot()
+        self.metrics = HandlerMetrics()
+
+        # Per-chat backoff state
+        self._not_before: Dict[str, float] = {}
+        self._inflight_chats = set()
+        self._chat_semaphore: Optional[asyncio.Semaphore] = None
+
+        # HTTP transport settings for the Bot client
+        self.request_kwargs = {
+            "connection_pool_size": connection_pool_size,
+            "keepalive_expiry": keepalive_expiry,
+            "connect_timeout": connect_timeout,
+            "read_timeout": read_timeout,
+            "write_timeout": write_timeout,
+            "pool_timeout": pool_timeout,
+            "http2": http2,
+        }
+        self.prewarm = prewarm
+        self.base_url = base_url
+
+        # The token is validated in the background, never on the caller's thread
+        self.on_validation_error = on_validation_error
+        self.token_valid: Optional[bool] = None
+
+        # Durable spool, opened before anything can be queued
+        self._spool: Optional[Spool] = None
+        if spool_dir is not None:
+            self._spool = Spool(
+                spool_dir,
+                segment_size=spool_segment_size,
+                fsync=spool_fsync,
+                fsync_interval=spool_fsync_interval,
+            )
+
+        # Collapse duplicate records before they are formatted
+        self._coalescer: Optional[Coalescer] = None
+        if coalesce_window > 0:
+            self._coalescer = Coalescer(coalesce_window, coalesce_max_fingerprints)
+
+        # Send each distinct exception once and count its repeats
+        self._exceptions: Optional[ExceptionTracker] = None
+        if exception_window > 0:
+            self._exceptions = ExceptionTracker(
+                exception_window, exception_max_fingerprints
+            )
+
+        # Summarize low-level records instead of sending them
+        self._digest: Optional[Digest] = None
+        self.digest_interval = max(0.0, digest_interval)
+        self.digest_level = digest_level
+        self._digest_due = 0.0
+        if self.digest_interval > 0:
+            self._digest = Digest(digest_spike_thresholds, digest_max_templates)
+            self._digest_due = time.time() + self.digest_interval
+
+        # One status message per chat, edited in place
+        self._live: Optional[LiveStatus] = None
+        self.live_level = live_level
+        self.live_interval = max(0.0, live_interval)
+        self.live_pin = live_pin
+        self._live_messages: Dict[str, LiveMessage] = defaultdict(LiveMessage)
+        if live_status:
+            self._live = LiveStatus(
+                live_lines, self.level_emojis, self.datefmt or "%H:%M:%S"
+            )
+
+        # Stages that may suppress records before they are formatted
+        self.stages: List[RecordStage] = []
+        if max_records_per_minute > 0:
+            self.stages.append(FingerprintRateLimit(max_records_per_minute, 60.0))
+        if sample_rates:
+            self.stages.append(LevelSampler(sample_rates))
+        self.stages.extend(stages or [])
+        self._suppressed: Dict[str, Counter] = defaultdict(Counter)
+
+        # The adaptive window may hold records for up to batch_interval
+        self._batcher: Optional[AdaptiveBatcher] = None
+        if adaptive_batching:
+            self._batcher = AdaptiveBatcher(self.batch_size, self.batch_interval)
+        default_budget = self.batch_interval if adaptive_batching else 0.0
+        self._next_wake = 0.0
+        # Depth of the fullest chat queue after the last sender round
+        self._backlog = 0
+
+        # One priority lane per distinct latency budget
+        self.latency_budgets = {
+            level: max(0.0, budget)
+            for level, budget in (
+                latency_budgets or {logging.NOTSET: default_budget}
+            ).items()
+        }
+        self._lane_budgets = sorted(set(self.latency_budgets.values()))
+        self._lane_by_level: Dict[int, int] = {}
 
         # Initialize bot
+        shared = shared_dispatcher and not test_mode
         try:
-            self._bot = Bot(token=token)
-            # Try to validate token by getting bot info
-            if not test_mode:
-                asyncio.run(self._bot.get_me())
+            if not shared:
+                self._bot = Bot(
+                    token=token,
+                    base_url=base_url,
+                    request=PooledHTTPXRequest(**self.request_kwargs),
+                )
         except InvalidToken as e:
             raise InvalidToken(f"Invalid token: {str(e)}")
         except Exception as e:
@@ -115,6 +440,7 @@ class TelegramHandler(logging.Handler):
         self._is_shutting_down = Event()
         self._shutdown_complete = Event()
         self._closed = False
+        self._background_tasks: set = set()
 
         # Set formatter with custom date format
         if fmt is not None:
@@ -127,125 +453,933 @@ class TelegramHandler(logging.Handler):
             logging.Formatter(datefmt=self.datefmt) if self.datefmt else None
         )
 
+        # Headers and message_format contexts are cached per level and logger
+        self.renderer = MessageRenderer(
+            parse_mode=self.parse_mode,
+            project_name=self.project_name,
+            project_emoji=self.project_emoji,
+            add_hashtags=self.add_hashtags,
+            level_emojis=self.level_emojis,
+            include_project_name=self.include_project_name,
+            include_level_emoji=self.include_level_emoji,
+            datefmt=self.datefmt,
+            message_format=self.message_format,
+            escape_text=self.escape_text,
+            exception_tags=self._exceptions is not None,
+        )
+
+        # Formatted records, or snapshots of records to be rendered, waiting
+        # for the sender to queue them for every chat
+        self.deferred_formatting = deferred_formatting
+        self._deferred: deque = deque()
+        self._max_deferred = self.max_queue_size or MAX_DEFERRED_RECORDS
+        # Bytes that entered and left it; the logging threads only write the
+        # first and the sender only the second, so the sender never needs
+        # the lock the logging threads take to add records
+        self._deferred_bytes_in = 0
+        self._deferred_bytes_out = 0
+        self._deferred_lock = Lock()
+        # Held by whoever is queueing the records for every chat
+        self._render_lock = Lock()
+
         # Initialize batching
-        self.message_queue = defaultdict(Queue)
+        self.message_queue: Dict[str, LaneQueue] = defaultdict(self._create_queue)
+        for chat_id in self.chat_ids:
+            self.message_queue[chat_id] = self._create_queue(chat_id)
+        if self._spool is not None:
+            self._replay_spool()
         self.batch_lock = Lock()
         self.batch_event = Event()
         self._last_batch_time = time.time()
         self._force_batch = False
 
-        # Rate limiting state
-        self.last_message_time = 0
-        self.min_message_interval = 1
-
         # Create event loop in a separate thread if not in test mode
-        if not test_mode:
-            self.executor = ThreadPoolExecutor(max_workers=1)
+        self._dispatcher: Optional[Dispatcher] = None
+        if shared:
+            # Reuse the process-wide loop, sender thread and Bot for this token
+            self._dispatcher = Dispatcher.acquire(
+                token, self, self.request_kwargs, prewarm=prewarm, base_url=base_url
+            )
+            self._bot = self._dispatcher.bot
+            self.loop = self._dispatcher.loop
+            self.batch_event = self._dispatcher.wakeup
+            self.loop_thread = self._dispatcher.loop_thread
+            self.batch_thread = self._dispatcher.sender_thread
+            if self.rate_limiter is not None and not custom_rate_limiter:
+                # Quotas are per bot, so handlers share the limiter too
+                self.rate_limiter = self._dispatcher.rate_limiter
+
+            # Setup signal handlers
+            self._setup_signal_handlers()
+        elif not test_mode:
+            # Daemon threads keep running while logging.shutdown() flushes
+            # the handler at interpreter exit
             self.loop = asyncio.new_event_loop()
-            if self.executor:
-                self.executor.submit(self._run_event_loop)
+            self.loop_thread = Thread(target=self._run_event_loop, daemon=True)
+            self.loop_thread.start()
 
             # Start batch sender thread
             self.batch_thread = Thread(target=self._batch_sender, daemon=True)
             if self.batch_thread:
                 self.batch_thread.start()
 
+            if prewarm:
+                asyncio.run_coroutine_threadsafe(self._prewarm(), self.loop)
+
             # Setup signal handlers
             self._setup_signal_handlers()
         else:
             # In test mode, use the current event loop
             self.loop = asyncio.get_event_loop()
-            self.executor = None
+            self.loop_thread = None
             self.batch_thread = None
 
-    async def emit(self, record: logging.LogRecord) -> None:
+    def _create_queue(self, chat_id: Optional[str] = None) -> LaneQueue:
+        """Create a chat's queue with one lane per latency budget and the handler's bounds."""
+        on_drop = None
+        if self._spool is not None and chat_id is not None:
+
+            def on_drop(item: str) -> None:
+                # Dropped messages must not come back on the next replay
+                self._ack_spool(chat_id, [item])
+
+        return LaneQueue(
+            self._lane_budgets,
+            max_size=self.max_queue_size,
+            max_bytes=self.max_queue_bytes,
+            overflow_policy=self.overflow_policy,
+            overflow_timeout=self.overflow_timeout,
+            downsample_rate=self.downsample_rate,
+            on_drop=on_drop,
+        )
+
+    def _replay_spool(self) -> None:
+        """Queue the messages a previous run left unacknowledged in the spool."""
+        for seq, chats, text in self._spool.pending():
+            for chat_id in chats:
+                if chat_id in self.message_queue:
+                    self.message_queue[chat_id].put_nowait(QueuedMessage(text, seq))
+                else:
+                    # The chat was removed from the configuration
+                    self._spool.ack([seq], chat_id)
+
+    def _ack_spool(self, chat_id: str, messages: List[str]) -> None:
+        """Acknowledge spooled messages that were sent to or dropped for a chat."""
+        seqs = [
+            msg.seq
+            for msg in messages
+            if isinstance(msg, QueuedMessage) and msg.seq is not None
+        ]
+        if not seqs:
+            return
+        try:
+            self._spool.ack(seqs, chat_id)
+        except Exception as e:
+            print(f"Error acknowledging spooled messages for {chat_id}: {str(e)}")
+
+    def _lane_for(self, levelno: int) -> int:
+        """Return the lane for a level: that of the closest configured level at or below it."""
+        lane = self._lane_by_level.get(levelno)
+        if lane is None:
+            levels = [level for level in self.latency_budgets if level <= levelno]
+            if levels:
+                budget = self.latency_budgets[max(levels)]
+            else:
+                budget = self.latency_budgets[min(self.latency_budgets)]
+            lane = self._lane_by_level[levelno] = self._lane_budgets.index(budget)
+        return lane
+
+    def _hold_window(self) -> Optional[float]:
+        """Return the adaptive batch window, or None to hold for the full budget."""
+        return self._batcher.window() if self._batcher is not None else None
+
+    def _send_lead(self) -> float:
+        """
+        Return how long before its deadline a record is sent.
+
+        With a fixed interval the sender only looks every ``batch_interval``,
+        so records are sent one round early. The adaptive sender wakes
+        exactly when the next record is due.
+        """
+        return 0.0 if self._batcher is not None else self.batch_interval
+
+    def _chat_due(self, chat_id: str, now: float) -> bool:
+        """
+        Check whether a chat should be flushed now.
+
+        A chat is flushed once a full batch is queued or its earliest
+        deadline falls before the next sender round.
+        """
+        queue = self.message_queue[chat_id]
+        if queue.empty():
+            return False
+        if self._force_batch or queue.qsize() >= self.batch_size:
+            return True
+        deadline = queue.next_deadline(self._hold_window())
+        return deadline is not None and deadline <= now + self._send_lead()
+
+    def _has_full_batch(self) -> bool:
+        """Check whether a full batch waits for a chat that is free to send."""
+        if len(self._deferred) >= self.batch_size:
+            return True
+        now = time.monotonic()
+        return any(
+            self.message_queue[chat_id].qsize() >= self.batch_size
+            and chat_id not in self._inflight_chats
+            and self._not_before.get(chat_id, 0) <= now
+            for chat_id in self.chat_ids
+        )
+
+    def _wait_timeout(self) -> float:
+        """Return how long the sender may sleep before its next round."""
+        if self._has_full_batch():
+            # Drain a backlog back to back; the rate limiter paces the sends
+            return MIN_SENDER_WAIT
+        if self._batcher is None:
+            return self.batch_interval
+        # Wake when the next chat that is free to send becomes due
+        window = self._batcher.window()
+        due_times = []
+        for chat_id in self.chat_ids:
+            if chat_id in self._inflight_chats:
+                continue
+            deadline = self.message_queue[chat_id].next_deadline(window)
+            if deadline is not None:
+                due_times.append(max(deadline, self._not_before.get(chat_id, 0)))
+        if not due_times:
+            return self.batch_interval
+        wait = min(due_times) - time.monotonic()
+        return min(self.batch_interval, max(MIN_SENDER_WAIT, wait))
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        """
+        Return the handler's metrics.
+
+        See :meth:`HandlerMetrics.snapshot`; every chat entry also holds its
+        current ``queue_depth``, ``queue_bytes`` and ``dropped`` records.
+        """
+        gauges = {}
+        for chat_id, queue in list(self.message_queue.items()):
+            gauges[chat_id] = {
+                "queue_depth": queue.qsize(),
+                "queue_bytes": queue.nbytes,
+                "dropped": queue.dropped,
+            }
+        return self.metrics.snapshot(gauges)
+
+    def prometheus_metrics(
+        self, labels: Optional[Dict[str, str]] = None, prefix: str = "tgbot_logging"
+    ) -> str:
+        """
+        Return the handler's metrics in the Prometheus text exposition format.
+
+        Args:
+            labels (Dict[str, str]): Labels added to every sample, e.g.
+                ``{"project": "billing"}`` to tell several handlers apart
+            prefix (str): Prefix of every metric name
+        """
+        return prometheus_text(self.metrics_snapshot(), prefix, labels)
+
+    @property
+    def dropped_records(self) -> int:
+        """Number of messages discarded by the overflow policy across all chats."""
+        return sum(queue.dropped for queue in list(self.message_queue.values()))
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Render a record into message text.
+
+        The header (level emoji, project emoji and name) and hashtags are
+        cached per level and logger; see :class:`MessageRenderer`.
+        """
+        return self.renderer.render(record, self.formatter or self.renderer.formatter)
+
+    def emit(self, record: logging.LogRecord) -> None:
         """
         Emit a record.
 
-        Format the record and send it to the specified chat.
+        Format the record and enqueue it for every chat. This is called
+        synchronously by ``logging.Handler.handle()`` and never waits on
+        Telegram: delivery happens on the background sender. With
+        ``deferred_formatting`` only a snapshot of the record is taken here
+        and the sender formats it.
         """
         if self._closed:
             return
 
+        self.metrics.record_emitted()
         try:
-            msg = self.format(record)
-            for chat_id in self.chat_ids:
-                try:
-                    self.message_queue[chat_id].put_nowait(msg)
-                except Exception as e:
-                    print(f"Error adding message to queue for {chat_id}: {str(e)}")
+            if self._live is not None and record.levelno < self.live_level:
+                self._live.add(record)
+                return
+            if (
+                self._digest is not None
+                and record.levelno < self.digest_level
+                and not self._digest.add(record)
+            ):
+                return
+            # Repeats are only counted until their summary is due
+            if self._exceptions is not None and not self._exceptions.admit(record):
+                return
+            # Exceptions seen by the tracker are aggregated by fingerprint instead
+            tracked = self._exceptions is not None and hasattr(
+                record, "exc_fingerprint"
+            )
+            if (
+                self._coalescer is not None
+                and not tracked
+                and not self._coalescer.admit(record)
+            ):
+                return
+            for stage in self.stages:
+                if not stage(record):
+                    return
 
-            # In test mode, process messages based on batch size or force flag
-            if self.test_mode:
-                if self.batch_size == 1:
-                    # For single messages, send immediately
-                    await self._process_queue()
-                else:
-                    # For batched messages, check if we need to send
-                    should_process = self._force_batch
-                    if not should_process:
-                        for chat_id in self.chat_ids:
-                            if self.message_queue[chat_id].qsize() >= self.batch_size:
-                                should_process = True
-                                break
-                    if should_process:
-                        await self._process_queue()
+            lane = self._lane_for(record.levelno)
+            wake = False
+            if self.deferred_formatting:
+                item = snapshot(record)
             else:
-                # Signal the batch sender thread
+                item = self._spool_message(self.format(record), record.created)
+            if self.test_mode and not self.deferred_formatting:
+                # There is no sender to queue it in test mode
+                self._fan_out(item, lane)
+            else:
+                # The sender queues it for every chat, so emit does the same
+                # work however many chats there are
+                wake = not self._deferred
+                if not self._defer(item, lane):
+                    # The sender is falling behind; queue this record here so
+                    # that the queues' overflow policy applies to it
+                    self._queue_record(item, lane)
+                    wake = True
+
+            now = time.monotonic()
+            wait = self._lane_budgets[lane]
+            if self._batcher is not None:
+                self._batcher.observe_arrival(now)
+                wait = min(wait, self._batcher.window(now))
+            if not self.test_mode and (
+                wake
+                or now + wait - self._send_lead() <= self._next_wake
+                or len(self._deferred) + self._backlog >= self.batch_size
+            ):
+                # Wake the sender for records due before its next round and
+                # for full batches; the rest is picked up by a later round
                 self.batch_event.set()
 
         except Exception as e:
             print(f"Error in emit: {str(e)}")
 
-    async def _process_queue(self) -> None:
-        """Process messages in the queue."""
+    def _enqueue(
+        self,
+        msg: str,
+        lane: int = 0,
+        created: Optional[float] = None,
+        block: bool = True,
+    ) -> None:
+        """Spool a formatted message if configured and queue it for every chat."""
+        self._fan_out(self._spool_message(msg, created), lane, block)
+
+    def _spool_message(
+        self, msg: str, created: Optional[float] = None
+    ) -> QueuedMessage:
+        """Spool a formatted message if configured and wrap it for the queues."""
+        seq = None
+        if self._spool is not None:
+            try:
+                seq = self._spool.append(msg, self.chat_ids)
+            except Exception as e:
+                print(f"Error writing message to spool: {str(e)}")
+        return QueuedMessage(msg, seq, created)
+
+    def _fan_out(self, msg: QueuedMessage, lane: int = 0, block: bool = True) -> None:
+        """
+        Queue a message for every chat.
+
+        Only the logging thread may block on a full queue under the ``block``
+        policy; calls made on an event loop pass ``block=False``, as waiting
+        there would stall the sender that makes room.
+        """
+        enqueued = []
+        for chat_id in self.chat_ids:
+            try:
+                self.message_queue[chat_id].put(msg, block, lane)
+                enqueued.append(chat_id)
+            except Exception as e:
+                print(f"Error adding message to queue for {chat_id}: {str(e)}")
+        self.metrics.add("enqueued", enqueued)
+
+    def _defer(self, item: Any, lane: int) -> bool:
+        """
+        Pass a record on to the sender unless too many are waiting already.
+
+        The waiting records are bounded like a chat's queue, by
+        ``max_queue_size`` (``MAX_DEFERRED_RECORDS`` without a limit) and by
+        ``max_queue_bytes``; a snapshot counts the length of its message.
+
+        Returns:
+            bool: True if the record was passed on, False if it did not fit
+        """
+        if isinstance(item, QueuedMessage):
+            size = item.nbytes
+        else:
+            size = len(item.msg)
+        with self._deferred_lock:
+            waiting = len(self._deferred)
+            if waiting >= self._max_deferred:
+                return False
+            nbytes = self._deferred_bytes_in - self._deferred_bytes_out
+            if (
+                waiting
+                and self.max_queue_bytes
+                and nbytes + size > self.max_queue_bytes
+            ):
+                return False
+            self._deferred.append((item, lane, size))
+            self._deferred_bytes_in += size
+        return True
+
+    def _queue_record(self, item: Any, lane: int, block: bool = True) -> None:
+        """Queue a formatted record for every chat, rendering a snapshot first."""
+        if isinstance(item, QueuedMessage):
+            self._fan_out(item, lane, block)
+        else:
+            self._enqueue(self.format(item), lane, item.created, block)
+
+    def _render_deferred(self) -> None:
+        """
+        Queue the records passed on by emit for every chat, in order.
+
+        Runs on the sender, so it never waits for room in a queue, nor for
+        another call that is already queueing the records.
+        """
+        if not self._render_lock.acquire(blocking=False):
+            return
         try:
-            for chat_id in self.chat_ids:
-                messages = []
+            while self._deferred:
+                item, lane, size = self._deferred.popleft()
+                self._deferred_bytes_out += size
                 try:
-                    # Get all available messages from the queue
-                    while (
-                        not self.message_queue[chat_id].empty()
-                        and len(messages) < self.batch_size
-                    ):
-                        messages.append(self.message_queue[chat_id].get_nowait())
-                        self.message_queue[chat_id].task_done()
-
-                    if messages:
-                        # Join messages with double newline
-                        text = "\n\n".join(messages)
-                        try:
-                            await self._send_message(chat_id, text)
-                        except Exception as e:
-                            print(f"Error sending message to {chat_id}: {str(e)}")
-                            # Put messages back in queue for retry
-                            for msg in messages:
-                                self.message_queue[chat_id].put_nowait(msg)
-                            # Try next chat ID
-                            continue
-
+                    self._queue_record(item, lane, block=False)
                 except Exception as e:
-                    print(f"Error processing queue for {chat_id}: {str(e)}")
+                    print(f"Error rendering deferred record: {str(e)}")
+        finally:
+            self._render_lock.release()
+
+    def _format_coalesced(self, coalesced: CoalescedRecord) -> str:
+        """Format the summary of a record's repeats within a coalescing window."""
+        datefmt = self.datefmt or "%H:%M:%S"
+        first_seen = time.strftime(datefmt, time.localtime(coalesced.first_seen))
+        last_seen = time.strftime(datefmt, time.localtime(coalesced.last_seen))
+        summary = (
+            f"×{coalesced.count:,} in last {self._coalescer.window:g}s "
+            f"(first seen {first_seen}, last seen {last_seen})"
+        )
+        return f"{self.format(coalesced.record)}\n{escape(summary, self.parse_mode)}"
+
+    def _format_exception_repeats(self, repeats: ExceptionRepeats) -> str:
+        """Format a one-line reference to an exception sent in full before."""
+        datefmt = self.datefmt or "%H:%M:%S"
+        first_seen = time.strftime(datefmt, time.localtime(repeats.first_seen))
+        last_seen = time.strftime(datefmt, time.localtime(repeats.last_seen))
+        line = (
+            f"↻ {exception_summary(repeats.record)} "
+            f"×{repeats.count:,} in last {self._exceptions.window:g}s, "
+            f"{repeats.total:,} since {first_seen} (last seen {last_seen})"
+        )
+        return self.renderer.render_line(repeats.record, line)
+
+    def _flush_exceptions(self, close_all: bool = False) -> None:
+        """Queue references for exception windows that have closed."""
+        if self._exceptions is None:
+            return
+        if close_all:
+            closed = self._exceptions.collect_all()
+        else:
+            closed = self._exceptions.collect()
+        for repeats in closed:
+            try:
+                self._enqueue(
+                    self._format_exception_repeats(repeats),
+                    self._lane_for(repeats.record.levelno),
+                    repeats.record.created,
+                    block=False,
+                )
+            except Exception as e:
+                print(f"Error queueing exception repeats: {str(e)}")
+
+    def _flush_digest(self, close_all: bool = False) -> None:
+        """Queue the digest once its interval has ended."""
+        if self._digest is None:
+            return
+        now = time.time()
+        if not close_all and now < self._digest_due:
+            return
+        self._digest_due = now + self.digest_interval
+        try:
+            summary = self._digest.collect(now)
+            if summary is None:
+                return
+            # Shown with the header of the highest level it summarizes
+            record = logging.makeLogRecord(
+                {
+                    "name": "digest",
+                    "levelno": max(summary.counts),
+                    "levelname": logging.getLevelName(max(summary.counts)),
+                    "created": summary.end,
+                }
+            )
+            text = format_digest(summary, self.datefmt or "%H:%M:%S")
+            self._enqueue(
+                self.renderer.render_line(record, text),
+                self._lane_for(record.levelno),
+                summary.end,
+                block=False,
+            )
+        except Exception as e:
+            print(f"Error queueing digest: {str(e)}")
+
+    def _collect_suppressed(self) -> None:
+        """Move the stages' suppressed counts to every chat's pending summary."""
+        counts: Counter = Counter()
+        for stage in self.stages:
+            try:
+                counts.update(stage.drain_suppressed())
+            except Exception as e:
+                print(f"Error collecting suppressed records: {str(e)}")
+        if counts:
+            for chat_id in self.chat_ids:
+                self._suppressed[chat_id].update(counts)
+
+    def _format_suppressed(self, counts: Counter) -> str:
+        """Format a summary of suppressed records, largest counts first."""
+        lines = [f"Suppressed {sum(counts.values()):,} records:"]
+        top = counts.most_common(SUPPRESSED_SUMMARY_LINES)
+        lines.extend(f"{count:,} × {label}" for label, count in top)
+        if len(counts) > len(top):
+            rest = sum(counts.values()) - sum(count for _, count in top)
+            lines.append(f"{rest:,} × other")
+        return escape("\n".join(lines), self.parse_mode)
+
+    def _flush_coalesced(self, close_all: bool = False) -> None:
+        """Queue the summaries of coalescing windows that have closed."""
+        if self._coalescer is None:
+            return
+        if close_all:
+            summaries = self._coalescer.collect_all()
+        else:
+            summaries = self._coalescer.collect()
+        for coalesced in summaries:
+            try:
+                self._enqueue(
+                    self._format_coalesced(coalesced),
+                    self._lane_for(coalesced.record.levelno),
+                    coalesced.record.created,
+                    block=False,
+                )
+            except Exception as e:
+                print(f"Error queueing coalesced records: {str(e)}")
+
+    async def aemit(self, record: logging.LogRecord) -> None:
+        """
+        Emit a record from async code.
+
+        Enqueues the record like :meth:`emit`. In test mode, where there is no
+        background sender, the queues are processed inline once a batch is due.
+        """
+        if self._closed:
+            return
+
+        self.emit(record)
+
+        if not self.test_mode:
+            return
+
+        try:
+            self._render_deferred()
+            if self.batch_size == 1:
+                # For single messages, send immediately
+                await self._process_queue()
+            else:
+                # For batched messages, check if we need to send
+                should_process = self._force_batch
+                if not should_process:
+                    for chat_id in self.chat_ids:
+                        if self.message_queue[chat_id].qsize() >= self.batch_size:
+                            should_process = True
+                            break
+                if should_process:
+                    await self._process_queue()
+        except Exception as e:
+            print(f"Error in aemit: {str(e)}")
+
+    async def _process_queue(self) -> None:
+        """Process messages in the queue, dispatching chats concurrently."""
+        try:
+            self._render_deferred()
+            self._flush_coalesced(close_all=self._is_shutting_down.is_set())
+            self._flush_exceptions(close_all=self._is_shutting_down.is_set())
+            self._flush_digest(close_all=self._is_shutting_down.is_set())
+            self._collect_suppressed()
+
+            if self._chat_semaphore is None:
+                self._chat_semaphore = asyncio.Semaphore(self.max_concurrent_chats)
+            semaphore = self._chat_semaphore
+            # Chats at the same position share one plan for their batch
+            plans: Dict[Tuple[int, ...], List[Tuple[List[str], Any]]] = {}
+
+            async def process_limited(chat_id: str) -> None:
+                async with semaphore:
+                    await self._process_chat(chat_id, plans)
+
+            # Skip chats that are still sending, waiting out a RetryAfter or
+            # holding records whose deadline is not near yet
+            now = time.monotonic()
+            ready = [
+                chat_id
+                for chat_id in self.chat_ids
+                if chat_id not in self._inflight_chats
+                and self._not_before.get(chat_id, 0) <= now
+                and self._chat_due(chat_id, now)
+            ]
+            self._inflight_chats.update(ready)
+            await asyncio.gather(*(process_limited(chat_id) for chat_id in ready))
+            # Lets emit tell when a full batch is waiting without a scan
+            self._backlog = max(
+                (self.message_queue[chat_id].qsize() for chat_id in self.chat_ids),
+                default=0,
+            )
+            if not self.test_mode and self._has_full_batch():
+                # The sender went back to sleep while this round was sending
+                self.batch_event.set()
+            await self._update_live(force=self._is_shutting_down.is_set())
+
+            if self._spool is not None:
+                # Flush on schedule even when no new messages arrive
+                self._spool.sync()
 
         except Exception as e:
             print(f"Error in _process_queue: {str(e)}")
 
+    async def _process_chat(
+        self,
+        chat_id: str,
+        plans: Optional[Dict[Tuple[int, ...], List[Tuple[List[str], Any]]]] = None,
+    ) -> None:
+        """
+        Send the next batch of queued messages to a single chat.
+
+        Every chat's queue holds the same message objects, so chats that are
+        at the same position take identical batches. Their plan, with the
+        packed and joined texts and compressed documents, is built by the
+        first of them and looked up in ``plans`` by the others.
+        """
+        messages = []
+        try:
+            # Get all available messages from the queue
+            while (
+                not self.message_queue[chat_id].empty()
+                and len(messages) < self.batch_size
+            ):
+                messages.append(self.message_queue[chat_id].get_nowait())
+
+            if messages:
+                suppressed = self._suppressed.pop(chat_id, None)
+                if suppressed:
+                    # Report what the stages held back along with the batch
+                    messages.append(self._format_suppressed(suppressed))
+
+                # The queued messages stay referenced for the whole round, so
+                # their IDs identify the batch
+                key = tuple(map(id, messages))
+                groups = plans.get(key) if plans is not None else None
+                if groups is None:
+                    groups = self._plan_sends(messages)
+                    if plans is not None:
+                        plans[key] = groups
+                for index, (group, payload) in enumerate(groups):
+                    try:
+                        if isinstance(payload, Document):
+                            await self._send_document(chat_id, payload)
+                        else:
+                            await self._send_message(chat_id, payload)
+                        if self._spool is not None:
+                            self._ack_spool(chat_id, group)
+                        self._record_sent(chat_id, group)
+                    except PERMANENT_ERRORS as e:
+                        # Requeued, the group would fail the same way and
+                        # hold up every message queued after it
+                        print(f"Error sending message to {chat_id}, dropped: {str(e)}")
+                        self.metrics.add(
+                            "rejected", [chat_id], self._count_records(group)
+                        )
+                        if self._spool is not None:
+                            self._ack_spool(chat_id, group)
+                    except Exception as e:
+                        print(f"Error sending message to {chat_id}: {str(e)}")
+                        self.metrics.add("failed_sends", [chat_id])
+                        # Put unsent messages back in queue for retry
+                        self.message_queue[chat_id].requeue(
+                            [piece for rest, _ in groups[index:] for piece in rest]
+                        )
+                        break
+
+        except Exception as e:
+            print(f"Error processing queue for {chat_id}: {str(e)}")
+        finally:
+            self._inflight_chats.discard(chat_id)
+
+    def _plan_sends(self, messages: List[str]) -> List[Tuple[List[str], Any]]:
+        """
+        Split a batch into API calls, in order.
+
+        Messages are packed into as few requests as the length limit allows;
+        each oversized record becomes a document upload of its own.
+
+        Returns:
+            List[Tuple[List[str], Any]]: Message groups with what to send for
+            each: the joined message text, or a ``Document``
+        """
+        groups: List[Tuple[List[str], Any]] = []
+        run: List[str] = []
+        for message in messages:
+            if is_oversized(message, self.document_threshold, self.parse_mode):
+                groups.extend(self._pack(run))
+                created = (
+                    message.created if isinstance(message, QueuedMessage) else None
+                )
+                document = build_document(message, self.parse_mode, created)
+                groups.append(([message], document))
+                run = []
+            else:
+                run.append(message)
+        groups.extend(self._pack(run))
+        return groups
+
+    def _pack(self, messages: List[str]) -> List[Tuple[List[str], str]]:
+        """Pack messages into as few requests as the limit allows."""
+        if not messages:
+            return []
+        groups = pack_messages(
+            messages, self.max_message_length, self.parse_mode, SEPARATOR
+        )
+        return [(group, SEPARATOR.join(group)) for group in groups]
+
+    async def _update_live(self, force: bool = False) -> None:
+        """Show the latest live status in every chat that is due for an edit."""
+        if self._live is None:
+            return
+        now = time.monotonic()
+        due = [
+            chat_id
+            for chat_id in self.chat_ids
+            if self._live_messages[chat_id].version != self._live.version
+            and (force or self._live_messages[chat_id].next_edit <= now)
+            and self._not_before.get(chat_id, 0) <= now
+        ]
+        if not due:
+            return
+        # Shown with the project header and hashtags of an INFO record
+        record = logging.makeLogRecord(
+            {"name": "live", "levelno": logging.INFO, "levelname": "INFO"}
+        )
+        text, generation, version = self._live.render(
+            partial(self.renderer.render_line, record),
+            self.max_message_length,
+            self.parse_mode,
+        )
+        await asyncio.gather(
+            *(
+                self._update_live_chat(chat_id, text, generation, version)
+                for chat_id in due
+            )
+        )
+
+    async def _update_live_chat(
+        self, chat_id: str, text: str, generation: int, version: int
+    ) -> None:
+        """Edit a chat's status message, or start a new one if it was outgrown."""
+        state = self._live_messages[chat_id]
+        state.next_edit = time.monotonic() + self.live_interval
+        try:
+            if state.message_id is None or state.generation != generation:
+                message = await self._call_api(
+                    chat_id,
+                    lambda: self._bot.send_message(
+                        chat_id=chat_id,
+                        text=text,
+                        parse_mode=self.parse_mode,
+                        disable_notification=True,
+                    ),
+                )
+                state.message_id = message.message_id
+                state.generation = generation
+                if self.live_pin:
+                    try:
+                        await self._bot.pin_chat_message(
+                            chat_id=chat_id,
+                            message_id=state.message_id,
+                            disable_notification=True,
+                        )
+                    except Exception as e:
+                        print(f"Error pinning live status in {chat_id}: {str(e)}")
+            else:
+                message_id = state.message_id
+                await self._call_api(
+                    chat_id,
+                    lambda: self._bot.edit_message_text(
+                        text=text,
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        parse_mode=self.parse_mode,
+                    ),
+                )
+            state.version = version
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                state.version = version
+            else:
+                # E.g. the message was deleted; start a new one next time
+                print(f"Error updating live status in {chat_id}: {str(e)}")
+                state.message_id = None
+        except Exception as e:
+            print(f"Error updating live status in {chat_id}: {str(e)}")
+
+    @staticmethod
+    def _count_records(group: List[str]) -> int:
+        """Count the records in a group, ignoring summaries and partial pieces."""
+        return sum(isinstance(piece, QueuedMessage) for piece in group)
+
+    def _record_sent(self, chat_id: str, group: List[str]) -> None:
+        """Count the records in a delivered group and their delivery latency."""
+        # Summaries and all but the last piece of a split record are plain strings
+        records = [piece for piece in group if isinstance(piece, QueuedMessage)]
+        if not records:
+            return
+        now = time.time()
+        self.metrics.record_sent(
+            chat_id,
+            len(records),
+            [now - piece.created for piece in records if piece.created is not None],
+        )
+
+    def _backoff_delay(self, retries: int) -> float:
+        """Return an exponential backoff delay with jitter for a retry."""
+        delay = min(self.max_retry_delay, self.retry_delay * (2**retries))
+        return random.uniform(delay / 2, delay)
+
+    def _is_markup_error(self, error: BadRequest) -> bool:
+        """Check whether Telegram rejected a message because of its markup."""
+        return bool(self.parse_mode) and "can't parse entities" in str(error).lower()
+
     async def _send_message(self, chat_id: str, text: str) -> None:
-        """Send a message to a chat."""
+        """
+        Send a message to a chat, retrying as described in :meth:`_call_api`.
+
+        If Telegram cannot parse the markup, e.g. a '<' in an unescaped
+        record, the message is sent once more as plain text.
+        """
+        try:
+            await self._call_api(
+                chat_id,
+                lambda: self._bot.send_message(
+                    chat_id=chat_id, text=text, parse_mode=self.parse_mode
+                ),
+            )
+        except BadRequest as e:
+            if not self._is_markup_error(e):
+                raise
+            print(f"Error sending message to {chat_id}, sent as plain text: {str(e)}")
+            plain = plain_text(text, self.parse_mode)
+            await self._call_api(
+                chat_id,
+                lambda: self._bot.send_message(
+                    chat_id=chat_id, text=plain, parse_mode=None
+                ),
+            )
+
+    async def _send_document(self, chat_id: str, document: Document) -> None:
+        """
+        Send an oversized record to a chat as a compressed text file.
+
+        The caption is the start of the record; the attachment holds all of
+        it as plain text. Retries as described in :meth:`_call_api`, and falls
+        back to a plain text caption like :meth:`_send_message`.
+        """
+
+        def upload(caption: str, parse_mode: Optional[str]) -> Awaitable[Any]:
+            # Each upload reads its own view of the shared compressed bytes
+            return self._bot.send_document(
+                chat_id=chat_id,
+                document=io.BytesIO(document.content),
+                filename=document.filename,
+                caption=caption,
+                parse_mode=parse_mode,
+            )
+
+        try:
+            await self._call_api(
+                chat_id, lambda: upload(document.caption, self.parse_mode)
+            )
+        except BadRequest as e:
+            if not self._is_markup_error(e):
+                raise
+            print(f"Error sending document to {chat_id}, sent as plain text: {str(e)}")
+            plain = plain_text(document.caption, self.parse_mode)
+            await self._call_api(chat_id, lambda: upload(plain, None))
+
+    async def _call_api(self, chat_id: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Make a Bot API call for a chat and return its result.
+
+        Short ``RetryAfter`` penalties and transient errors are retried inline,
+        the latter with exponential backoff. A penalty longer than
+        ``max_inline_retry_after`` parks the chat until it expires and is
+        raised, so the caller can requeue the message while other chats
+        keep sending. ``PERMANENT_ERRORS`` are raised without retrying.
+        """
         retries = 0
         last_error = None
         while retries <= self.max_retries:
+            if retries:
+                self.metrics.add("retries", [chat_id])
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(chat_id)
             try:
-                await self._bot.send_message(
-                    chat_id=chat_id, text=text, parse_mode=self.parse_mode
-                )
-                return  # Success
+                started = time.monotonic()
+                try:
+                    result = await call()
+                finally:
+                    self.metrics.record_api_call(time.monotonic() - started)
+                if self._batcher is not None:
+                    self._batcher.observe_success()
+                return result  # Success
+            except InvalidToken as e:
+                # Retrying cannot help with a rejected token
+                self._report_validation_error(e)
+                raise
+            except PERMANENT_ERRORS:
+                raise
             except RetryAfter as e:
-                await asyncio.sleep(e.retry_after)
+                if self._batcher is not None:
+                    # Fewer, fuller requests while Telegram is pushing back
+                    self._batcher.observe_throttle()
+                retry_after = float(e.retry_after)
+                self._not_before[chat_id] = time.monotonic() + retry_after
+                if self.rate_limiter:
+                    # The next reservation for this chat waits out the penalty
+                    self.rate_limiter.chat_bucket(chat_id).penalize(
+                        self._not_before[chat_id]
+                    )
+                if retry_after > self.max_inline_retry_after:
+                    raise
+                if not self.rate_limiter:
+                    await asyncio.sleep(retry_after)
                 retries += 1
                 last_error = e
             except Exception as e:
-                await asyncio.sleep(self.retry_delay)
+                await asyncio.sleep(self._backoff_delay(retries))
                 retries += 1
                 last_error = e
 
@@ -256,15 +1390,37 @@ class TelegramHandler(logging.Handler):
     def _batch_sender(self) -> None:
         """Background thread for sending batched messages."""
         while not self._is_shutting_down.is_set():
-            # Wait for new messages or batch interval
-            self.batch_event.wait(timeout=self.batch_interval)
+            # Wait for new messages or until the next chat is due
+            timeout = self._wait_timeout()
+            self._next_wake = time.monotonic() + timeout
+            self.batch_event.wait(timeout=timeout)
             self.batch_event.clear()
 
             if not self._is_shutting_down.is_set():
-                # Process queues
-                asyncio.run_coroutine_threadsafe(
-                    self._process_queue(), self.loop
-                ).result()
+                # Hand the queues to the loop without waiting, so a chat that
+                # is retrying does not hold up the next round for the others
+                asyncio.run_coroutine_threadsafe(self._process_queue(), self.loop)
+
+    async def _prewarm(self) -> None:
+        """Validate the token and open a pooled connection ahead of the first message."""
+        try:
+            await self._bot.initialize()
+            self.token_valid = True
+        except InvalidToken as e:
+            self._report_validation_error(e)
+        except Exception as e:
+            print(f"Error warming up connection: {str(e)}")
+
+    def _report_validation_error(self, error: Exception) -> None:
+        """Record that the token was rejected and notify the callback."""
+        self.token_valid = False
+        if self.on_validation_error is None:
+            print(f"Invalid token: {str(error)}")
+            return
+        try:
+            self.on_validation_error(error)
+        except Exception as e:
+            print(f"Error in validation error callback: {str(e)}")
 
     def _run_event_loop(self) -> None:
         """Run the event loop in a separate thread."""
@@ -286,11 +1442,128 @@ class TelegramHandler(logging.Handler):
         print(f"Received signal {signum}, initiating graceful shutdown...")
         # Schedule shutdown in the event loop
         if self.test_mode:
-            asyncio.create_task(self.close())
+            asyncio.create_task(self.aclose())
         else:
-            self.loop.call_soon_threadsafe(lambda: asyncio.create_task(self.close()))
+            self.loop.call_soon_threadsafe(lambda: asyncio.create_task(self.aclose()))
+
+    async def _run_on_loop(self, coro: Any) -> Any:
+        """Run a coroutine on the sender loop and wait for it from any loop."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop or not self.loop.is_running():
+            return await coro
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(coro, self.loop)
+        )
+
+    async def _drain(self) -> None:
+        """
+        Send the queued messages before closing.
+
+        Rounds continue while a chat makes progress, still has a send in
+        flight or waits out a ``RetryAfter`` penalty, for up to
+        ``SHUTDOWN_TIMEOUT`` seconds. A chat whose round failed outright or
+        whose penalty ends after the timeout is not tried again.
+        """
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        self._render_deferred()
+        depths = {
+            chat_id: self.message_queue[chat_id].qsize() for chat_id in self.chat_ids
+        }
+        while True:
+            await self._process_queue()
+            now = time.monotonic()
+            waiting = []
+            for chat_id in self.chat_ids:
+                depth = self.message_queue[chat_id].qsize()
+                # Penalties that outlast the timeout are not waited for
+                if depth and (
+                    depth < depths[chat_id]
+                    or chat_id in self._inflight_chats
+                    or now < self._not_before.get(chat_id, 0) < deadline
+                ):
+                    waiting.append(chat_id)
+                depths[chat_id] = depth
+            if not waiting or now >= deadline:
+                return
+            wake = min(self._not_before.get(chat_id, 0) for chat_id in waiting)
+            await asyncio.sleep(min(deadline, max(wake, now + MIN_SENDER_WAIT)) - now)
+
+    def _unsent_count(self) -> int:
+        """Count the messages still to be sent, one per record and chat."""
+        pending = len(self._deferred) * len(self.chat_ids)
+        return pending + sum(q.qsize() for q in list(self.message_queue.values()))
+
+    def _run_sync(self, coro: Any, timeout: float, action: str) -> None:
+        """
+        Run a coroutine on the handler's loop from synchronous code.
+
+        Waits up to ``timeout`` seconds for it. Called on the loop itself, the
+        coroutine is only scheduled, as waiting would stall the loop it needs.
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        try:
+            if running is self.loop:
+                task = self.loop.create_task(coro)
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+            elif self.loop.is_running():
+                asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+            elif running is None and not self.loop.is_closed():
+                self.loop.run_until_complete(asyncio.wait_for(coro, timeout))
+            else:
+                coro.close()
+                queued = self._unsent_count()
+                if queued:
+                    print(
+                        f"Error {action}: the handler's event loop is not available, "
+                        f"{queued} queued messages were not sent"
+                    )
+        except (asyncio.TimeoutError, FutureTimeoutError):
+            print(f"Error {action}: timed out after {timeout}s")
+        except Exception as e:
+            print(f"Error {action}: {str(e)}")
+
+    def flush(self) -> None:
+        """
+        Send every queued message now.
 
-    async def close(self) -> None:
+        Called by ``logging.shutdown()`` before :meth:`close`; waits up to
+        ``FLUSH_TIMEOUT`` seconds.
+        """
+        if self._closed or self._is_shutting_down.is_set():
+            return
+        self._run_sync(self._flush(), FLUSH_TIMEOUT, "flushing queues")
+
+    async def _flush(self) -> None:
+        """Send one round to every chat with queued messages, due or not."""
+        self._force_batch = True
+        try:
+            await self._process_queue()
+        finally:
+            self._force_batch = self._is_shutting_down.is_set()
+
+    def close(self) -> None:
+        """
+        Close the handler from synchronous code.
+
+        Runs :meth:`aclose` on the handler's loop and waits up to
+        ``SHUTDOWN_TIMEOUT`` seconds for it, so ``logging.shutdown()`` at
+        interpreter exit sends the queued messages. Coroutines should
+        ``await handler.aclose()`` instead.
+        """
+        try:
+            if not self._closed:
+                self._run_sync(self.aclose(), SHUTDOWN_TIMEOUT, "closing handler")
+        finally:
+            super().close()
+
+    async def aclose(self) -> None:
         """
         Close the handler.
 
@@ -304,10 +1577,35 @@ class TelegramHandler(logging.Handler):
         try:
             # Force process remaining messages
             self._force_batch = True
-            await self._process_queue()
+            if self._dispatcher is not None:
+                # The shared Bot belongs to the dispatcher's loop
+                await self._run_on_loop(self._drain())
+            else:
+                await self._drain()
         except Exception as e:
             print(f"Error flushing queues: {str(e)}")
 
+        unsent = self._unsent_count()
+        if unsent:
+            kept = " and stay in the spool" if self._spool is not None else ""
+            print(
+                f"Error closing handler: {unsent} queued messages were not sent{kept}"
+            )
+
+        if self._spool is not None:
+            # Unsent messages stay in the spool for the next start
+            try:
+                self._spool.close()
+            except Exception as e:
+                print(f"Error closing spool: {str(e)}")
+
+        if self._dispatcher is not None:
+            # The dispatcher owns the Bot and the loop
+            self._dispatcher.release(self)
+            self._closed = True
+            self._shutdown_complete.set()
+            return
+
         try:
             # Close bot
             if hasattr(self._bot, "close"):
@@ -315,13 +1613,9 @@ class TelegramHandler(logging.Handler):
         except Exception as e:
             print(f"Error closing bot: {str(e)}")
 
-        # Stop event loop and executor
-        if not self.test_mode and self.loop and self.executor:
+        # Stop the event loop; its thread ends once the loop returns
+        if not self.test_mode and self.loop and self.loop_thread:
             self.loop.call_soon_threadsafe(self.loop.stop)
-            # Schedule executor shutdown in a separate thread to avoid deadlock
-            Thread(
-                target=self.executor.shutdown, kwargs={"wait": True}, daemon=True
-            ).start()
 
         self._closed = True
         self._shutdown_complete.set()
@@ -332,4 +1626,4 @@ class TelegramHandler(logging.Handler):
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Async context manager exit."""
-        await self.close()
+        await self.aclose()
@@ -0,0 +1,132 @@
+"""
+A live status message, edited in place instead of sending new messages.
+
+For chatty but repetitive streams a new message per batch floods the chat
+and uses up its quota. ``LiveStatus`` instead keeps per-level counters and
+the last lines of the stream, and the handler shows them in one status
+message per chat that is updated with ``editMessageText`` at a bounded
+rate. Edits are skipped while nothing changed. When the status outgrows
+the message length limit, a new message is started with the newest lines
+only, and the previous one keeps its last content.
+"""
+
+import logging
+import time
+from collections import Counter, deque
+from threading import Lock
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from .packer import visible_length
+
+MAX_LINE_LENGTH = 200
+
+
+class _Line(NamedTuple):
+    created: float
+    levelno: int
+    message: str
+
+
+class LiveMessage:
+    """What a chat's status message currently shows."""
+
+    __slots__ = ("message_id", "generation", "version", "next_edit")
+
+    def __init__(self):
+        self.message_id: Optional[int] = None
+        self.generation = -1  # status message the ID belongs to
+        self.version = 0  # status version last shown
+        self.next_edit = 0.0  # monotonic time of the next allowed edit
+
+
+class LiveStatus:
+    """Counters and the last lines of a record stream."""
+
+    def __init__(
+        self,
+        max_lines: int = 10,
+        level_emojis: Optional[Dict[int, str]] = None,
+        datefmt: str = "%H:%M:%S",
+    ):
+        """
+        Initialize the status.
+
+        Args:
+            max_lines (int): Number of recent records shown
+            level_emojis (Dict[int, str]): Emoji shown before each line per level
+            datefmt (str): Format of the time shown on each line
+        """
+        self.max_lines = max(1, max_lines)
+        self.level_emojis = level_emojis or {}
+        self.datefmt = datefmt
+        self.counts: Counter = Counter()
+        self.version = 0
+        self.generation = 0
+        self._lines: Deque[_Line] = deque(maxlen=self.max_lines)
+        self._lock = Lock()
+
+    def add(self, record: logging.LogRecord) -> None:
+        """Count a record and make it the newest line."""
+        try:
+            message = record.getMessage()
+        except Exception:
+            message = str(record.msg)
+        message = message.split("\n", 1)[0]
+        if len(message) > MAX_LINE_LENGTH:
+            message = message[: MAX_LINE_LENGTH - 1] + "…"
+        with self._lock:
+            self.counts[record.levelno] += 1
+            self._lines.append(_Line(record.created, record.levelno, message))
+            self.version += 1
+
+    def _text(self, lines: List[_Line]) -> str:
+        counts = " · ".join(
+            f"{logging.getLevelName(levelno)} {count:,}"
+            for levelno, count in sorted(self.counts.items())
+        )
+        body = [
+            " ".join(
+                part
+                for part in (
+                    time.strftime(self.datefmt, time.localtime(line.created)),
+                    self.level_emojis.get(line.levelno, ""),
+                    line.message,
+                )
+                if part
+            )
+            for line in lines
+        ]
+        return "\n".join([f"📟 Live status: {counts}", ""] + body)
+
+    def render(
+        self,
+        render_line: Callable[[str], str],
+        limit: int,
+        parse_mode: Optional[str] = None,
+    ) -> Tuple[str, int, int]:
+        """
+        Render the status into message text.
+
+        Args:
+            render_line (Callable[[str], str]): Escapes the plain status text and
+                adds the header and hashtags
+            limit (int): Maximum visible length of the message
+            parse_mode (str): 'HTML', 'MarkdownV2' or None
+
+        Returns:
+            Tuple[str, int, int]: The text, the generation of the status message
+            it belongs to and the version it shows. The generation changes when
+            the status outgrew the last message and a new one must be started.
+        """
+        with self._lock:
+            lines = list(self._lines)
+            text = render_line(self._text(lines))
+            if visible_length(text, parse_mode) > limit:
+                # Start over in a new message with the newest lines that fill
+                # half of it, so that it takes a while to outgrow again
+                self.generation += 1
+                while len(lines) > 1 and visible_length(text, parse_mode) > limit // 2:
+                    lines.pop(0)
+                    text = render_line(self._text(lines))
+                self._lines = deque(lines, maxlen=self.max_lines)
+            return text, self.generation, self.version
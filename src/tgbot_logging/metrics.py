@@ -0,0 +1,231 @@
+"""
+Counters and histograms describing a handler's delivery.
+
+``HandlerMetrics`` is updated from the logging threads and the sender; each
+update takes one short, uncontended lock and never allocates once a chat's
+counters exist. ``HandlerMetrics.snapshot`` returns plain dictionaries, and
+:func:`prometheus_text` renders a snapshot in the Prometheus text exposition
+format, so the metrics can be served without extra dependencies.
+"""
+
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+API_CALL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+# Per-chat counters
+CHAT_COUNTERS = ("enqueued", "sent", "retries", "failed_sends", "rejected")
+
+
+class Histogram:
+    """Counts observations in fixed buckets, like a Prometheus histogram."""
+
+    def __init__(self, buckets: Sequence[float]):
+        """
+        Initialize the histogram.
+
+        Args:
+            buckets (Sequence[float]): Upper bounds of the buckets; an
+                unbounded bucket is added
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Add an observation. Not thread-safe; callers hold a lock."""
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return cumulative bucket counts keyed by upper bound, sum and count."""
+        cumulative = {}
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), self._counts):
+            total += count
+            cumulative[bound] = total
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+
+class HandlerMetrics:
+    """Delivery metrics of one handler."""
+
+    def __init__(self):
+        self.emitted = 0
+        self._chats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: dict.fromkeys(CHAT_COUNTERS, 0)
+        )
+        self.delivery_latency = Histogram(LATENCY_BUCKETS)
+        self.api_call_duration = Histogram(API_CALL_BUCKETS)
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self._lock = Lock()
+
+    def record_emitted(self) -> None:
+        """Count a record passed to the handler."""
+        with self._lock:
+            self.emitted += 1
+
+    def add(self, counter: str, chat_ids: Iterable[str], value: int = 1) -> None:
+        """Add to a per-chat counter for each of ``chat_ids``."""
+        with self._lock:
+            for chat_id in chat_ids:
+                self._chats[chat_id][counter] += value
+
+    def record_api_call(self, duration: float) -> None:
+        """Record how long a Bot API call took (seconds)."""
+        with self._lock:
+            self.api_call_duration.observe(duration)
+
+    def record_sent(self, chat_id: str, records: int, latencies: List[float]) -> None:
+        """
+        Record a successfully sent batch.
+
+        Args:
+            chat_id (str): Chat the batch was sent to
+            records (int): Number of records in the batch
+            latencies (List[float]): Seconds from the creation of each record in
+                the batch to the API's acknowledgement, where known
+        """
+        with self._lock:
+            self._chats[chat_id]["sent"] += records
+            self.batch_size.observe(records)
+            for latency in latencies:
+                self.delivery_latency.observe(latency)
+
+    def snapshot(
+        self, gauges: Optional[Dict[str, Dict[str, int]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Return a consistent copy of every metric.
+
+        Args:
+            gauges (Dict[str, Dict[str, int]]): Current values per chat to merge
+                into the chat entries, e.g. queue depth and dropped records
+
+        Returns:
+            Dict[str, Any]: ``emitted``, ``chats`` (counters and gauges per chat)
+            and the ``delivery_latency``, ``api_call_duration`` and ``batch_size``
+            histograms
+        """
+        with self._lock:
+            chats = {chat_id: dict(counts) for chat_id, counts in self._chats.items()}
+            snapshot = {
+                "emitted": self.emitted,
+                "delivery_latency": self.delivery_latency.snapshot(),
+                "api_call_duration": self.api_call_duration.snapshot(),
+                "batch_size": self.batch_size.snapshot(),
+            }
+        for chat_id, values in (gauges or {}).items():
+            chats.setdefault(chat_id, dict.fromkeys(CHAT_COUNTERS, 0)).update(values)
+        snapshot["chats"] = chats
+        return snapshot
+
+
+# Prometheus name, type and help text for each chat metric
+_CHAT_METRICS = {
+    "enqueued": ("records_enqueued_total", "counter", "Records queued for a chat."),
+    "sent": ("records_sent_total", "counter", "Records delivered to a chat."),
+    "dropped": (
+        "records_dropped_total",
+        "counter",
+        "Records discarded by the overflow policy.",
+    ),
+    "retries": ("send_retries_total", "counter", "Bot API calls retried."),
+    "failed_sends": (
+        "send_failures_total",
+        "counter",
+        "Batches that failed after all retries and were requeued.",
+    ),
+    "rejected": (
+        "records_rejected_total",
+        "counter",
+        "Records Telegram refused for good, e.g. for invalid markup, and dropped.",
+    ),
+    "queue_depth": ("queue_depth", "gauge", "Messages waiting in a chat's queue."),
+    "queue_bytes": ("queue_bytes", "gauge", "Bytes waiting in a chat's queue."),
+}
+
+_HISTOGRAMS = {
+    "delivery_latency": (
+        "delivery_latency_seconds",
+        "Time from record creation to the API acknowledging it.",
+    ),
+    "api_call_duration": ("api_call_duration_seconds", "Duration of Bot API calls."),
+    "batch_size": ("batch_size_records", "Records delivered per Bot API call."),
+}
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(
+    snapshot: Dict[str, Any],
+    prefix: str = "tgbot_logging",
+    labels: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Render a metrics snapshot in the Prometheus text exposition format.
+
+    Args:
+        snapshot (Dict[str, Any]): Result of ``HandlerMetrics.snapshot``
+        prefix (str): Prefix of every metric name
+        labels (Dict[str, str]): Labels added to every sample, e.g. to tell
+            several handlers apart
+
+    Returns:
+        str: Exposition text, ending with a newline
+    """
+    labels = dict(labels or {})
+    lines = []
+
+    name = f"{prefix}_records_emitted_total"
+    lines.append(f"# HELP {name} Records passed to the handler.")
+    lines.append(f"# TYPE {name} counter")
+    lines.append(f"{name}{_labels(labels)} {snapshot['emitted']}")
+
+    chats = snapshot["chats"]
+    for key, (suffix, kind, help_text) in _CHAT_METRICS.items():
+        name = f"{prefix}_{suffix}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for chat_id in sorted(chats):
+            if key in chats[chat_id]:
+                sample_labels = _labels({**labels, "chat": chat_id})
+                lines.append(f"{name}{sample_labels} {chats[chat_id][key]}")
+
+    for key, (suffix, help_text) in _HISTOGRAMS.items():
+        name = f"{prefix}_{suffix}"
+        histogram = snapshot[key]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for bound, count in histogram["buckets"].items():
+            bucket_labels = _labels({**labels, "le": _number(bound)})
+            lines.append(f"{name}_bucket{bucket_labels} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(histogram['sum'])}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,325 @@
+"""
+Size-aware packing of formatted messages into Telegram ``sendMessage`` calls.
+
+Telegram limits a message to 4096 characters after entity parsing, counted
+in UTF-16 code units: markup such as ``<b>`` or MarkdownV2 escapes does not
+count, while characters outside the Basic Multilingual Plane (most emoji)
+count twice. The packer measures messages the same way, fills each request
+as close to the limit as possible and splits single oversized messages at
+newlines or spaces without breaking HTML tags, MarkdownV2 code blocks or
+entities.
+"""
+
+import html
+import re
+from typing import List, Optional, Tuple
+
+from .queues import QueuedMessage
+
+MAX_MESSAGE_LENGTH = 4096
+SEPARATOR = "\n\n"
+
+_HTML_TOKEN = re.compile(r"<[^>]*>|&#?\w+;|.", re.DOTALL)
+_HTML_TAG = re.compile(r"<[^>]*>")
+_HTML_TAG_NAME = re.compile(r"</?\s*([a-zA-Z][\w-]*)")
+_MARKDOWN_TOKEN = re.compile(r"\\.|```|.", re.DOTALL)
+# Inline code and pre blocks, whose text is shown as is; a pre block may
+# name its language on the line of the opening fence
+_MARKDOWN_CODE = re.compile(
+    r"\\.|```(?:[^\n`\\]*\n)?((?:\\.|[^\\`])*)(?:```|\Z)|`((?:\\.|[^\\`])*)(?:`|\Z)",
+    re.DOTALL,
+)
+_MARKDOWN_PRE_LANGUAGE = re.compile(r"[^\n`\\]*\n")
+_MARKDOWN_LINK_URL = re.compile(r"(?<!\\)\]\((?:\\.|[^)\\])*\)")
+_MARKDOWN_ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+_MARKDOWN_MARKUP = re.compile(r"(?<!\\)(?:\|\||[*_~`\[\]])")
+_MARKDOWN_MARKUP_CHARS = frozenset("*_~`[]|")
+
+# A token is (raw text, visible UTF-16 units, tag name, is closing tag)
+Token = Tuple[str, int, Optional[str], bool]
+
+
+def utf16_len(text: str) -> int:
+    """Return the length of ``text`` in UTF-16 code units."""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def plain_text(text: str, parse_mode: Optional[str] = None) -> str:
+    """
+    Return ``text`` as Telegram displays it, without markup.
+
+    Args:
+        text (str): Message text with markup
+        parse_mode (str): 'HTML', 'MarkdownV2' or None
+
+    Returns:
+        str: Text with tags, markup and escapes removed
+    """
+    if parse_mode == "HTML":
+        if "<" in text or "&" in text:
+            text = html.unescape(_HTML_TAG.sub("", text))
+    elif parse_mode == "MarkdownV2":
+        if "`" in text:
+            parts = []
+            start = 0
+            for match in _MARKDOWN_CODE.finditer(text):
+                if match.group(1) is None and match.group(2) is None:
+                    continue  # an escape outside code
+                parts.append(_markdown_plain(text[start : match.start()]))
+                code = match.group(1) if match.group(1) is not None else match.group(2)
+                parts.append(_MARKDOWN_ESCAPE.sub(r"\1", code))
+                start = match.end()
+            parts.append(_markdown_plain(text[start:]))
+            text = "".join(parts)
+        else:
+            text = _markdown_plain(text)
+    return text
+
+
+def _markdown_plain(text: str) -> str:
+    """Remove MarkdownV2 markup and escapes from text outside code entities."""
+    if any(c in text for c in "\\*_~[]|"):
+        text = _MARKDOWN_LINK_URL.sub("]", text)
+        text = _MARKDOWN_MARKUP.sub("", text)
+        text = _MARKDOWN_ESCAPE.sub(r"\1", text)
+    return text
+
+
+def visible_length(text: str, parse_mode: Optional[str] = None) -> int:
+    """
+    Return the length Telegram counts for ``text`` once entities are parsed.
+
+    Args:
+        text (str): Message text with markup
+        parse_mode (str): 'HTML', 'MarkdownV2' or None
+
+    Returns:
+        int: Length in UTF-16 code units
+    """
+    return utf16_len(plain_text(text, parse_mode))
+
+
+def _tokenize(text: str, parse_mode: Optional[str]) -> List[Token]:
+    """Split ``text`` into atomic tokens that a split must not cut through."""
+    tokens: List[Token] = []
+    if parse_mode == "HTML":
+        for match in _HTML_TOKEN.finditer(text):
+            raw = match.group()
+            if len(raw) > 1 and raw[0] == "<":
+                name = _HTML_TAG_NAME.match(raw)
+                tokens.append(
+                    (raw, 0, name.group(1).lower() if name else None, raw[1:2] == "/")
+                )
+            elif len(raw) > 1:
+                tokens.append((raw, utf16_len(html.unescape(raw)), None, False))
+            else:
+                tokens.append((raw, utf16_len(raw), None, False))
+    elif parse_mode == "MarkdownV2":
+        # Code entities are tracked like tags: "pre" for ``` blocks and
+        # "code" for inline code, inside which markup characters are text
+        code: Optional[str] = None
+        pos = 0
+        while pos < len(text):
+            match = _MARKDOWN_TOKEN.match(text, pos)
+            raw = match.group()
+            pos = match.end()
+            if raw[0] == "`":
+                if code is None:
+                    code = "pre" if raw == "```" else "code"
+                    if code == "pre":
+                        language = _MARKDOWN_PRE_LANGUAGE.match(text, pos)
+                        if language:
+                            raw += language.group()
+                            pos = language.end()
+                    tokens.append((raw, 0, code, False))
+                    continue
+                if code == "code" and raw == "```":
+                    # Only the first backtick closes the inline code
+                    raw = "`"
+                    pos = match.start() + 1
+                if (code == "pre") == (raw == "```"):
+                    tokens.append((raw, 0, code, True))
+                    code = None
+                    continue
+            if len(raw) > 1 and raw[0] == "\\":
+                tokens.append((raw, utf16_len(raw[1]), None, False))
+            elif code is None and raw in _MARKDOWN_MARKUP_CHARS:
+                tokens.append((raw, 0, None, False))
+            else:
+                tokens.append((raw, utf16_len(raw), None, False))
+    else:
+        tokens = [(c, utf16_len(c), None, False) for c in text]
+    return tokens
+
+
+def _closing_tag(name: str, parse_mode: Optional[str]) -> str:
+    """Return the markup that closes an open tag or code entity."""
+    if parse_mode == "MarkdownV2":
+        return "```" if name == "pre" else "`"
+    return f"</{name}>"
+
+
+def split_message(
+    text: str, limit: int = MAX_MESSAGE_LENGTH, parse_mode: Optional[str] = None
+) -> List[str]:
+    """
+    Split a message into pieces that each fit within ``limit``.
+
+    Pieces are cut after the last newline, or failing that the last space,
+    that keeps them within the limit. Tags and entities are never cut, and
+    HTML tags and MarkdownV2 code blocks open at a cut are closed at the end
+    of the piece and reopened at the start of the next one.
+
+    Args:
+        text (str): Message text with markup
+        limit (int): Maximum visible length of a piece
+        parse_mode (str): 'HTML', 'MarkdownV2' or None
+
+    Returns:
+        List[str]: Pieces in order
+    """
+    if visible_length(text, parse_mode) <= limit:
+        return [text]
+
+    tokens = _tokenize(text, parse_mode)
+    pieces: List[str] = []
+    stack: List[Tuple[str, str]] = []  # (tag name, raw opening tag)
+    prefix = ""
+    start = 0
+    length = 0
+    newline_cut = space_cut = None  # (token index, stack snapshot)
+
+    def emit_piece(end: int, open_tags: List[Tuple[str, str]]) -> None:
+        body = "".join(raw for raw, _, _, _ in tokens[start:end])
+        suffix = "".join(
+            _closing_tag(name, parse_mode) for name, _ in reversed(open_tags)
+        )
+        piece = prefix + body + suffix
+        if visible_length(piece, parse_mode):
+            pieces.append(piece)
+
+    i = 0
+    while i < len(tokens):
+        raw, units, name, closing = tokens[i]
+        if units and length + units > limit and i > start:
+            # Prefer a newline past the middle of the piece, then any space
+            if newline_cut and newline_cut[0] - start > (i - start) // 2:
+                cut, open_tags = newline_cut
+            elif space_cut:
+                cut, open_tags = space_cut
+            elif newline_cut:
+                cut, open_tags = newline_cut
+            else:
+                cut, open_tags = i, list(stack)
+            emit_piece(cut, open_tags)
+            prefix = "".join(tag for _, tag in open_tags)
+            stack = list(open_tags)
+            start = i = cut
+            length = 0
+            newline_cut = space_cut = None
+            continue
+
+        if name is not None:
+            if closing:
+                for depth in range(len(stack) - 1, -1, -1):
+                    if stack[depth][0] == name:
+                        del stack[depth:]
+                        break
+            elif not raw.endswith("/>"):
+                stack.append((name, raw))
+        length += units
+        i += 1
+        if raw == "\n":
+            newline_cut = (i, list(stack))
+        elif raw == " ":
+            space_cut = (i, list(stack))
+
+    emit_piece(len(tokens), stack)
+    return pieces
+
+
+def headline(
+    text: str, limit: int, parse_mode: Optional[str] = None
+) -> Tuple[str, bool]:
+    """
+    Return the start of a message that fits within ``limit``.
+
+    The message is cut like :func:`split_message` cuts its first piece, so
+    markup stays balanced, but only a prefix of it is tokenized.
+
+    Args:
+        text (str): Message text with markup
+        limit (int): Maximum visible length of the headline
+        parse_mode (str): 'HTML', 'MarkdownV2' or None
+
+    Returns:
+        Tuple[str, bool]: The headline and whether it was cut
+    """
+    # Twice the limit leaves room for a cut at a newline and for a tag cut
+    # at the end of the prefix
+    size = max(1, limit) * 4
+    while size < len(text) and visible_length(text[:size], parse_mode) <= 2 * limit:
+        size *= 2
+    pieces = split_message(text[:size], limit, parse_mode)
+    return pieces[0], len(pieces) > 1
+
+
+def pack_messages(
+    messages: List[str],
+    limit: int = MAX_MESSAGE_LENGTH,
+    parse_mode: Optional[str] = None,
+    separator: str = SEPARATOR,
+) -> List[List[str]]:
+    """
+    Group messages into as few Telegram messages as possible.
+
+    Messages keep their order; each group joined with ``separator`` fits
+    within ``limit``. Messages that are too long on their own are split
+    with :func:`split_message` first; the last piece of a split
+    :class:`QueuedMessage` keeps its sequence number and creation time, so
+    the message is only acknowledged once all of it has been sent.
+
+    Args:
+        messages (List[str]): Formatted messages in order
+        limit (int): Maximum visible length of a Telegram message
+        parse_mode (str): 'HTML', 'MarkdownV2' or None
+        separator (str): Text placed between messages in a group
+
+    Returns:
+        List[List[str]]: Groups of message pieces, one group per API call
+    """
+    separator_length = visible_length(separator, parse_mode)
+    groups: List[List[str]] = []
+    current: List[str] = []
+    current_length = 0
+
+    for message in messages:
+        length = visible_length(message, parse_mode)
+        pieces = [(message, length)]
+        if length > limit:
+            pieces = [
+                (piece, visible_length(piece, parse_mode))
+                for piece in split_message(message, limit, parse_mode)
+            ]
+            if isinstance(message, QueuedMessage):
+                last, last_length = pieces[-1]
+                pieces[-1] = (
+                    QueuedMessage(last, message.seq, message.created),
+                    last_length,
+                )
+
+        for piece, piece_length in pieces:
+            if current and current_length + separator_length + piece_length <= limit:
+                current.append(piece)
+                current_length += separator_length + piece_length
+            else:
+                if current:
+                    groups.append(current)
+                current = [piece]
+                current_length = piece_length
+
+    if current:
+        groups.append(current)
+    return groups
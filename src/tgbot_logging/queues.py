@@ -0,0 +1,385 @@
+"""
+Bounded per-chat message queues with configurable overflow policies.
+
+A queue can be limited by the number of queued messages, by their total
+size in bytes, or both. When a new message does not fit, the overflow
+policy decides what is lost:
+
+    drop_oldest: evict the oldest queued messages to make room
+    drop_newest: discard the incoming message
+    block: wait up to ``overflow_timeout`` seconds for room, then discard
+        the incoming message
+    downsample: admit one in every ``downsample_rate`` incoming messages
+        (evicting the oldest to make room) and discard the rest
+
+Every discarded message is counted in ``dropped`` and passed to the
+``on_drop`` callback, if one is set.
+
+``LaneQueue`` splits a bounded queue into priority lanes, one per latency
+budget, and hands out messages earliest deadline first. Its bounds cover
+all lanes together.
+"""
+
+import time
+from collections import deque
+from queue import Empty
+from threading import Condition
+from typing import Callable, Deque, Iterable, List, Optional, Sequence, Tuple
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+DOWNSAMPLE = "downsample"
+
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK, DOWNSAMPLE)
+
+
+class QueuedMessage(str):
+    """
+    A formatted message with its sequence number in the spool and its record's creation time.
+
+    One object is queued for every chat, so its UTF-8 size is measured once
+    and not by each chat's queue.
+    """
+
+    seq: Optional[int]
+    created: Optional[float]
+    nbytes: int
+
+    def __new__(
+        cls, text: str, seq: Optional[int] = None, created: Optional[float] = None
+    ) -> "QueuedMessage":
+        message = super().__new__(cls, text)
+        message.seq = seq
+        message.created = created
+        message.nbytes = len(text.encode("utf-8", "replace"))
+        return message
+
+
+class MessageQueue:
+    """A thread-safe FIFO of formatted messages with optional bounds."""
+
+    def __init__(
+        self,
+        max_size: int = 0,
+        max_bytes: int = 0,
+        overflow_policy: str = DROP_OLDEST,
+        overflow_timeout: float = 1.0,
+        downsample_rate: int = 10,
+        on_drop: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Initialize the queue.
+
+        Args:
+            max_size (int): Maximum number of queued messages, 0 for no limit
+            max_bytes (int): Maximum total UTF-8 size of queued messages, 0 for no limit
+            overflow_policy (str): One of ``OVERFLOW_POLICIES``
+            overflow_timeout (float): How long the ``block`` policy waits for room (seconds)
+            downsample_rate (int): Keep one in this many messages under the ``downsample`` policy
+            on_drop (Callable): Called with every message the overflow policy discards
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy {overflow_policy!r}, "
+                f"expected one of {', '.join(OVERFLOW_POLICIES)}"
+            )
+        self.max_size = max(0, max_size)
+        self.max_bytes = max(0, max_bytes)
+        self.overflow_policy = overflow_policy
+        self.overflow_timeout = max(0.0, overflow_timeout)
+        self.downsample_rate = max(1, downsample_rate)
+        self.on_drop = on_drop
+
+        self.dropped = 0
+        self._items: Deque[Tuple[str, int, float]] = deque()
+        self._nbytes = 0
+        self._overflow_seen = 0
+        self._not_full = Condition()
+
+    @staticmethod
+    def _sizeof(item: str) -> int:
+        """Return the size of a message in bytes."""
+        if isinstance(item, QueuedMessage):
+            return item.nbytes
+        return len(item.encode("utf-8", "replace"))
+
+    @property
+    def bounded(self) -> bool:
+        """Whether the queue has any limit."""
+        return bool(self.max_size or self.max_bytes)
+
+    @property
+    def nbytes(self) -> int:
+        """Total size of queued messages in bytes."""
+        return self._nbytes
+
+    def _fits(self, size: int) -> bool:
+        """Check whether a message of ``size`` bytes fits without eviction."""
+        if self.max_size and self.qsize() >= self.max_size:
+            return False
+        if self.max_bytes and not self.empty() and self._nbytes + size > self.max_bytes:
+            return False
+        return True
+
+    def _append(self, item: str, size: int, lane: int = 0) -> None:
+        self._items.append((item, size, time.monotonic()))
+        self._nbytes += size
+
+    def _popleft(self) -> str:
+        item, size, _ = self._items.popleft()
+        self._nbytes -= size
+        return item
+
+    def _pop(self) -> str:
+        item, size, _ = self._items.pop()
+        self._nbytes -= size
+        return item
+
+    def _drop(self, item: str) -> None:
+        """Count a discarded message and report it."""
+        self.dropped += 1
+        if self.on_drop is not None:
+            try:
+                self.on_drop(item)
+            except Exception as e:
+                print(f"Error in drop callback: {str(e)}")
+
+    def _evict_for(self, size: int) -> None:
+        """Drop the oldest messages until a message of ``size`` bytes fits."""
+        while not self.empty() and not self._fits(size):
+            self._drop(self._popleft())
+
+    def put(self, item: str, block: bool = True) -> bool:
+        """
+        Add a message, applying the overflow policy if the queue is full.
+
+        Args:
+            item (str): Message to enqueue
+            block (bool): Allow the ``block`` policy to wait for room
+
+        Returns:
+            bool: True if the message was enqueued, False if it was dropped
+        """
+        return self._put(item, block, 0)
+
+    def _put(self, item: str, block: bool, lane: int) -> bool:
+        size = self._sizeof(item)
+        with self._not_full:
+            if self._fits(size):
+                self._append(item, size, lane)
+                return True
+
+            if self.overflow_policy == DROP_OLDEST:
+                self._evict_for(size)
+            elif self.overflow_policy == DROP_NEWEST:
+                self._drop(item)
+                return False
+            elif self.overflow_policy == BLOCK:
+                deadline = time.monotonic() + self.overflow_timeout
+                while block and not self._fits(size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_full.wait(remaining)
+                if not self._fits(size):
+                    self._drop(item)
+                    return False
+            else:  # DOWNSAMPLE
+                # Admit the first overflowing message and every Nth after it
+                self._overflow_seen += 1
+                if (self._overflow_seen - 1) % self.downsample_rate:
+                    self._drop(item)
+                    return False
+                self._evict_for(size)
+
+            self._append(item, size, lane)
+            return True
+
+    def put_nowait(self, item: str) -> bool:
+        """Add a message without waiting for room."""
+        return self.put(item, block=False)
+
+    def requeue(self, items: Iterable[str]) -> None:
+        """
+        Put messages that failed to send back at the front of the queue.
+
+        If they no longer fit, ``drop_newest`` trims the newest messages and
+        every other policy trims the oldest ones.
+        """
+        with self._not_full:
+            now = time.monotonic()
+            for item in reversed(list(items)):
+                size = self._sizeof(item)
+                self._items.appendleft((item, size, now))
+                self._nbytes += size
+            while not self.empty() and self.bounded and not self._within_limits():
+                if self.overflow_policy == DROP_NEWEST:
+                    self._drop(self._pop())
+                else:
+                    self._drop(self._popleft())
+
+    def _within_limits(self) -> bool:
+        if self.max_size and self.qsize() > self.max_size:
+            return False
+        if self.max_bytes and self.qsize() > 1 and self._nbytes > self.max_bytes:
+            return False
+        return True
+
+    def get_nowait(self) -> str:
+        """Remove and return the oldest message, raising ``queue.Empty`` if none."""
+        with self._not_full:
+            if not self._items:
+                raise Empty
+            item = self._popleft()
+            self._not_full.notify()
+            return item
+
+    def head_time(self) -> Optional[float]:
+        """Return when the oldest message was queued (``time.monotonic()``), or None."""
+        try:
+            return self._items[0][2]
+        except IndexError:
+            return None
+
+    def qsize(self) -> int:
+        """Return the number of queued messages."""
+        return len(self._items)
+
+    def empty(self) -> bool:
+        """Return True if the queue is empty."""
+        return not self._items
+
+
+class LaneQueue(MessageQueue):
+    """
+    A chat's bounded queue split into priority lanes, drained earliest deadline first.
+
+    Each lane is a FIFO with its own latency budget, so a message's deadline
+    is the time it was queued plus its lane's budget. Within a lane deadlines
+    are ordered by arrival, so comparing the lane heads is enough to find the
+    earliest deadline overall. Messages that failed to send go to a separate
+    retry lane that is drained before the others.
+
+    The bounds and the overflow policy apply to the chat as a whole. When
+    messages must be evicted they come from the lane whose head has the
+    latest deadline, and from the retry lane only once the others are empty.
+    """
+
+    def __init__(
+        self,
+        budgets: Sequence[float],
+        max_size: int = 0,
+        max_bytes: int = 0,
+        overflow_policy: str = DROP_OLDEST,
+        overflow_timeout: float = 1.0,
+        downsample_rate: int = 10,
+        on_drop: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Initialize the lanes.
+
+        Args:
+            budgets (Sequence[float]): Latency budget of each lane (seconds)
+            max_size (int): Maximum number of queued messages across all lanes, 0 for no limit
+            max_bytes (int): Maximum total UTF-8 size across all lanes, 0 for no limit
+            overflow_policy (str): One of ``OVERFLOW_POLICIES``
+            overflow_timeout (float): How long the ``block`` policy waits for room (seconds)
+            downsample_rate (int): Keep one in this many messages under the ``downsample`` policy
+            on_drop (Callable): Called with every message the overflow policy discards
+        """
+        super().__init__(
+            max_size=max_size,
+            max_bytes=max_bytes,
+            overflow_policy=overflow_policy,
+            overflow_timeout=overflow_timeout,
+            downsample_rate=downsample_rate,
+            on_drop=on_drop,
+        )
+        self.budgets = list(budgets) or [0.0]
+        self.lanes: List[Deque[Tuple[str, int, float]]] = [
+            deque() for _ in self.budgets
+        ]
+        # The inherited FIFO is the retry lane
+        self.retry = self._items
+
+    def put(self, item: str, block: bool = True, lane: int = 0) -> bool:
+        """Add a message to a lane, applying the overflow policy if the chat is full."""
+        return self._put(item, block, lane)
+
+    def put_nowait(self, item: str, lane: int = 0) -> bool:
+        """Add a message to a lane without waiting for room."""
+        return self._put(item, False, lane)
+
+    def _append(self, item: str, size: int, lane: int = 0) -> None:
+        self.lanes[lane].append((item, size, time.monotonic()))
+        self._nbytes += size
+
+    def _victim(self) -> Deque[Tuple[str, int, float]]:
+        """Return the lane to evict from: the least urgent one, or the retry lane."""
+        victim = self.retry
+        latest = None
+        for index, lane in enumerate(self.lanes):
+            deadline = self._head_deadline(index)
+            if deadline is not None and (latest is None or deadline > latest):
+                victim, latest = lane, deadline
+        return victim
+
+    def _popleft(self) -> str:
+        item, size, _ = self._victim().popleft()
+        self._nbytes -= size
+        return item
+
+    def _pop(self) -> str:
+        item, size, _ = self._victim().pop()
+        self._nbytes -= size
+        return item
+
+    def _head_deadline(
+        self, index: int, max_wait: Optional[float] = None
+    ) -> Optional[float]:
+        lane = self.lanes[index]
+        if not lane:
+            return None
+        budget = self.budgets[index]
+        return lane[0][2] + (budget if max_wait is None else min(budget, max_wait))
+
+    def next_deadline(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Return the earliest deadline of any queued message, or None if empty.
+
+        Args:
+            max_wait (float): Cap every lane's budget at this many seconds
+        """
+        deadlines = [self.head_time()]
+        deadlines.extend(
+            self._head_deadline(i, max_wait) for i in range(len(self.lanes))
+        )
+        return min((d for d in deadlines if d is not None), default=None)
+
+    def get_nowait(self) -> str:
+        """Remove and return the message with the earliest deadline."""
+        with self._not_full:
+            lane = self.retry
+            if not lane:
+                best_deadline = None
+                for index in range(len(self.lanes)):
+                    deadline = self._head_deadline(index)
+                    if deadline is not None and (
+                        best_deadline is None or deadline < best_deadline
+                    ):
+                        lane, best_deadline = self.lanes[index], deadline
+                if best_deadline is None:
+                    raise Empty
+            item, size, _ = lane.popleft()
+            self._nbytes -= size
+            self._not_full.notify()
+            return item
+
+    def qsize(self) -> int:
+        """Return the number of queued messages."""
+        return len(self.retry) + sum(len(lane) for lane in self.lanes)
+
+    def empty(self) -> bool:
+        """Return True if every lane is empty."""
+        return not self.retry and not any(self.lanes)
@@ -0,0 +1,129 @@
+"""
+Token-bucket rate limiting modelled on Telegram's Bot API quotas.
+
+Telegram allows a bot roughly 30 messages per second overall, one message
+per second in a private chat and 20 messages per minute in a group or
+channel. ``RateLimiter`` keeps a global bucket plus one bucket per chat and
+schedules every send ahead of time so that it lands inside all of them,
+instead of sending eagerly and sleeping after a ``RetryAfter``.
+
+Buckets use the virtual scheduling form of the token bucket: each bucket
+remembers the theoretical time its next token becomes free, so a caller
+learns immediately how long to wait and later callers queue up behind it.
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional, Tuple, Union
+
+# Telegram's documented limits
+GLOBAL_RATE = 30.0  # messages per second for the whole bot
+PRIVATE_CHAT_RATE = 1.0  # messages per second in a private chat
+GROUP_CHAT_RATE = 20 / 60  # messages per second in a group or channel
+
+
+class TokenBucket:
+    """A token bucket that refills at ``rate`` tokens per second up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Initialize the bucket.
+
+        Args:
+            rate (float): Tokens added per second
+            burst (int): Maximum number of tokens that can be spent at once
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._interval = 1.0 / rate
+        self._tolerance = (self.burst - 1) * self._interval
+        self._next_free = 0.0
+
+    def earliest(self, at: float) -> float:
+        """Return the earliest time at or after ``at`` when a token is available."""
+        return max(at, self._next_free - self._tolerance)
+
+    def consume(self, at: float) -> None:
+        """Spend a token at time ``at``, which must not precede :meth:`earliest`."""
+        self._next_free = max(self._next_free, at) + self._interval
+
+    def reserve(self, now: float) -> float:
+        """Spend the next free token and return how long to wait for it."""
+        at = self.earliest(now)
+        self.consume(at)
+        return at - now
+
+    def penalize(self, until: float) -> None:
+        """Make the bucket empty until ``until``."""
+        self._next_free = max(self._next_free, until + self._tolerance)
+
+
+class RateLimiter:
+    """Schedules sends so they stay within the global and per-chat quotas."""
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        global_burst: int = 30,
+        private_chat_rate: float = PRIVATE_CHAT_RATE,
+        private_chat_burst: int = 1,
+        group_chat_rate: float = GROUP_CHAT_RATE,
+        group_chat_burst: int = 1,
+        chat_limits: Optional[Dict[Union[str, int], Tuple[float, int]]] = None,
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            global_rate (float): Messages per second across all chats
+            global_burst (int): Messages that may be sent at once across all chats
+            private_chat_rate (float): Messages per second in a private chat
+            private_chat_burst (int): Messages that may be sent at once in a private chat
+            group_chat_rate (float): Messages per second in a group or channel
+            group_chat_burst (int): Messages that may be sent at once in a group or channel
+            chat_limits (Dict): Per-chat overrides mapping chat ID to (rate, burst)
+        """
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.private_chat_rate = private_chat_rate
+        self.private_chat_burst = private_chat_burst
+        self.group_chat_rate = group_chat_rate
+        self.group_chat_burst = group_chat_burst
+        self.chat_limits = {
+            str(chat_id): limits for chat_id, limits in (chat_limits or {}).items()
+        }
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+
+    @staticmethod
+    def is_group_chat(chat_id: str) -> bool:
+        """Groups, supergroups and channels have negative IDs or @usernames."""
+        return chat_id.startswith("-") or chat_id.startswith("@")
+
+    def chat_bucket(self, chat_id: str) -> TokenBucket:
+        """Return the bucket for a chat, creating it on first use."""
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if chat_id in self.chat_limits:
+                rate, burst = self.chat_limits[chat_id]
+            elif self.is_group_chat(chat_id):
+                rate, burst = self.group_chat_rate, self.group_chat_burst
+            else:
+                rate, burst = self.private_chat_rate, self.private_chat_burst
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, burst)
+        return bucket
+
+    async def acquire(self, chat_id: str) -> None:
+        """
+        Wait until a message may be sent to a chat.
+
+        The chat slot is reserved first and the global slot only once it is
+        reached, so a chat queued seconds ahead does not hold global capacity
+        that other chats could use now.
+        """
+        delay = self.chat_bucket(chat_id).reserve(time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        delay = self.global_bucket.reserve(time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,284 @@
+"""
+Rendering of log records into Telegram messages.
+
+A message is made of a header (level emoji, project emoji and bold project
+name), the formatted record with an optional timestamp and traceback, and a
+project hashtag:
+
+    ❌ 🔷 <b>My Project</b>
+    2024-01-01 12:00:00 Connection to db failed
+    <pre>Traceback (most recent call last): ...</pre>
+    #My_Project
+
+Everything that only depends on the level and the logger, including the
+context passed to a custom ``message_format`` callable, is built once per
+``(level, logger)`` and cached, so per-record work is limited to the
+message itself, the timestamp and the traceback. With ``escape_text`` the
+formatter's template is compiled once as well; it is markup, and only the
+values filled into it are escaped per record.
+"""
+
+import logging
+import re
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from .escaping import EscapedTemplate, escape
+
+_HASHTAG_INVALID = re.compile(r"\W+")
+
+# The format style of each stock logging style class
+_STYLE_KEYS = {
+    logging.PercentStyle: "%",
+    logging.StrFormatStyle: "{",
+    logging.StringTemplateStyle: "$",
+}
+
+
+class _Parts(NamedTuple):
+    prefix: str  # header followed by a separator, or ""
+    suffix: str  # separator followed by hashtags, or ""
+    context: Dict[str, Any]
+
+
+def bold(text: str, parse_mode: Optional[str]) -> str:
+    """Escape plain text and make it bold in a parse mode."""
+    if parse_mode == "HTML":
+        return f"<b>{escape(text, parse_mode)}</b>"
+    if parse_mode == "MarkdownV2":
+        return f"*{escape(text, parse_mode)}*"
+    return text
+
+
+def code_block(text: str, parse_mode: Optional[str]) -> str:
+    """Wrap plain text such as a traceback in a preformatted block."""
+    if parse_mode == "HTML":
+        return f"<pre>{escape(text, parse_mode)}</pre>"
+    if parse_mode == "MarkdownV2":
+        return f"```\n{escape(text, parse_mode, pre=True)}\n```"
+    return text
+
+
+def snapshot(record: logging.LogRecord) -> logging.LogRecord:
+    """
+    Copy a record so that it can be rendered later on another thread.
+
+    The message is interpolated now, as its arguments may change once the
+    caller moves on; ``exc_info`` is kept as is and only turned into text when
+    the copy is rendered. Other attributes are shared with the original.
+    """
+    copy = record.__class__.__new__(record.__class__)
+    copy.__dict__.update(record.__dict__)
+    copy.msg = record.getMessage()
+    copy.args = None
+    return copy
+
+
+def hashtag(name: str) -> str:
+    """Turn a name into a Telegram hashtag body (letters, digits and underscores)."""
+    return _HASHTAG_INVALID.sub("_", name).strip("_")
+
+
+class MessageRenderer:
+    """Renders records with cached per-(level, logger) headers."""
+
+    def __init__(
+        self,
+        parse_mode: Optional[str] = "HTML",
+        project_name: Optional[str] = None,
+        project_emoji: str = "🔷",
+        add_hashtags: bool = True,
+        level_emojis: Optional[Dict[int, str]] = None,
+        include_project_name: bool = True,
+        include_level_emoji: bool = True,
+        datefmt: Optional[str] = None,
+        message_format: Optional[
+            Callable[[logging.LogRecord, Dict[str, Any]], str]
+        ] = None,
+        escape_text: bool = True,
+        exception_tags: bool = False,
+    ):
+        """
+        Initialize the renderer.
+
+        Args:
+            parse_mode (str): 'HTML', 'MarkdownV2' or None
+            project_name (str): Project name shown in the header and hashtag
+            project_emoji (str): Emoji shown before the project name
+            add_hashtags (bool): Whether to add the project hashtag
+            level_emojis (Dict[int, str]): Emoji per log level
+            include_project_name (bool): Whether to show the project in the header
+            include_level_emoji (bool): Whether to show the level emoji
+            datefmt (str): Timestamp format; no timestamp if not set
+            message_format (Callable): Custom function rendering the whole message
+                from the record and the cached context
+            escape_text (bool): Whether to escape the values filled into the
+                formatter's template, e.g. the message, so that they are shown as
+                is; the template itself is markup
+            exception_tags (bool): Whether to tag records with the
+                ``exc_fingerprint`` set by an ``ExceptionTracker`` with a hashtag
+        """
+        self.parse_mode = parse_mode
+        self.project_name = project_name
+        self.project_emoji = project_emoji
+        self.add_hashtags = add_hashtags
+        self.level_emojis = level_emojis or {}
+        self.include_project_name = include_project_name
+        self.include_level_emoji = include_level_emoji
+        self.datefmt = datefmt
+        self.message_format = message_format
+        self.escape_text = escape_text
+        self.exception_tags = exception_tags
+        self.formatter = logging.Formatter("%(message)s", datefmt=datefmt)
+        self.time_formatter = logging.Formatter(datefmt=datefmt) if datefmt else None
+        self._template = self._compile_template(self.formatter)
+
+        self._cache: Dict[Tuple[int, str], _Parts] = {}
+        self._lock = Lock()
+
+    def set_formatter(self, formatter: logging.Formatter) -> None:
+        """Use a new formatter for the record text and drop cached contexts."""
+        self.formatter = formatter
+        self._template = self._compile_template(formatter)
+        self.clear_cache()
+
+    def clear_cache(self) -> None:
+        """Forget cached headers, e.g. after changing the project settings."""
+        with self._lock:
+            self._cache.clear()
+
+    def _compile_template(
+        self, formatter: logging.Formatter
+    ) -> Optional[EscapedTemplate]:
+        """Precompile the formatter's template if its values are to be escaped."""
+        if not self.escape_text:
+            return None
+        # Only the stock styles can be filled in piece by piece
+        style = _STYLE_KEYS.get(type(getattr(formatter, "_style", None)))
+        if (
+            style is None
+            or type(formatter).formatMessage is not logging.Formatter.formatMessage
+        ):
+            return None
+        return EscapedTemplate(formatter._style._fmt, self.parse_mode, style)
+
+    def format_time(self, record: logging.LogRecord) -> str:
+        """Format the record's timestamp with ``datefmt``."""
+        formatter = self.time_formatter or self.formatter
+        return formatter.formatTime(record, self.datefmt)
+
+    def _parts(self, levelno: int, levelname: str, logger_name: str) -> _Parts:
+        key = (levelno, logger_name)
+        parts = self._cache.get(key)
+        if parts is not None:
+            return parts
+
+        level_emoji = self.level_emojis.get(levelno, "")
+        header = []
+        if self.include_level_emoji and level_emoji:
+            header.append(level_emoji)
+        project_header = self.include_project_name and bool(self.project_name)
+        if project_header:
+            if self.project_emoji:
+                header.append(self.project_emoji)
+            header.append(bold(self.project_name, self.parse_mode))
+        header_text = " ".join(header)
+
+        hashtags = ""
+        if self.add_hashtags and self.project_name and hashtag(self.project_name):
+            hashtags = escape(f"#{hashtag(self.project_name)}", self.parse_mode)
+
+        # A bare level emoji shares the first line with the message
+        prefix = ""
+        if header_text:
+            prefix = header_text + ("\n" if project_header else " ")
+        suffix = f"\n{hashtags}" if hashtags else ""
+
+        context = {
+            "project_name": self.project_name,
+            "project_emoji": self.project_emoji,
+            "level_emojis": self.level_emojis,
+            "level_emoji": level_emoji,
+            "level_name": levelname,
+            "logger_name": logger_name,
+            "parse_mode": self.parse_mode,
+            "formatter": self.formatter,
+            "time_formatter": self.time_formatter,
+            "format_time": self.format_time,
+            "escape": partial(escape, parse_mode=self.parse_mode),
+            "header": header_text,
+            "hashtags": hashtags,
+        }
+        parts = _Parts(prefix, suffix, context)
+        with self._lock:
+            self._cache[key] = parts
+        return parts
+
+    def context(self, record: logging.LogRecord) -> Dict[str, Any]:
+        """
+        Return the cached context for a record's level and logger.
+
+        The same dictionary is passed to every call of ``message_format`` for
+        that level and logger, so it must be treated as read-only.
+        """
+        return self._parts(record.levelno, record.levelname, record.name).context
+
+    def _format_body(self, record: logging.LogRecord) -> str:
+        """Format the record text, with the traceback in a preformatted block."""
+        formatter = self.formatter
+        record.message = record.getMessage()
+        if formatter.usesTime():
+            record.asctime = formatter.formatTime(record, formatter.datefmt)
+        if self._template is not None:
+            body = self._template.format(record.__dict__)
+        elif self.escape_text:
+            body = escape(formatter.formatMessage(record), self.parse_mode)
+        else:
+            body = formatter.formatMessage(record)
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = formatter.formatException(record.exc_info)
+        details = [text for text in (record.exc_text, record.stack_info) if text]
+        if details:
+            body += "\n" + code_block("\n".join(details), self.parse_mode)
+        return body
+
+    def _suffix(self, parts: _Parts, record: logging.LogRecord) -> str:
+        """Return the hashtags for a record, with its exception tag if any."""
+        fingerprint = getattr(record, "exc_fingerprint", None)
+        if not (self.exception_tags and fingerprint):
+            return parts.suffix
+        tag = escape(f"#exc_{fingerprint}", self.parse_mode)
+        return f"{parts.suffix} {tag}" if parts.suffix else f"\n{tag}"
+
+    def render_line(self, record: logging.LogRecord, text: str) -> str:
+        """Render plain text, e.g. a summary, with a record's header and hashtags."""
+        parts = self._parts(record.levelno, record.levelname, record.name)
+        return f"{parts.prefix}{escape(text, self.parse_mode)}{self._suffix(parts, record)}"
+
+    def render(
+        self, record: logging.LogRecord, formatter: Optional[logging.Formatter] = None
+    ) -> str:
+        """
+        Render a record into message text.
+
+        Args:
+            record (logging.LogRecord): Record to render
+            formatter (logging.Formatter): Formatter for the record text, e.g. the
+                handler's current one; replaces the previous formatter if it changed
+        """
+        if formatter is not None and formatter is not self.formatter:
+            self.set_formatter(formatter)
+        parts = self._parts(record.levelno, record.levelname, record.name)
+
+        if self.message_format is not None:
+            try:
+                return self.message_format(record, parts.context)
+            except Exception as e:
+                print(f"Error in custom message format: {str(e)}")
+
+        body = self._format_body(record)
+        if self.time_formatter is not None and not self.formatter.usesTime():
+            body = f"{escape(self.format_time(record), self.parse_mode)} {body}"
+        return f"{parts.prefix}{body}{self._suffix(parts, record)}"
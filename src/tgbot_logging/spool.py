@@ -0,0 +1,385 @@
+"""
+Durable on-disk spool for queued messages.
+
+With a spool, every formatted message is appended to a memory-mapped
+segment file before it is queued, and acknowledged per chat once it has
+been delivered (or deliberately dropped). After a crash or restart the
+handler replays whatever is still unacknowledged.
+
+Segments are append-only. Each entry is a header followed by a payload:
+
+    length (uint32) | crc32 (uint32) | kind (uint8) | seq (uint64) | payload
+
+A ``MESSAGE`` entry holds the destination chats and the text, an ``ACK``
+entry the chat that received message ``seq``. Segment files are
+preallocated, so a zero length marks the end of the written data, and a
+bad checksum marks a torn write at the tail.
+
+Disk use stays bounded by the live messages plus about two segments.
+Because an acknowledgement may refer to a message in an older segment,
+segments are deleted oldest first once none of their messages is live.
+When the active segment fills up, the oldest segments are compacted by
+copying their remaining live messages forward, so the segments behind
+them can be deleted too.
+"""
+
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Set, Tuple
+
+MESSAGE = 1
+ACK = 2
+
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+FSYNC_NEVER = "never"
+FSYNC_MODES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+DEFAULT_SEGMENT_SIZE = 4 * 1024 * 1024
+
+_HEADER = struct.Struct("<IIBQ")
+_SEGMENT_NAME = re.compile(r"^segment-(\d{8})\.log$")
+_CHAT_SEPARATOR = "\x1f"
+_TEXT_SEPARATOR = "\x1e"
+
+# Compact a full segment once less than this share of its messages is live
+COMPACT_RATIO = 0.5
+
+
+class _Segment:
+    """A preallocated, memory-mapped segment file."""
+
+    def __init__(self, path: str, index: int, size: int, create: bool):
+        self.path = path
+        self.index = index
+        self.messages: Set[int] = set()
+        self.total_messages = 0
+        mode = "w+b" if create else "r+b"
+        self._file = open(path, mode)
+        if create:
+            self._file.truncate(size)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.map = mmap.mmap(self._file.fileno(), self.size)
+        self.offset = 0
+
+    def has_room(self, length: int) -> bool:
+        return self.offset + length <= self.size
+
+    def write(self, data: bytes) -> None:
+        self.map[self.offset : self.offset + len(data)] = data
+        self.offset += len(data)
+
+    def flush(self) -> None:
+        self.map.flush()
+
+    def close(self) -> None:
+        try:
+            self.map.close()
+        finally:
+            self._file.close()
+
+    def delete(self) -> None:
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class Spool:
+    """Append-only, memory-mapped message spool with per-chat acknowledgements."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        fsync: str = FSYNC_INTERVAL,
+        fsync_interval: float = 1.0,
+    ):
+        """
+        Open the spool, creating the directory if needed.
+
+        Args:
+            directory (str): Directory that holds the segment files
+            segment_size (int): Size of each preallocated segment in bytes
+            fsync (str): When to flush to disk: 'always' after every write,
+                'interval' at most every ``fsync_interval`` seconds, or 'never'
+            fsync_interval (float): Seconds between flushes in 'interval' mode
+        """
+        if fsync not in FSYNC_MODES:
+            raise ValueError(
+                f"Unknown fsync mode {fsync!r}, expected one of {', '.join(FSYNC_MODES)}"
+            )
+        self.directory = directory
+        self.segment_size = max(_HEADER.size * 16, segment_size)
+        self.fsync = fsync
+        self.fsync_interval = max(0.0, fsync_interval)
+
+        self._lock = threading.Lock()
+        self._segments: Dict[int, _Segment] = {}
+        self._pending: Dict[int, Set[str]] = {}
+        self._texts: Dict[int, str] = {}
+        self._segment_of: Dict[int, int] = {}
+        self._next_seq = 1
+        self._last_flush = time.monotonic()
+        self._closed = False
+        self._compacting = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._delete_dead_segments()
+        self._active = self._new_segment()
+
+    # Reading -----------------------------------------------------------------
+
+    def _load(self) -> None:
+        """Rebuild the pending set from the segments on disk."""
+        indexes = sorted(
+            int(match.group(1))
+            for match in map(_SEGMENT_NAME.match, os.listdir(self.directory))
+            if match
+        )
+        for index in indexes:
+            segment = _Segment(self._path(index), index, 0, create=False)
+            self._segments[index] = segment
+            for kind, seq, payload in self._entries(segment):
+                self._next_seq = max(self._next_seq, seq + 1)
+                if kind == MESSAGE:
+                    # A compacted copy replaces the original entry
+                    self._forget(seq)
+                    chats, text = self._decode_message(payload)
+                    self._pending[seq] = chats
+                    self._texts[seq] = text
+                    self._track(seq, segment)
+                elif kind == ACK and seq in self._pending:
+                    self._pending[seq].discard(payload.decode("utf-8"))
+                    if not self._pending[seq]:
+                        self._forget(seq)
+            # Replayed segments are never appended to
+            segment.offset = segment.size
+
+    @staticmethod
+    def _entries(segment: _Segment) -> Iterable[Tuple[int, int, bytes]]:
+        """Yield the intact entries of a segment, stopping at the end or a torn write."""
+        data = segment.map
+        offset = 0
+        while offset + _HEADER.size <= segment.size:
+            length, crc, kind, seq = _HEADER.unpack_from(data, offset)
+            if length == 0:
+                break
+            start = offset + _HEADER.size
+            end = start + length
+            if end > segment.size:
+                break
+            payload = bytes(data[start:end])
+            if zlib.crc32(payload) != crc or kind not in (MESSAGE, ACK):
+                break
+            yield kind, seq, payload
+            offset = end
+
+    @staticmethod
+    def _decode_message(payload: bytes) -> Tuple[Set[str], str]:
+        chats, _, text = payload.decode("utf-8").partition(_TEXT_SEPARATOR)
+        return set(chats.split(_CHAT_SEPARATOR)), text
+
+    def pending(self) -> List[Tuple[int, Set[str], str]]:
+        """
+        Return the unacknowledged messages in order.
+
+        Returns:
+            List[Tuple[int, Set[str], str]]: (seq, chats still waiting, text)
+        """
+        with self._lock:
+            return [
+                (seq, set(self._pending[seq]), self._texts[seq])
+                for seq in sorted(self._pending)
+            ]
+
+    # Writing -----------------------------------------------------------------
+
+    def _path(self, index: int) -> str:
+        return os.path.join(self.directory, f"segment-{index:08d}.log")
+
+    def _new_segment(self, min_size: int = 0) -> _Segment:
+        index = max(self._segments, default=0) + 1
+        segment = _Segment(
+            self._path(index), index, max(self.segment_size, min_size), create=True
+        )
+        self._segments[index] = segment
+        return segment
+
+    def _track(self, seq: int, segment: _Segment) -> None:
+        """Record that the live copy of message ``seq`` is in ``segment``."""
+        self._segment_of[seq] = segment.index
+        segment.messages.add(seq)
+        segment.total_messages += 1
+
+    def _write(self, kind: int, seq: int, payload: bytes) -> _Segment:
+        """Append an entry and return the segment it was written to."""
+        entry = _HEADER.pack(len(payload), zlib.crc32(payload), kind, seq) + payload
+        # Leave room for the zero header that marks the end of the data
+        needed = len(entry) + _HEADER.size
+        if not self._active.has_room(needed):
+            self._rotate(needed)
+            if not self._active.has_room(needed):
+                # Compaction filled the new segment; start another one
+                self._active.flush()
+                self._active = self._new_segment(needed)
+        segment = self._active
+        segment.write(entry)
+        self._maybe_flush()
+        return segment
+
+    def _rotate(self, needed: int) -> None:
+        """Start a new active segment and compact older segments."""
+        self._active.flush()
+        self._active = self._new_segment(needed)
+        if self._compacting:
+            return
+
+        # Acknowledgements in a segment may refer to messages in older ones,
+        # so segments are only deleted oldest first. Moving the oldest live
+        # messages forward lets the segments behind them go. Copying a mostly
+        # live segment only pays off if the one behind it is mostly dead.
+        older = [
+            segment
+            for index, segment in sorted(self._segments.items())
+            if segment is not self._active
+        ]
+        self._compacting = True
+        try:
+            for position, segment in enumerate(older):
+                following = older[position + 1 : position + 2]
+                if self._mostly_live(segment) and (
+                    not following or self._mostly_live(following[0])
+                ):
+                    break
+                self._compact(segment)
+        finally:
+            self._compacting = False
+        self._delete_dead_segments()
+
+    @staticmethod
+    def _mostly_live(segment: _Segment) -> bool:
+        live = len(segment.messages)
+        return bool(live) and live >= segment.total_messages * COMPACT_RATIO
+
+    def _compact(self, segment: _Segment) -> None:
+        """Copy a segment's live messages to the active segment."""
+        for seq in sorted(segment.messages):
+            payload = self._encode_message(self._pending[seq], self._texts[seq])
+            target = self._write(MESSAGE, seq, payload)
+            self._track(seq, target)
+        segment.messages.clear()
+        self._active.flush()
+
+    def _delete_dead_segments(self) -> None:
+        """Delete segments from the oldest while none of their messages is live."""
+        for index in sorted(self._segments):
+            segment = self._segments[index]
+            if segment is getattr(self, "_active", None) or segment.messages:
+                break
+            del self._segments[index]
+            segment.delete()
+
+    @staticmethod
+    def _encode_message(chats: Iterable[str], text: str) -> bytes:
+        return (_CHAT_SEPARATOR.join(chats) + _TEXT_SEPARATOR + text).encode("utf-8")
+
+    def _maybe_flush(self) -> None:
+        if self.fsync == FSYNC_ALWAYS:
+            self._active.flush()
+        elif self.fsync == FSYNC_INTERVAL:
+            now = time.monotonic()
+            if now - self._last_flush >= self.fsync_interval:
+                self._active.flush()
+                self._last_flush = now
+
+    def append(self, text: str, chat_ids: Iterable[str]) -> int:
+        """
+        Persist a message for the given chats.
+
+        Args:
+            text (str): Formatted message
+            chat_ids (Iterable[str]): Chats that should receive it
+
+        Returns:
+            int: Sequence number used to acknowledge the message
+        """
+        chats = set(chat_ids)
+        with self._lock:
+            if self._closed:
+                raise ValueError("Spool is closed")
+            seq = self._next_seq
+            self._next_seq += 1
+            segment = self._write(MESSAGE, seq, self._encode_message(chats, text))
+            # Only a message that was written is tracked
+            self._pending[seq] = chats
+            self._texts[seq] = text
+            self._track(seq, segment)
+            return seq
+
+    def ack(self, seqs: Iterable[int], chat_id: str) -> None:
+        """
+        Acknowledge messages for a chat.
+
+        Args:
+            seqs (Iterable[int]): Sequence numbers that were delivered or dropped
+            chat_id (str): Chat the acknowledgement applies to
+        """
+        payload = chat_id.encode("utf-8")
+        with self._lock:
+            if self._closed:
+                return
+            for seq in seqs:
+                chats = self._pending.get(seq)
+                if chats is None or chat_id not in chats:
+                    continue
+                # Write first: a rotation may compact this message, and the
+                # copy must still list the chat that the ACK refers to
+                self._write(ACK, seq, payload)
+                chats.discard(chat_id)
+                if not chats:
+                    self._forget(seq)
+            self._delete_dead_segments()
+
+    def _forget(self, seq: int) -> None:
+        """Drop a message that needs no further delivery."""
+        self._pending.pop(seq, None)
+        self._texts.pop(seq, None)
+        index = self._segment_of.pop(seq, None)
+        if index in self._segments:
+            self._segments[index].messages.discard(seq)
+
+    @property
+    def disk_usage(self) -> int:
+        """Total size of the segment files in bytes."""
+        return sum(segment.size for segment in self._segments.values())
+
+    def flush(self) -> None:
+        """Write the active segment to disk."""
+        with self._lock:
+            if not self._closed:
+                self._active.flush()
+                self._last_flush = time.monotonic()
+
+    def sync(self) -> None:
+        """Flush if the fsync mode says a flush is due, e.g. after writes stopped."""
+        with self._lock:
+            if not self._closed:
+                self._maybe_flush()
+
+    def close(self) -> None:
+        """Flush and close every segment."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._active.flush()
+            for segment in self._segments.values():
+                segment.close()
@@ -0,0 +1,127 @@
+"""
+Pluggable record stages that run before a record is formatted.
+
+A stage sees every record ``TelegramHandler.emit`` receives and decides
+whether it is sent. Records a stage rejects are never formatted or queued,
+so suppressing them costs next to nothing; the stage only counts them under
+a short label, and the handler adds a summary of the counts to the next
+batch it delivers.
+
+Custom stages subclass ``RecordStage``, call ``super().__init__()`` and
+implement :meth:`RecordStage.admit` (and optionally
+:meth:`RecordStage.describe`).
+"""
+
+import logging
+import random
+from collections import Counter, OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from .ratelimit import TokenBucket
+
+
+class RecordStage:
+    """Base class for stages that may suppress records before formatting."""
+
+    def __init__(self):
+        self._suppressed: Counter = Counter()
+        self._suppressed_lock = Lock()
+
+    def admit(self, record: logging.LogRecord) -> bool:
+        """Return True if the record should be sent."""
+        raise NotImplementedError
+
+    def describe(self, record: logging.LogRecord) -> str:
+        """Return the label a suppressed record is counted under."""
+        return type(self).__name__
+
+    def __call__(self, record: logging.LogRecord) -> bool:
+        """Run the stage, counting the record if it is suppressed."""
+        if self.admit(record):
+            return True
+        label = self.describe(record)
+        with self._suppressed_lock:
+            self._suppressed[label] += 1
+        return False
+
+    def drain_suppressed(self) -> Dict[str, int]:
+        """Return the suppressed counts since the last call and reset them."""
+        with self._suppressed_lock:
+            suppressed, self._suppressed = self._suppressed, Counter()
+        return dict(suppressed)
+
+
+class FingerprintRateLimit(RecordStage):
+    """Sends at most ``max_records`` per ``period`` for each logger and message template."""
+
+    def __init__(
+        self, max_records: int, period: float = 60.0, max_fingerprints: int = 1000
+    ):
+        """
+        Initialize the stage.
+
+        Args:
+            max_records (int): Records allowed per fingerprint within ``period``
+            period (float): Length of the period (seconds)
+            max_fingerprints (int): Maximum number of fingerprints tracked; the least
+                recently seen one is forgotten to make room
+        """
+        super().__init__()
+        self.max_records = max(1, max_records)
+        self.period = max(0.001, period)
+        self.max_fingerprints = max(1, max_fingerprints)
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def fingerprint(record: logging.LogRecord) -> Tuple[str, str]:
+        return record.name, str(record.msg)
+
+    def admit(self, record: logging.LogRecord) -> bool:
+        key = self.fingerprint(record)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_fingerprints:
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[key] = TokenBucket(
+                    self.max_records / self.period, self.max_records
+                )
+            else:
+                self._buckets.move_to_end(key)
+            now = record.created
+            if bucket.earliest(now) > now:
+                return False
+            bucket.consume(now)
+            return True
+
+    def describe(self, record: logging.LogRecord) -> str:
+        name, template = self.fingerprint(record)
+        if len(template) > 60:
+            template = template[:59] + "…"
+        return f"rate limit, {name}: {template}"
+
+
+class LevelSampler(RecordStage):
+    """Sends each record of a level with a fixed probability."""
+
+    def __init__(self, rates: Dict[int, float], rng: Optional[random.Random] = None):
+        """
+        Initialize the stage.
+
+        Args:
+            rates (Dict[int, float]): Share of records kept per level, e.g.
+                ``{logging.DEBUG: 0.01, logging.INFO: 0.1}``; other levels are kept
+            rng (random.Random): Random number generator, e.g. seeded for tests
+        """
+        super().__init__()
+        self.rates = {level: min(1.0, max(0.0, rate)) for level, rate in rates.items()}
+        self._random = (rng or random.Random()).random
+
+    def admit(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno)
+        return rate is None or rate >= 1.0 or self._random() < rate
+
+    def describe(self, record: logging.LogRecord) -> str:
+        return f"sampling, {record.levelname}"
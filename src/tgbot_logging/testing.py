@@ -0,0 +1,321 @@
+"""
+A local stand-in for the Telegram Bot API, for tests and benchmarks.
+
+``FakeBotAPI`` runs an HTTP server on a background thread and implements
+``getMe``, ``sendMessage``, ``sendDocument``, ``editMessageText`` and
+``pinChatMessage`` (plus no-op ``close`` and ``logOut``) well enough for
+python-telegram-bot. It can add latency and inject ``429 Too Many
+Requests`` and server errors, and it records every call::
+
+    with FakeBotAPI(latency=0.05, retry_after_rate=0.01) as api:
+        handler = TelegramHandler(token=api.token, chat_ids="1", base_url=api.base_url)
+        ...
+        print(len(api.messages), api.calls["sendMessage"])
+"""
+
+import json
+import random
+import time
+import zlib
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import parse_qsl
+
+DEFAULT_TOKEN = "123456:TEST-token"
+
+# Telegram's descriptions of injected server errors
+_SERVER_ERRORS = {500: "Internal Server Error", 502: "Bad Gateway"}
+
+
+class SentMessage(NamedTuple):
+    """A message or document the fake API accepted."""
+
+    chat_id: str
+    text: str  # message text, or the caption of a document
+    parse_mode: Optional[str]
+    received: float  # time.time() when it was accepted
+    filename: Optional[str] = None  # documents only
+    document: Optional[bytes] = None  # documents only
+
+
+def _chat(chat_id: str) -> Dict[str, Any]:
+    if chat_id.lstrip("-").isdigit():
+        return {"id": int(chat_id), "type": "private", "first_name": "Test"}
+    # Channel usernames such as @logs get a stable numeric ID
+    return {
+        "id": -1000000000000 - zlib.crc32(chat_id.encode()),
+        "type": "channel",
+        "username": chat_id.lstrip("@"),
+        "title": chat_id,
+    }
+
+
+class FakeBotAPI:
+    """An in-process Bot API server with configurable latency and faults."""
+
+    def __init__(
+        self,
+        latency: Union[float, Callable[[], float]] = 0.0,
+        retry_after_rate: float = 0.0,
+        retry_after: int = 1,
+        error_rate: float = 0.0,
+        error_status: int = 502,
+        token: str = DEFAULT_TOKEN,
+        seed: Optional[int] = None,
+    ):
+        """
+        Initialize the server; call :meth:`start` or use it as a context manager.
+
+        Args:
+            latency (Union[float, Callable]): Seconds each call takes, or a function
+                returning them, e.g. ``lambda: random.expovariate(20)``
+            retry_after_rate (float): Share of sends answered with 429
+            retry_after (int): ``retry_after`` of injected 429 responses (seconds)
+            error_rate (float): Share of sends answered with a server error
+            error_status (int): Status of injected server errors (500 or 502)
+            token (str): Bot token accepted by the server; others get 401
+            seed (int): Seed for the fault injection, for reproducible runs
+        """
+        self.latency = latency
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.token = token
+        self.messages: List[SentMessage] = []
+        self.edits: Dict[Tuple[str, int], str] = {}  # latest text per edited message
+        self.pinned: Dict[str, int] = {}  # pinned message ID per chat
+        self.calls: Counter = Counter()
+        self._scripted: List[Tuple[int, Optional[int]]] = []
+        self._random = random.Random(seed)
+        self._lock = Lock()
+        self._next_message_id = 1
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """Base URL to pass to ``TelegramHandler`` or ``Bot``."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self) -> "FakeBotAPI":
+        """Start serving on a free local port."""
+        api = self
+
+        class RequestHandler(_RequestHandler):
+            fake = api
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeBotAPI":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+    def fail_next(
+        self, status: int = 429, count: int = 1, retry_after: Optional[int] = None
+    ) -> None:
+        """
+        Answer the next sends with an error, before any random faults.
+
+        Args:
+            status (int): 429 or a server error status
+            count (int): Number of sends to fail
+            retry_after (int): ``retry_after`` for 429 (default: ``self.retry_after``)
+        """
+        with self._lock:
+            self._scripted.extend([(status, retry_after)] * count)
+
+    @property
+    def api_calls(self) -> int:
+        """Number of calls received, including rejected ones."""
+        with self._lock:
+            return sum(self.calls.values())
+
+    def _fault(self) -> Optional[Tuple[int, Optional[int]]]:
+        """Pick the error for the current send, if any."""
+        with self._lock:
+            if self._scripted:
+                return self._scripted.pop(0)
+            roll = self._random.random()
+        if roll < self.retry_after_rate:
+            return 429, None
+        if roll < self.retry_after_rate + self.error_rate:
+            return self.error_status, None
+        return None
+
+    def _message(self, chat_id: str, text: str, **fields: Any) -> Dict[str, Any]:
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            **fields,
+            **({"text": text} if "document" not in fields else {}),
+        }
+
+    def handle(
+        self, token: str, method: str, params: Dict[str, Any]
+    ) -> Tuple[int, Dict[str, Any]]:
+        """Answer one API call with an HTTP status and a JSON body."""
+        with self._lock:
+            self.calls[method] += 1
+        delay = self.latency() if callable(self.latency) else self.latency
+        if delay > 0:
+            time.sleep(delay)
+
+        if token != self.token:
+            return 401, {"ok": False, "error_code": 401, "description": "Unauthorized"}
+        if method == "getMe":
+            return 200, {
+                "ok": True,
+                "result": {
+                    "id": int(self.token.split(":")[0]),
+                    "is_bot": True,
+                    "first_name": "Fake Bot",
+                    "username": "fake_bot",
+                },
+            }
+        if method in ("close", "logOut"):
+            return 200, {"ok": True, "result": True}
+        if method == "pinChatMessage":
+            with self._lock:
+                self.pinned[str(params.get("chat_id"))] = int(params["message_id"])
+            return 200, {"ok": True, "result": True}
+        if method not in ("sendMessage", "sendDocument", "editMessageText"):
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+        fault = self._fault()
+        if fault is not None:
+            status, retry_after = fault
+            if status == 429:
+                retry_after = self.retry_after if retry_after is None else retry_after
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }
+            description = _SERVER_ERRORS.get(status, "Server Error")
+            return status, {
+                "ok": False,
+                "error_code": status,
+                "description": description,
+            }
+
+        chat_id = str(params.get("chat_id", ""))
+        parse_mode = params.get("parse_mode")
+        if method == "editMessageText":
+            message_id = int(params["message_id"])
+            text = str(params.get("text", ""))
+            with self._lock:
+                if self.edits.get((chat_id, message_id)) == text:
+                    return 400, {
+                        "ok": False,
+                        "error_code": 400,
+                        "description": "Bad Request: message is not modified",
+                    }
+                self.edits[(chat_id, message_id)] = text
+            result = self._message(chat_id, text)
+            result["message_id"] = message_id
+            return 200, {"ok": True, "result": result}
+        if method == "sendMessage":
+            text = str(params.get("text", ""))
+            sent = SentMessage(chat_id, text, parse_mode, time.time())
+            result = self._message(chat_id, text)
+        else:
+            filename, content = params.get("document") or ("document", b"")
+            caption = str(params.get("caption", ""))
+            sent = SentMessage(
+                chat_id, caption, parse_mode, time.time(), filename, content
+            )
+            result = self._message(
+                chat_id,
+                caption,
+                caption=caption,
+                document={
+                    "file_id": f"file{len(self.messages)}",
+                    "file_unique_id": f"unique{len(self.messages)}",
+                    "file_name": filename,
+                    "file_size": len(content),
+                },
+            )
+        with self._lock:
+            self.messages.append(sent)
+        return 200, {"ok": True, "result": result}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Routes ``/bot<token>/<method>`` requests to a ``FakeBotAPI``."""
+
+    fake: FakeBotAPI
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this a kept-alive
+    # connection waits for a delayed ACK after every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _params(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + body
+            )
+            params: Dict[str, Any] = {}
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                filename = part.get_filename()
+                payload = part.get_payload(decode=True) or b""
+                if filename is not None:
+                    params[name] = (filename, payload)
+                else:
+                    params[name] = payload.decode("utf-8")
+            return params
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        return dict(parse_qsl(body.decode("utf-8")))
+
+    def _handle(self) -> None:
+        try:
+            _, prefix, method = self.path.split("?")[0].split("/", 2)
+            if not prefix.startswith("bot"):
+                raise ValueError(self.path)
+            status, response = self.fake.handle(prefix[3:], method, self._params())
+        except Exception as e:
+            status, response = 400, {
+                "ok": False,
+                "error_code": 400,
+                "description": f"Bad Request: {str(e)}",
+            }
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _handle
+    do_POST = _handle
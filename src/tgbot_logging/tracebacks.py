@@ -0,0 +1,254 @@
+"""
+Fingerprinting and aggregation of repeated exceptions.
+
+The same exception raised from the same place is usually logged with a
+different message each time (``Payment #41 failed``, ``Payment #42 failed``),
+so it slips through coalescing and every occurrence pays for a full
+``formatException`` and a full message. ``ExceptionTracker`` fingerprints
+exceptions by type and normalized stack (file, function and line of each
+frame, following chained exceptions) instead. The first occurrence of a
+fingerprint is sent in full, tagged with a hashtag derived from the
+fingerprint; repeats are only counted, and once per window the handler sends
+a one-line reference carrying the counts and first and last seen times.
+"""
+
+import hashlib
+import logging
+import re
+import time
+import traceback
+from collections import OrderedDict
+from threading import Lock
+from typing import List, NamedTuple, Optional
+
+# Longest chain of causes and contexts that is fingerprinted
+MAX_CHAIN = 16
+MAX_SUMMARY_LENGTH = 200
+
+_TEXT_FRAME = re.compile(r'^  File "(.*)", line (\d+), in (.*)$')
+_TEXT_MARKERS = (
+    "Traceback (most recent call last):",
+    "During handling of the above exception, another exception occurred:",
+    "The above exception was the direct cause of the following exception:",
+)
+
+
+def _type_name(exc_type: type) -> str:
+    """Name an exception type the way tracebacks print it."""
+    name = exc_type.__qualname__
+    if exc_type.__module__ not in ("__main__", "builtins"):
+        name = f"{exc_type.__module__}.{name}"
+    return name
+
+
+def _stack_from_exception(exc: BaseException) -> List[str]:
+    """Return the normalized frames and types of an exception chain, causes first."""
+    chain = []
+    seen = set()
+    while exc is not None and id(exc) not in seen and len(chain) < MAX_CHAIN:
+        seen.add(id(exc))
+        chain.append(exc)
+        exc = exc.__cause__ or (None if exc.__suppress_context__ else exc.__context__)
+
+    parts = []
+    for exc in reversed(chain):
+        for frame, lineno in traceback.walk_tb(exc.__traceback__):
+            code = frame.f_code
+            parts.append(f"{code.co_filename}:{code.co_name}:{lineno}")
+        parts.append(_type_name(type(exc)))
+    return parts
+
+
+def _stack_from_text(text: str) -> List[str]:
+    """Return the normalized frames and types of a formatted traceback."""
+    parts = []
+    expect_type = False
+    for line in text.splitlines():
+        match = _TEXT_FRAME.match(line)
+        if match:
+            filename, lineno, function = match.groups()
+            parts.append(f"{filename}:{function}:{lineno}")
+            expect_type = True
+        elif line in _TEXT_MARKERS:
+            expect_type = True
+        elif expect_type and line and not line[0].isspace():
+            # Only the type counts, the message may vary between repeats
+            parts.append(line.split(":", 1)[0])
+            expect_type = False
+    return parts
+
+
+def exception_fingerprint(record: logging.LogRecord) -> Optional[str]:
+    """
+    Return the fingerprint of a record's exception.
+
+    Records forwarded from other processes only carry the formatted
+    traceback, which is fingerprinted from its text with the same result.
+
+    Args:
+        record (logging.LogRecord): Record with ``exc_info`` or ``exc_text``
+
+    Returns:
+        Optional[str]: Eight hex digits, or None if there is no exception
+    """
+    exc = record.exc_info[1] if record.exc_info else None
+    if exc is not None:
+        parts = _stack_from_exception(exc)
+    elif record.exc_text:
+        parts = _stack_from_text(record.exc_text)
+    else:
+        return None
+    if not parts:
+        return None
+    digest = hashlib.blake2b("\n".join(parts).encode("utf-8"), digest_size=4)
+    return digest.hexdigest()
+
+
+def exception_summary(record: logging.LogRecord) -> str:
+    """Return the exception's type and message on one line, e.g. for references."""
+    exc = record.exc_info[1] if record.exc_info else None
+    if exc is not None:
+        text = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+    else:
+        lines = [line for line in (record.exc_text or "").splitlines() if line]
+        text = lines[-1] if lines else ""
+    text = text.splitlines()[0] if text else record.getMessage()
+    if len(text) > MAX_SUMMARY_LENGTH:
+        text = text[: MAX_SUMMARY_LENGTH - 1] + "…"
+    return text
+
+
+class ExceptionRepeats(NamedTuple):
+    """Repeats of one exception fingerprint within a window."""
+
+    record: logging.LogRecord  # the most recent record
+    fingerprint: str
+    count: int  # repeats in the window
+    total: int  # occurrences since the fingerprint was first seen
+    first_seen: float  # ``record.created`` of the first occurrence, sent in full
+    last_seen: float  # ``record.created`` of the most recent record
+
+
+class _Entry:
+    __slots__ = ("record", "total", "first_seen", "last_seen", "pending", "expires")
+
+    def __init__(self, record: logging.LogRecord):
+        self.record = record
+        self.total = 1
+        self.first_seen = self.last_seen = record.created
+        self.pending = 0
+        self.expires = 0.0
+
+    def repeats(self, fingerprint: str) -> ExceptionRepeats:
+        return ExceptionRepeats(
+            self.record,
+            fingerprint,
+            self.pending,
+            self.total,
+            self.first_seen,
+            self.last_seen,
+        )
+
+
+class ExceptionTracker:
+    """Sends each distinct exception once and aggregates its repeats."""
+
+    def __init__(self, window: float = 60.0, max_fingerprints: int = 1000):
+        """
+        Initialize the tracker.
+
+        Args:
+            window (float): How long repeats are aggregated into one reference,
+                counted from the first repeat (seconds)
+            max_fingerprints (int): Maximum number of fingerprints remembered; the
+                least recently seen is forgotten, and sent in full if it comes back
+        """
+        self.window = max(0.0, window)
+        self.max_fingerprints = max(1, max_fingerprints)
+        self.suppressed = 0
+        # Least recently seen first
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Fingerprints with repeats; every window has the same length, so
+        # insertion order is expiry order
+        self._open: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._closed: List[ExceptionRepeats] = []
+        self._lock = Lock()
+
+    def admit(self, record: logging.LogRecord) -> bool:
+        """
+        Track a record and decide whether it should be sent now.
+
+        The fingerprint is stored on the record as ``exc_fingerprint``.
+
+        Args:
+            record (logging.LogRecord): Incoming record
+
+        Returns:
+            bool: True for records without an exception and for the first
+            occurrence of a fingerprint, False for a repeat
+        """
+        fingerprint = exception_fingerprint(record)
+        if fingerprint is None:
+            return True
+        record.exc_fingerprint = fingerprint
+
+        with self._lock:
+            self._expire(record.created)
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                if len(self._entries) >= self.max_fingerprints:
+                    self._forget(next(iter(self._entries)))
+                self._entries[fingerprint] = _Entry(record)
+                return True
+
+            self._entries.move_to_end(fingerprint)
+            entry.record = record
+            entry.total += 1
+            entry.last_seen = max(entry.last_seen, record.created)
+            if not entry.pending:
+                entry.expires = record.created + self.window
+                self._open[fingerprint] = entry
+            entry.pending += 1
+            self.suppressed += 1
+            return False
+
+    def _close(self, fingerprint: str) -> None:
+        """End the window for ``fingerprint`` and keep its repeats."""
+        entry = self._open.pop(fingerprint)
+        self._closed.append(entry.repeats(fingerprint))
+        entry.pending = 0
+
+    def _forget(self, fingerprint: str) -> None:
+        if fingerprint in self._open:
+            self._close(fingerprint)
+        del self._entries[fingerprint]
+
+    def _expire(self, now: float) -> None:
+        while self._open:
+            fingerprint, entry = next(iter(self._open.items()))
+            if entry.expires > now:
+                break
+            self._close(fingerprint)
+
+    def collect(self, now: Optional[float] = None) -> List[ExceptionRepeats]:
+        """
+        Return the repeats of windows that have closed since the last call.
+
+        Args:
+            now (float): Current time, defaults to ``time.time()``
+
+        Returns:
+            List[ExceptionRepeats]: One entry per window, oldest first
+        """
+        with self._lock:
+            self._expire(time.time() if now is None else now)
+            closed, self._closed = self._closed, []
+            return closed
+
+    def collect_all(self) -> List[ExceptionRepeats]:
+        """Close every open window and return the repeats, e.g. on shutdown."""
+        with self._lock:
+            while self._open:
+                self._close(next(iter(self._open)))
+            closed, self._closed = self._closed, []
+            return closed
@@ -0,0 +1,81 @@
+"""
+Pooled HTTP transport for the Bot client.
+
+python-telegram-bot's default request object keeps a single connection and
+does not expose keep-alive settings. ``PooledHTTPXRequest`` adds a
+configurable pool size and keep-alive expiry on top of ``HTTPXRequest``,
+passed through its ``httpx_kwargs``, so bursts of log messages reuse warm
+TLS connections instead of paying for a new handshake each time.
+"""
+
+from typing import Optional
+
+import httpx
+from telegram.request import HTTPXRequest
+
+DEFAULT_BASE_URL = "https://api.telegram.org/bot"
+DEFAULT_POOL_SIZE = 8
+DEFAULT_KEEPALIVE_EXPIRY = 30.0  # seconds
+
+
+def http2_available() -> bool:
+    """Return True if the ``h2`` package needed for HTTP/2 is installed."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PooledHTTPXRequest(HTTPXRequest):
+    """``HTTPXRequest`` with a tunable connection pool and keep-alive expiry."""
+
+    def __init__(
+        self,
+        connection_pool_size: int = DEFAULT_POOL_SIZE,
+        keepalive_expiry: Optional[float] = DEFAULT_KEEPALIVE_EXPIRY,
+        connect_timeout: Optional[float] = 5.0,
+        read_timeout: Optional[float] = 5.0,
+        write_timeout: Optional[float] = 5.0,
+        pool_timeout: Optional[float] = 1.0,
+        http2: bool = False,
+    ):
+        """
+        Initialize the request object.
+
+        Args:
+            connection_pool_size (int): Maximum number of open connections
+            keepalive_expiry (float): Seconds an idle connection is kept open, None for no limit
+            connect_timeout (float): Timeout for establishing a connection (seconds)
+            read_timeout (float): Timeout for reading a response (seconds)
+            write_timeout (float): Timeout for sending a request (seconds)
+            pool_timeout (float): Timeout for getting a connection from the pool (seconds)
+            http2 (bool): Use HTTP/2; falls back to HTTP/1.1 if ``h2`` is not installed
+        """
+        if http2 and not http2_available():
+            print(
+                "HTTP/2 requested but the h2 package is not installed, "
+                "falling back to HTTP/1.1 (pip install 'python-telegram-bot[http2]')"
+            )
+            http2 = False
+
+        self.connection_pool_size = max(1, connection_pool_size)
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+
+        super().__init__(
+            connection_pool_size=self.connection_pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            pool_timeout=pool_timeout,
+            http_version="2" if http2 else "1.1",
+            # HTTPXRequest builds its limits without a keep-alive expiry
+            httpx_kwargs={
+                "limits": httpx.Limits(
+                    max_connections=self.connection_pool_size,
+                    max_keepalive_connections=self.connection_pool_size,
+                    keepalive_expiry=keepalive_expiry,
+                )
+            },
+        )
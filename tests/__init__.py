@@ -0,0 +1,3 @@
+"""
+Tests for tgbot_logging.
+"""
@@ -0,0 +1,30 @@
+"""
+Helpers shared by the tests.
+"""
+
+import logging
+
+
+def make_record(
+    msg="Test message",
+    args=(),
+    level=logging.INFO,
+    name="test",
+    created=None,
+    exc_info=None,
+    pathname="test.py",
+    lineno=1,
+):
+    """Create a log record, optionally with a fixed creation time."""
+    record = logging.LogRecord(
+        name=name,
+        level=level,
+        pathname=pathname,
+        lineno=lineno,
+        msg=msg,
+        args=args,
+        exc_info=exc_info,
+    )
+    if created is not None:
+        record.created = created
+    return record
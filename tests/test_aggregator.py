@@ -0,0 +1,275 @@
+"""
+Tests for forwarding records from worker processes to a per-host aggregator.
+"""
+
+import json
+import logging
+from functools import partial
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import time
+import pytest
+from tgbot_logging import TelegramHandler
+from tgbot_logging.aggregator import (
+    FIELDS,
+    MAX_FRAME_SIZE,
+    MAX_TEXT_LENGTH,
+    Aggregator,
+    ForwardingHandler,
+    decode_record,
+    encode_record,
+)
+from tests.helpers import make_record
+
+billing_record = partial(
+    make_record,
+    msg="Payment %s failed",
+    args=("#42",),
+    level=logging.ERROR,
+    name="billing",
+    pathname="/app/billing.py",
+    lineno=17,
+)
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Unix sockets are not available"
+)
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+
+def forward_from_worker(socket_path, count):
+    handler = ForwardingHandler(socket_path)
+    logger = logging.getLogger(f"worker.{os.getpid()}")
+    logger.propagate = False
+    logger.addHandler(handler)
+    for i in range(count):
+        logger.error("Worker message %d", i)
+    handler.close()
+
+
+def round_trip(record):
+    # Strip the frame's length header
+    return decode_record(encode_record(record)[4:])
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "telegram.sock")
+
+
+def test_encode_round_trip():
+    """Test that a decoded record keeps the attributes used for rendering."""
+    try:
+        raise ValueError("card declined")
+    except ValueError:
+        record = billing_record(exc_info=sys.exc_info())
+
+    decoded = round_trip(record)
+
+    assert decoded.getMessage() == "Payment #42 failed"
+    assert decoded.args is None and decoded.exc_info is None
+    for field in ("name", "levelno", "levelname", "created", "lineno", "process"):
+        assert getattr(decoded, field) == getattr(record, field)
+    assert decoded.exc_text.startswith("Traceback")
+    assert "ValueError: card declined" in decoded.exc_text
+
+
+def test_long_text_is_truncated():
+    """Test that huge messages are cut to keep frames bounded."""
+    record = billing_record(msg="x" * (MAX_TEXT_LENGTH * 2), args=())
+    decoded = round_trip(record)
+    assert len(decoded.msg) == MAX_TEXT_LENGTH
+    assert decoded.msg.endswith("…")
+
+
+def test_extras_are_forwarded():
+    """Test that attributes passed in extra survive if they are JSON values."""
+    record = billing_record()
+    record.request_id = "req-7"
+    record.user = {"id": 1, "roles": ("admin",)}
+    record.connection = object()
+
+    decoded = round_trip(record)
+
+    assert decoded.request_id == "req-7"
+    assert decoded.user == {"id": 1, "roles": ["admin"]}
+    assert not hasattr(decoded, "connection")
+
+
+def test_oversized_extras_are_left_out():
+    """Test that a record whose extras overflow a frame is sent without them."""
+    record = billing_record()
+    record.payload = "x" * MAX_FRAME_SIZE
+
+    frame = encode_record(record)
+    decoded = decode_record(frame[4:])
+
+    assert len(frame) <= MAX_FRAME_SIZE + 4
+    assert decoded.getMessage() == "Payment #42 failed"
+    assert not hasattr(decoded, "payload")
+
+
+def test_decode_accepts_version_1():
+    """Test that frames without extras from older workers are still read."""
+    values = [getattr(billing_record(), field) for field in FIELDS]
+    decoded = decode_record(b"\x01" + json.dumps(values, default=str).encode())
+    assert decoded.name == "billing" and decoded.lineno == 17
+
+
+def test_decode_rejects_garbage():
+    """Test that payloads of unknown versions are rejected."""
+    with pytest.raises(ValueError):
+        decode_record(b"\x07[]")
+    with pytest.raises(ValueError):
+        decode_record(b"\x01[1, 2]")
+
+
+def test_records_reach_the_handler(socket_path):
+    """Test that forwarded records are handed to the aggregator's handler."""
+    target = CollectingHandler()
+    aggregator = Aggregator(target, socket_path).start()
+    forwarder = ForwardingHandler(socket_path)
+    try:
+        for i in range(500):
+            forwarder.handle(billing_record(args=(f"#{i}",)))
+        wait_for(lambda: len(target.records) == 500)
+        assert [record.getMessage() for record in target.records[:2]] == [
+            "Payment #0 failed",
+            "Payment #1 failed",
+        ]
+        assert aggregator.received == 500
+        assert forwarder.dropped_records == 0
+    finally:
+        forwarder.close()
+        aggregator.close()
+    assert not os.path.exists(socket_path)
+
+
+def test_oversized_frame_is_skipped(socket_path):
+    """Test that a frame over the limit is discarded without closing the connection."""
+    target = CollectingHandler()
+    aggregator = Aggregator(target, socket_path).start()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        length = MAX_FRAME_SIZE * 2 + 3
+        sock.sendall(struct.pack(">I", length) + b"x" * length)
+        sock.sendall(encode_record(billing_record()))
+        wait_for(lambda: aggregator.received == 1)
+        assert aggregator.invalid == 1
+        assert target.records[0].getMessage() == "Payment #42 failed"
+    finally:
+        sock.close()
+        aggregator.close()
+
+
+def test_handler_level_applies(socket_path):
+    """Test that the aggregator's handler filters forwarded records by level."""
+    target = CollectingHandler()
+    target.setLevel(logging.CRITICAL)
+    aggregator = Aggregator(target, socket_path).start()
+    forwarder = ForwardingHandler(socket_path)
+    try:
+        forwarder.handle(billing_record())
+        wait_for(lambda: aggregator.received == 1)
+        assert target.records == []
+    finally:
+        forwarder.close()
+        aggregator.close()
+
+
+def test_forwarding_without_aggregator_drops(socket_path, capsys):
+    """Test that records are dropped when nobody listens."""
+    forwarder = ForwardingHandler(socket_path)
+    for _ in range(3):
+        forwarder.handle(billing_record())
+    forwarder.close()
+
+    assert forwarder.dropped_records == 3
+    # The outage is reported once, not per record
+    assert capsys.readouterr().out.count("Error forwarding records") == 1
+
+
+def test_stale_socket_is_replaced(socket_path):
+    """Test that a socket file left by a crashed aggregator is reused."""
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+
+    aggregator = Aggregator(CollectingHandler(), socket_path)
+    aggregator.close()
+
+
+def test_second_aggregator_is_refused(socket_path):
+    """Test that only one aggregator can listen on a path."""
+    aggregator = Aggregator(CollectingHandler(), socket_path)
+    try:
+        with pytest.raises(OSError):
+            Aggregator(CollectingHandler(), socket_path)
+    finally:
+        aggregator.close()
+
+
+@pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(), reason="Needs fork"
+)
+def test_records_from_several_processes(socket_path):
+    """Test that one aggregator collects the records of several worker processes."""
+    target = CollectingHandler()
+    aggregator = Aggregator(target, socket_path).start()
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=forward_from_worker, args=(socket_path, 20))
+        for _ in range(3)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=10)
+        wait_for(lambda: len(target.records) == 60)
+        assert len({record.process for record in target.records}) == 3
+    finally:
+        aggregator.close()
+
+
+def test_telegram_handler_coalesces_across_workers(socket_path):
+    """Test that the aggregating TelegramHandler deduplicates forwarded records."""
+    handler = TelegramHandler(
+        token="test_token",
+        chat_ids="123456789",
+        coalesce_window=60,
+        test_mode=True,
+    )
+    aggregator = Aggregator(handler, socket_path).start()
+    forwarders = [ForwardingHandler(socket_path) for _ in range(3)]
+    try:
+        for forwarder in forwarders:
+            for _ in range(10):
+                forwarder.handle(billing_record())
+        wait_for(lambda: aggregator.received == 30)
+        assert handler.message_queue["123456789"].qsize() == 1
+        assert handler._coalescer.suppressed == 29
+    finally:
+        for forwarder in forwarders:
+            forwarder.close()
+        aggregator.close()
@@ -0,0 +1,64 @@
+"""
+Tests for the adaptive batch window.
+"""
+
+import pytest
+from tgbot_logging.batching import AdaptiveBatcher
+
+
+def test_quiet_traffic_is_not_held():
+    """Test that sparse records are sent without waiting."""
+    batcher = AdaptiveBatcher(max_batch_size=50, max_window=1.0)
+    assert batcher.window(now=0) == 0.0
+
+    for t in range(0, 100, 10):
+        batcher.observe_arrival(now=t)
+    assert batcher.window(now=100) == 0.0
+
+
+def test_burst_widens_window_to_fill_a_batch():
+    """Test that the window grows to the time a full batch takes to arrive."""
+    batcher = AdaptiveBatcher(max_batch_size=50, max_window=5.0, time_constant=1.0)
+    for i in range(1000):
+        batcher.observe_arrival(now=i / 100)
+
+    rate = batcher.arrival_rate(now=10)
+    assert rate == pytest.approx(100, rel=0.05)
+    assert batcher.window(now=10) == pytest.approx(50 / rate)
+
+
+def test_window_is_capped():
+    """Test that moderate traffic is held for at most max_window."""
+    batcher = AdaptiveBatcher(max_batch_size=50, max_window=1.0, time_constant=1.0)
+    for i in range(100):
+        batcher.observe_arrival(now=i / 5)
+    assert batcher.window(now=20) == 1.0
+
+
+def test_rate_decays_when_traffic_stops():
+    """Test that the estimate falls back once a burst is over."""
+    batcher = AdaptiveBatcher(max_batch_size=50, max_window=1.0, time_constant=1.0)
+    for i in range(500):
+        batcher.observe_arrival(now=i / 100)
+    assert batcher.window(now=5) > 0
+
+    assert batcher.arrival_rate(now=20) < 0.01
+    assert batcher.window(now=20) == 0.0
+
+
+def test_throttling_pushes_window_up_and_decays():
+    """Test the RetryAfter feedback."""
+    batcher = AdaptiveBatcher(max_batch_size=50, max_window=2.0)
+    batcher.observe_throttle()
+    assert batcher.window(now=0) == pytest.approx(1.0)
+    batcher.observe_throttle()
+    assert batcher.window(now=0) == pytest.approx(1.5)
+
+    for _ in range(100):
+        batcher.observe_success()
+    assert batcher.throttle == 1.0
+    assert batcher.window(now=0) == 0.0
+
+    for _ in range(10):
+        batcher.observe_throttle()
+    assert batcher.window(now=0) < 2.0
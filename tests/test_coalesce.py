@@ -0,0 +1,86 @@
+"""
+Tests for duplicate record coalescing.
+"""
+
+import logging
+from functools import partial
+from tgbot_logging.coalesce import Coalescer
+from tests.helpers import make_record
+
+db_error = partial(
+    make_record,
+    msg="Connection to %s failed",
+    args=("db",),
+    level=logging.ERROR,
+    name="app",
+    created=0.0,
+)
+
+
+def test_first_record_passes_and_repeats_are_counted():
+    """Test that only the first record of a window is admitted."""
+    coalescer = Coalescer(window=60)
+    assert coalescer.admit(db_error(created=0))
+    for i in range(1, 1284):
+        assert not coalescer.admit(db_error(args=(f"db{i}",), created=i / 100))
+
+    assert coalescer.suppressed == 1283
+    assert coalescer.collect(now=30) == []
+
+    [summary] = coalescer.collect(now=61)
+    assert summary.count == 1284
+    assert summary.first_seen == 0
+    assert summary.last_seen == 12.83
+    assert summary.record.args == ("db1283",)
+
+
+def test_fingerprint_uses_logger_level_and_template():
+    """Test that records only coalesce with the same logger, level and template."""
+    coalescer = Coalescer(window=60)
+    assert coalescer.admit(db_error())
+    assert coalescer.admit(db_error(level=logging.WARNING))
+    assert coalescer.admit(db_error(name="other"))
+    assert coalescer.admit(db_error(msg="Different template"))
+    assert not coalescer.admit(db_error(args=("cache",)))
+
+
+def test_new_window_after_expiry():
+    """Test that a record after the window starts a new one and is admitted."""
+    coalescer = Coalescer(window=10)
+    assert coalescer.admit(db_error(created=0))
+    assert not coalescer.admit(db_error(created=5))
+    assert coalescer.admit(db_error(created=11))
+
+    [summary] = coalescer.collect(now=11)
+    assert summary.count == 2
+
+
+def test_single_records_produce_no_summary():
+    """Test that windows without repeats close silently."""
+    coalescer = Coalescer(window=10)
+    coalescer.admit(db_error(created=0))
+    assert coalescer.collect(now=20) == []
+
+
+def test_max_fingerprints_closes_oldest_window():
+    """Test that the number of tracked fingerprints is bounded."""
+    coalescer = Coalescer(window=60, max_fingerprints=2)
+    coalescer.admit(db_error(msg="a", created=0))
+    coalescer.admit(db_error(msg="a", created=1))
+    coalescer.admit(db_error(msg="b", created=2))
+    coalescer.admit(db_error(msg="c", created=3))
+
+    [summary] = coalescer.collect(now=4)
+    assert summary.record.msg == "a"
+    assert len(coalescer._entries) == 2
+
+
+def test_collect_all_closes_open_windows():
+    """Test that pending repeats are reported on shutdown."""
+    coalescer = Coalescer(window=60)
+    for i in range(3):
+        coalescer.admit(db_error(created=i))
+
+    [summary] = coalescer.collect_all()
+    assert summary.count == 3
+    assert coalescer.collect_all() == []
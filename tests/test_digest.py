@@ -0,0 +1,102 @@
+"""
+Tests for periodic digests.
+"""
+
+import logging
+from functools import partial
+from tgbot_logging.digest import Digest, format_digest
+from tests.helpers import make_record
+
+http_record = partial(make_record, name="app.http", created=0.0)
+
+
+def test_counts_templates_and_samples():
+    """Test that a digest counts per level and logger and ranks templates."""
+    digest = Digest(samples=2)
+    for i in range(30):
+        assert not digest.add(http_record("Request %s took %dms", (f"/api/{i}", i)))
+    for _ in range(5):
+        digest.add(http_record("Slow query", (), logging.WARNING, name="app.db"))
+
+    summary = digest.collect(now=60)
+    assert summary.total == 35
+    assert summary.counts == {
+        logging.INFO: {"app.http": 30},
+        logging.WARNING: {"app.db": 5},
+    }
+    assert [(t.template, t.count, t.error) for t in summary.templates] == [
+        ("Request %s took %dms", 30, 0),
+        ("Slow query", 5, 0),
+    ]
+    assert len(summary.samples) == 2
+    assert all(
+        sample.startswith(("INFO app.http: Request /api/", "WARNING app.db"))
+        for sample in summary.samples
+    )
+
+    # The next interval starts empty
+    assert digest.collect(now=120) is None
+
+
+def test_templates_use_constant_space():
+    """Test that unbounded distinct templates keep the frequent ones."""
+    digest = Digest(max_templates=10, top_templates=1)
+    for i in range(10_000):
+        digest.add(http_record("Heartbeat", ()))
+        digest.add(http_record(f"Unique message {i}", ()))
+
+    assert len(digest._templates) == 10
+    (top,) = digest.collect().templates
+    assert top.template == "Heartbeat"
+    assert top.count - top.error <= 10_000 <= top.count
+
+
+def test_least_frequent_template_is_replaced():
+    """Test that eviction sees counts that grew after a template was added."""
+    digest = Digest(max_templates=3, top_templates=5)
+    for template, count in (("a", 1), ("b", 1), ("c", 1), ("a", 4), ("b", 2)):
+        for _ in range(count):
+            digest.add(http_record(template, ()))
+    digest.add(http_record("d", ()))  # replaces c
+    digest.add(http_record("e", ()))  # replaces d
+
+    templates = digest.collect().templates
+    assert [(t.template, t.count, t.error) for t in templates] == [
+        ("a", 5, 0),
+        ("b", 3, 0),
+        ("e", 3, 2),
+    ]
+
+
+def test_spike_escalates_level():
+    """Test that records past a level's threshold are delivered immediately."""
+    digest = Digest(spike_thresholds={logging.WARNING: 3})
+    results = [
+        digest.add(http_record("Disk %d%% full", (90,), logging.WARNING, created=i))
+        for i in range(5)
+    ]
+    assert results == [False, False, False, True, True]
+    # Other levels are still absorbed
+    assert not digest.add(http_record("Request %s took %dms", ("/api", 5)))
+
+    summary = digest.collect(now=60)
+    assert summary.escalated == {logging.WARNING: 3}
+    text = format_digest(summary)
+    assert "WARNING: 3 (app.http 3), sent immediately since" in text
+
+    # Escalation ends with the interval
+    assert not digest.add(http_record("Disk %d%% full", (90,), logging.WARNING))
+
+
+def test_format_digest():
+    """Test the summary text."""
+    digest = Digest(samples=1)
+    for name in ("a", "b", "c", "d", "e"):
+        digest.add(http_record("Hello", (), name=name))
+    text = format_digest(digest.collect(now=0))
+
+    lines = text.splitlines()
+    assert lines[0].startswith("📊 Digest ") and lines[0].endswith(": 5 records")
+    assert lines[1].startswith("INFO: 5 (") and lines[1].endswith(", 2 more)")
+    assert "Top templates:" in lines
+    assert lines[lines.index("Samples:") + 1].startswith("INFO ")
@@ -0,0 +1,103 @@
+"""
+Tests for the shared dispatcher.
+"""
+
+import logging
+import threading
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from tgbot_logging import TelegramHandler
+from tgbot_logging.dispatcher import Dispatcher
+
+TEST_TOKEN = "shared_test_token"
+TEST_CHAT_ID = "123456789"
+
+
+@pytest.fixture
+def mock_bot():
+    """Patch the Bot class used by the handler and the dispatcher."""
+    bot = MagicMock()
+    bot.get_me = AsyncMock()
+    bot.send_message = AsyncMock()
+    bot.close = AsyncMock()
+    bot.shutdown = AsyncMock()
+    with patch("tgbot_logging.handler.Bot", return_value=bot), patch(
+        "tgbot_logging.dispatcher.Bot", return_value=bot
+    ), patch("signal.signal"):
+        yield bot
+
+
+def make_handler(**kwargs):
+    """Create a shared-dispatcher handler."""
+    return TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        batch_interval=0.1,
+        shared_dispatcher=True,
+        rate_limit=False,
+        **kwargs,
+    )
+
+
+def test_handlers_share_one_dispatcher(mock_bot):
+    """Test that handlers for the same token share threads, loop and bot."""
+    threads_before = threading.active_count()
+    handlers = [make_handler() for _ in range(10)]
+
+    dispatcher = handlers[0]._dispatcher
+    assert all(h._dispatcher is dispatcher for h in handlers)
+    assert all(h.loop is dispatcher.loop for h in handlers)
+    assert all(h._bot is dispatcher.bot for h in handlers)
+    assert all(h.rate_limiter is None for h in handlers)
+    # One loop thread and one sender thread for all handlers
+    assert threading.active_count() - threads_before == 2
+
+    for h in handlers:
+        h.close()
+    assert TEST_TOKEN not in Dispatcher._instances
+    time.sleep(0.1)
+    assert not dispatcher.loop.is_running()
+    mock_bot.shutdown.assert_awaited_once()
+
+
+def test_shared_dispatcher_keeps_handler_settings(mock_bot):
+    """Test that each handler keeps its own formatting."""
+    first = make_handler(fmt="first: %(message)s")
+    second = make_handler(fmt="second: %(message)s")
+
+    logger = logging.getLogger("test_shared_dispatcher")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(first)
+    logger.addHandler(second)
+    try:
+        logger.info("hello")
+        for _ in range(20):
+            if mock_bot.send_message.call_count >= 2:
+                break
+            time.sleep(0.05)
+    finally:
+        logger.removeHandler(first)
+        logger.removeHandler(second)
+
+    texts = sorted(call[1]["text"] for call in mock_bot.send_message.call_args_list)
+    assert texts == ["ℹ️ first: hello", "ℹ️ second: hello"]
+
+    first.close()
+    second.close()
+
+
+def test_shared_dispatcher_shares_rate_limiter(mock_bot):
+    """Test that handlers for one token share the bot's quota."""
+    first = TelegramHandler(
+        token=TEST_TOKEN, chat_ids=TEST_CHAT_ID, shared_dispatcher=True
+    )
+    second = TelegramHandler(
+        token=TEST_TOKEN, chat_ids=TEST_CHAT_ID, shared_dispatcher=True
+    )
+
+    assert first.rate_limiter is not None
+    assert first.rate_limiter is second.rate_limiter
+
+    first.close()
+    second.close()
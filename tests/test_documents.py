@@ -0,0 +1,68 @@
+"""
+Tests for sending oversized records as compressed documents.
+"""
+
+import gzip
+from tgbot_logging.documents import (
+    MAX_CAPTION_LENGTH,
+    build_document,
+    is_oversized,
+)
+from tgbot_logging.packer import headline, visible_length
+
+
+def test_headline_keeps_markup_balanced():
+    """Test that a headline is cut at a newline and closes open tags."""
+    text = "<b>ERROR</b> Payment failed\n<pre>" + "frame\n" * 1000 + "</pre>"
+    head, cut = headline(text, 60, "HTML")
+
+    assert cut
+    assert head.startswith("<b>ERROR</b> Payment failed\n")
+    assert head.count("<pre>") == head.count("</pre>")
+    assert visible_length(head, "HTML") <= 60
+    assert headline("short", 60) == ("short", False)
+
+
+def test_headline_of_huge_text_is_cheap():
+    """Test that only a prefix of a huge record is tokenized."""
+    head, cut = headline("x " * 5_000_000, 100)
+    assert cut and len(head) <= 100
+
+
+def test_build_document():
+    """Test the caption, file name and compressed plain-text content."""
+    text = "<b>ERROR</b> a &lt; b\n<pre>" + "Traceback line\n" * 2000 + "</pre>"
+    document = build_document(text, "HTML", created=0)
+
+    assert document.filename.startswith("log-") and document.filename.endswith(
+        ".txt.gz"
+    )
+    assert document.caption.startswith("<b>ERROR</b> a &lt; b\n")
+    assert "full record attached" in document.caption
+    assert visible_length(document.caption, "HTML") <= MAX_CAPTION_LENGTH
+    content = gzip.decompress(document.content).decode("utf-8")
+    assert content == "ERROR a < b\n" + "Traceback line\n" * 2000
+    # Log text compresses well
+    assert len(document.content) < len(content) // 20
+
+
+def test_build_document_markdown():
+    """Test that the attachment holds the text without MarkdownV2 escapes."""
+    document = build_document("*bold*\n" + "line\\.\n" * 2000, "MarkdownV2")
+
+    assert document.caption.startswith("*bold*\nline\\.\n")
+    assert document.caption.endswith(
+        "line\\.\n… 12,005 characters, full record attached"
+    )
+    content = gzip.decompress(document.content).decode("utf-8")
+    assert content == "bold\n" + "line.\n" * 2000
+
+
+def test_is_oversized():
+    """Test the threshold on the visible length."""
+    assert not is_oversized("a" * 100, 0)
+    assert not is_oversized("a" * 100, 100)
+    assert is_oversized("a" * 101, 100)
+    # Markup does not count, emoji count twice
+    assert not is_oversized("<b>" + "a" * 100 + "</b>", 100, "HTML")
+    assert is_oversized("🚀" * 51, 100)
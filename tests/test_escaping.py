@@ -0,0 +1,145 @@
+"""
+Tests for HTML and MarkdownV2 escaping.
+"""
+
+import logging
+from functools import partial
+import pytest
+from telegram.helpers import escape_markdown
+from tgbot_logging.escaping import EscapedTemplate, escape
+from tgbot_logging.rendering import MessageRenderer
+from tests.helpers import make_record
+
+app_error = partial(make_record, level=logging.ERROR, name="app")
+
+
+def test_html_escape():
+    """Test that only the HTML special characters are replaced."""
+    assert escape("a < b && c > d", "HTML") == "a &lt; b &amp;&amp; c &gt; d"
+    assert escape('"quoted" it\'s', "HTML") == '"quoted" it\'s'
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "plain text",
+        "Price: $5.00 (-10%) [sale] {x} #tag a_b *c* ~d~ `e` > f | g + h = i!",
+        "back\\slash",
+        "",
+    ],
+)
+def test_markdown_escape_matches_telegram_helper(text):
+    """Test that MarkdownV2 escaping agrees with python-telegram-bot's helper."""
+    assert escape(text, "MarkdownV2") == escape_markdown(text, version=2)
+    assert escape(text, "MarkdownV2", pre=True) == escape_markdown(
+        text, version=2, entity_type="pre"
+    )
+
+
+def test_fast_path_returns_same_object():
+    """Test that text without special characters is returned unchanged."""
+    text = "Connection established in 12 ms"
+    assert escape(text, "HTML") is text
+    assert escape("no markup here", "MarkdownV2") == "no markup here"
+
+
+def test_no_parse_mode():
+    """Test that text is left alone without a parse mode."""
+    assert escape("<b>1.5</b>", None) == "<b>1.5</b>"
+    assert escape("<b>1.5</b>", "Unknown") == "<b>1.5</b>"
+
+
+def test_template_escapes_values_only():
+    """Test that a template keeps its literals as markup and escapes every field value."""
+    template = EscapedTemplate("*%(name)s*: %(levelname)-7s %(message)s", "MarkdownV2")
+    record = app_error("1 + 1 = %d", (2,), name="db.pool")
+    # Set by Formatter.format before the template is applied
+    record.message = record.getMessage()
+
+    assert template.format(record.__dict__) == "*db\\.pool*: ERROR   1 \\+ 1 \\= 2"
+
+
+def test_template_html_markup():
+    """Test that HTML tags in a template are sent as markup."""
+    template = EscapedTemplate("<b>%(levelname)s</b> %(message)s", "HTML")
+    record = app_error("if a < b")
+    record.message = record.getMessage()
+
+    assert template.format(record.__dict__) == "<b>ERROR</b> if a &lt; b"
+
+
+def test_template_percent_literal():
+    """Test that %% in a template is a literal percent sign."""
+    template = EscapedTemplate("100%% <i>%(message)s</i>", "HTML")
+    assert template.format({"message": "a&b"}) == "100% <i>a&amp;b</i>"
+
+
+@pytest.mark.parametrize(
+    "fmt, style",
+    [
+        ("<b>{levelname}</b> {message!r:>12}", "{"),
+        ("<b>${levelname}</b> $message $$", "$"),
+    ],
+)
+def test_template_other_styles(fmt, style):
+    """Test that {}- and $-style templates are split like %-style ones."""
+    record = app_error("a<b")
+    record.message = record.getMessage()
+    expected = logging.Formatter(fmt, style=style).formatMessage(record)
+    expected = expected.replace("a<b", "a&lt;b")
+
+    assert EscapedTemplate(fmt, "HTML", style).format(record.__dict__) == expected
+
+
+@pytest.mark.parametrize(
+    "fmt", ["%(asctime)s %(name)s: %(message)s", "%(lineno)05d|%(message)r"]
+)
+def test_template_matches_formatter(fmt):
+    """Test that without special characters the template formats like logging."""
+    record = app_error("Disk %s full", ("sda1",))
+    record.message = record.getMessage()
+    record.asctime = "2024-01-01 12:00:00"
+    expected = logging.Formatter(fmt).formatMessage(record)
+    assert EscapedTemplate(fmt, "HTML").format(record.__dict__) == expected
+
+
+def test_renderer_escapes_record_text():
+    """Test that the renderer escapes record text unless told not to."""
+    record = app_error("if a < b & c > d")
+    escaping = MessageRenderer(include_level_emoji=False)
+    plain = MessageRenderer(include_level_emoji=False, escape_text=False)
+
+    assert escaping.render(record) == "if a &lt; b &amp; c &gt; d"
+    assert plain.render(record) == "if a < b & c > d"
+
+
+def test_renderer_keeps_formatter_markup():
+    """Test that markup in the formatter's template survives escaping."""
+    renderer = MessageRenderer(parse_mode="MarkdownV2", include_level_emoji=False)
+    formatter = logging.Formatter("*{name}*: {message}", style="{")
+    record = app_error("v1.2 (beta)")
+
+    assert renderer.render(record, formatter) == "*app*: v1\\.2 \\(beta\\)"
+
+
+def test_renderer_escapes_custom_format_message_output():
+    """Test that a formatter with its own formatMessage is escaped as a whole."""
+
+    class Upper(logging.Formatter):
+        def formatMessage(self, record):
+            return super().formatMessage(record).upper()
+
+    renderer = MessageRenderer(include_level_emoji=False)
+    record = app_error("a < b")
+
+    assert renderer.render(record, Upper("<i>%(message)s</i>")) == (
+        "&lt;I&gt;A &lt; B&lt;/I&gt;"
+    )
+
+
+def test_context_escape():
+    """Test that message_format functions get an escape function for the parse mode."""
+    renderer = MessageRenderer(
+        message_format=lambda record, context: f"<b>{context['escape'](record.msg)}</b>"
+    )
+    assert renderer.render(app_error("x < y")) == "<b>x &lt; y</b>"
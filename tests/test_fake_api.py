@@ -0,0 +1,266 @@
+"""
+Tests for the local fake Bot API.
+"""
+
+import asyncio
+import gzip
+import logging
+import time
+import pytest
+from telegram import Bot
+from telegram.error import InvalidToken, NetworkError, RetryAfter
+from tgbot_logging import TelegramHandler
+from tgbot_logging.testing import FakeBotAPI
+
+
+@pytest.fixture
+def api():
+    with FakeBotAPI(seed=1) as api:
+        yield api
+
+
+@pytest.mark.asyncio
+async def test_get_me_and_send_message(api):
+    """Test the basic calls through python-telegram-bot."""
+    async with Bot(api.token, base_url=api.base_url) as bot:
+        me = await bot.get_me()
+        message = await bot.send_message(
+            chat_id="42", text="<b>Hello</b>", parse_mode="HTML"
+        )
+
+    assert me.is_bot and me.username == "fake_bot"
+    assert message.chat.id == 42 and message.text == "<b>Hello</b>"
+    assert api.messages[0][:3] == ("42", "<b>Hello</b>", "HTML")
+    assert api.calls["sendMessage"] == 1
+
+
+@pytest.mark.asyncio
+async def test_send_document(api):
+    """Test that uploaded documents are parsed from the multipart body."""
+    async with Bot(api.token, base_url=api.base_url) as bot:
+        message = await bot.send_document(
+            chat_id="@logs",
+            document=b"\x1f\x8bpayload",
+            filename="record.txt.gz",
+            caption="Too long",
+        )
+
+    assert message.document.file_name == "record.txt.gz"
+    sent = api.messages[0]
+    assert sent.chat_id == "@logs" and sent.text == "Too long"
+    assert sent.filename == "record.txt.gz" and sent.document == b"\x1f\x8bpayload"
+
+
+@pytest.mark.asyncio
+async def test_wrong_token(api):
+    """Test that other tokens are rejected."""
+    with pytest.raises(InvalidToken):
+        async with Bot("1:other", base_url=api.base_url):
+            pass
+    assert api.calls["getMe"] == 1
+
+
+@pytest.mark.asyncio
+async def test_injected_faults(api):
+    """Test scripted 429 and server errors."""
+    api.fail_next(429, retry_after=7)
+    api.fail_next(502)
+    async with Bot(api.token, base_url=api.base_url) as bot:
+        with pytest.raises(RetryAfter) as error:
+            await bot.send_message(chat_id="42", text="first")
+        with pytest.raises(NetworkError):
+            await bot.send_message(chat_id="42", text="second")
+        await bot.send_message(chat_id="42", text="third")
+
+    assert int(error.value.retry_after) == 7
+    assert [message.text for message in api.messages] == ["third"]
+    assert api.calls["sendMessage"] == 3
+
+
+def test_random_fault_rates():
+    """Test that fault rates apply to roughly their share of sends."""
+    api = FakeBotAPI(retry_after_rate=0.2, error_rate=0.1, seed=3)
+    statuses = [
+        api.handle(api.token, "sendMessage", {"chat_id": "1"})[0] for _ in range(1000)
+    ]
+    assert 150 < statuses.count(429) < 250
+    assert 60 < statuses.count(502) < 140
+    assert statuses.count(200) == len(api.messages)
+
+
+def test_latency():
+    """Test that calls take the configured time."""
+    api = FakeBotAPI(latency=0.05)
+    start = time.monotonic()
+    api.handle(api.token, "getMe", {})
+    assert time.monotonic() - start >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_handler_end_to_end(api):
+    """Test that a real handler delivers batches over HTTP and retries errors."""
+    api.fail_next(502)
+    handler = TelegramHandler(
+        token=api.token,
+        chat_ids="42",
+        base_url=api.base_url,
+        batch_size=5,
+        batch_interval=0.1,
+        retry_delay=0.1,
+        rate_limit=False,
+    )
+    for i in range(5):
+        handler.emit(
+            logging.LogRecord(
+                "test", logging.INFO, "test.py", 1, f"Message {i}", (), None
+            )
+        )
+
+    deadline = time.monotonic() + 5
+    while not api.messages and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+    assert len(api.messages) == 1
+    assert api.messages[0].text.count("Message") == 5
+    assert api.calls["sendMessage"] == 2
+    chat = handler.metrics_snapshot()["chats"]["42"]
+    assert chat["sent"] == 5 and chat["retries"] == 1
+
+    handler.close()
+
+
+@pytest.mark.asyncio
+async def test_handler_delivers_to_every_chat(api):
+    """Test that records emitted once reach every chat in one batch each."""
+    chat_ids = [str(100 + i) for i in range(20)]
+    handler = TelegramHandler(
+        token=api.token,
+        chat_ids=chat_ids,
+        base_url=api.base_url,
+        batch_size=5,
+        batch_interval=0.1,
+        rate_limit=False,
+    )
+    for i in range(5):
+        handler.emit(
+            logging.LogRecord(
+                "test", logging.INFO, "test.py", 1, f"Message {i}", (), None
+            )
+        )
+
+    deadline = time.monotonic() + 5
+    while len(api.messages) < len(chat_ids) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+    assert sorted(message.chat_id for message in api.messages) == chat_ids
+    assert all(message.text.count("Message") == 5 for message in api.messages)
+
+    handler.close()
+
+
+@pytest.mark.asyncio
+async def test_handler_sends_full_batches_back_to_back(api):
+    """Test that a backlog of full batches is not paced by batch_interval."""
+    handler = TelegramHandler(
+        token=api.token,
+        chat_ids="42",
+        base_url=api.base_url,
+        batch_size=1,
+        batch_interval=1.0,
+        rate_limit=False,
+    )
+    start = time.monotonic()
+    for i in range(20):
+        handler.emit(
+            logging.LogRecord(
+                "test", logging.INFO, "test.py", 1, f"Message {i}", (), None
+            )
+        )
+
+    deadline = start + 10
+    while len(api.messages) < 20 and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+    # One round per batch_interval would take 20 seconds
+    assert len(api.messages) == 20
+    assert time.monotonic() - start < 5
+
+    handler.close()
+
+
+def test_logging_shutdown_sends_queued_records(api):
+    """Test that logging.shutdown() flushes and closes the handler synchronously."""
+    handler = TelegramHandler(
+        token=api.token,
+        chat_ids="42",
+        base_url=api.base_url,
+        batch_size=10,
+        batch_interval=60,
+        rate_limit=False,
+    )
+    for i in range(3):
+        handler.emit(
+            logging.LogRecord(
+                "test", logging.INFO, "test.py", 1, f"Message {i}", (), None
+            )
+        )
+    assert not api.messages
+
+    logging.shutdown([lambda: handler])
+
+    assert handler._closed
+    assert [message.text.count("Message") for message in api.messages] == [3]
+
+
+@pytest.mark.asyncio
+async def test_handler_uploads_oversized_records(api):
+    """Test that an oversized record arrives as one compressed document."""
+    handler = TelegramHandler(
+        token=api.token,
+        chat_ids="42",
+        base_url=api.base_url,
+        batch_interval=0.1,
+        document_threshold=4096,
+        rate_limit=False,
+    )
+    text = "Traceback (most recent call last):\n" + "  frame\n" * 5000
+    handler.emit(logging.LogRecord("test", logging.ERROR, "test.py", 1, text, (), None))
+
+    deadline = time.monotonic() + 5
+    while not api.messages and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+    assert api.calls["sendDocument"] == 1 and api.calls["sendMessage"] == 0
+    sent = api.messages[0]
+    assert sent.filename.endswith(".txt.gz")
+    assert sent.text.startswith("❌ Traceback (most recent call last):")
+    assert gzip.decompress(sent.document).decode() == f"❌ {text}"
+
+    handler.close()
+
+
+@pytest.mark.asyncio
+async def test_handler_live_status(api):
+    """Test that the live status is sent once, pinned and then edited."""
+    handler = TelegramHandler(
+        token=api.token,
+        chat_ids="42",
+        base_url=api.base_url,
+        batch_interval=0.1,
+        live_status=True,
+        live_interval=0.2,
+        rate_limit=False,
+    )
+    for i in range(3):
+        handler.emit(
+            logging.LogRecord(
+                "worker", logging.INFO, "test.py", 1, f"Job {i}", (), None
+            )
+        )
+        await asyncio.sleep(0.5)
+
+    handler.close()
+    assert api.calls["sendMessage"] == 1
+    assert api.pinned == {"42": 1}
+    assert api.calls["editMessageText"] == 2
+    assert api.edits[("42", 1)].endswith("Job 2")
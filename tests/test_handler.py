@@ -3,6 +3,7 @@ Tests for TelegramHandler class.
 """
 
 import os
+import gzip
 import logging
 import pytest
 import asyncio
@@ -10,6 +11,7 @@ from unittest.mock import AsyncMock, patch, MagicMock
 from dotenv import load_dotenv
 from telegram import Bot
 from telegram.error import (
+    BadRequest,
     RetryAfter,
     NetworkError,
     TelegramError,
@@ -17,6 +19,8 @@ from telegram.error import (
     InvalidToken,
 )
 from tgbot_logging import TelegramHandler
+from tgbot_logging.handler import DEFAULT_LATENCY_BUDGETS
+from tgbot_logging.ratelimit import RateLimiter
 import sys
 import signal
 import time
@@ -59,7 +63,7 @@ async def handler(mock_bot):
     handler._bot = mock_bot
     yield handler
     # Cleanup
-    await handler.close()
+    await handler.aclose()
 
 
 @pytest.fixture
@@ -77,7 +81,7 @@ async def batch_handler(mock_bot):
     handler._bot = mock_bot
     yield handler
     # Cleanup
-    await handler.close()
+    await handler.aclose()
 
 
 @pytest.mark.asyncio
@@ -105,7 +109,7 @@ async def test_emit_single_message(handler, mock_bot):
         exc_info=None,
     )
 
-    await handler.emit(record)
+    await handler.aemit(record)
     await asyncio.sleep(0.2)  # Wait for message to be processed
 
     mock_bot.send_message.assert_called_once()
@@ -130,7 +134,7 @@ async def test_batch_messages(batch_handler, mock_bot):
     ]
 
     for record in records:
-        await batch_handler.emit(record)
+        await batch_handler.aemit(record)
     await asyncio.sleep(0.2)  # Wait for messages to be processed
 
     assert mock_bot.send_message.call_count >= 1  # Messages should be batched
@@ -159,7 +163,7 @@ async def test_retry_on_error(handler, mock_bot):
         exc_info=None,
     )
 
-    await handler.emit(record)
+    await handler.aemit(record)
     await asyncio.sleep(0.2)  # Wait for retries
 
     assert mock_bot.send_message.call_count >= 2  # Initial attempt + retry
@@ -186,7 +190,7 @@ async def test_rate_limit_handling(handler, mock_bot):
         exc_info=None,
     )
 
-    await handler.emit(record)
+    await handler.aemit(record)
     await asyncio.sleep(0.2)  # Wait for rate limit
 
     assert mock_bot.send_message.call_count >= 2  # Initial attempt + retry
@@ -216,13 +220,13 @@ async def test_multiple_chat_ids(mock_bot):
         exc_info=None,
     )
 
-    await handler.emit(record)
+    await handler.aemit(record)
     await asyncio.sleep(0.2)  # Wait for messages to be sent
 
     assert mock_bot.send_message.call_count >= len(chat_ids)
 
     # Cleanup
-    await handler.close()
+    await handler.aclose()
 
 
 @pytest.mark.asyncio
@@ -240,7 +244,7 @@ async def test_custom_formatting(handler, mock_bot):
         exc_info=None,
     )
 
-    await handler.emit(record)
+    await handler.aemit(record)
     await asyncio.sleep(0.2)  # Wait for message to be processed
 
     mock_bot.send_message.assert_called()
@@ -258,6 +262,7 @@ async def test_html_formatting(mock_bot):
         parse_mode="HTML",
         batch_size=1,  # Use batch size 1 for immediate sending
         test_mode=True,  # Enable test mode
+        escape_text=False,  # Records carry their own markup
     )
     handler._bot = mock_bot
 
@@ -271,7 +276,7 @@ async def test_html_formatting(mock_bot):
         exc_info=None,
     )
 
-    await handler.emit(record)
+    await handler.aemit(record)
     await asyncio.sleep(0.2)  # Wait for message to be processed
 
     mock_bot.send_message.assert_called()
@@ -280,7 +285,38 @@ async def test_html_formatting(mock_bot):
     assert "<b>Bold</b>" in kwargs["text"]
 
     # Cleanup
-    await handler.close()
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_escape_text(mock_bot):
+    """Test that record text is escaped by default while fmt stays markup."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        fmt="*%(levelname)s*: %(message)s",
+        parse_mode="MarkdownV2",
+        include_level_emoji=False,
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+
+    record = logging.LogRecord(
+        name="test",
+        level=logging.INFO,
+        pathname="test.py",
+        lineno=1,
+        msg="Loaded config.yaml (%d keys)",
+        args=(3,),
+        exc_info=None,
+    )
+    await handler.aemit(record)
+
+    assert mock_bot.send_message.call_args[1]["text"] == (
+        "*INFO*: Loaded config\\.yaml \\(3 keys\\)"
+    )
+
+    await handler.aclose()
 
 
 @pytest.mark.asyncio
@@ -301,10 +337,10 @@ async def test_graceful_shutdown(batch_handler, mock_bot):
     ]
 
     for record in records:
-        await batch_handler.emit(record)
+        await batch_handler.aemit(record)
 
     # Trigger shutdown
-    await batch_handler.close()
+    await batch_handler.aclose()
 
     # Check that all messages were sent
     assert mock_bot.send_message.call_count >= 1
@@ -313,6 +349,35 @@ async def test_graceful_shutdown(batch_handler, mock_bot):
     assert batch_handler._is_shutting_down.is_set()
 
 
+@pytest.mark.asyncio
+async def test_shutdown_waits_for_parked_chats(mock_bot):
+    """Test that close() waits out a RetryAfter penalty instead of dropping the queue."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=[TEST_CHAT_ID, "987654321"],
+        batch_size=2,
+        max_inline_retry_after=0.1,
+        test_mode=True,
+    )
+    mock_bot.send_message.side_effect = [RetryAfter(0.3)] + [MagicMock()] * 10
+    handler._bot = mock_bot
+    for i in range(3):
+        handler.emit(
+            logging.LogRecord("test", logging.INFO, "test.py", 1, f"M{i}", (), None)
+        )
+    await handler._process_queue()
+    assert handler.message_queue[TEST_CHAT_ID].qsize() == 3
+
+    started = time.monotonic()
+    await handler.aclose()
+
+    assert time.monotonic() - started >= 0.2
+    assert handler.message_queue[TEST_CHAT_ID].empty()
+    assert handler.message_queue["987654321"].empty()
+    sent = handler.metrics_snapshot()["chats"]
+    assert sent[TEST_CHAT_ID]["sent"] == 3 and sent["987654321"]["sent"] == 3
+
+
 @pytest.mark.asyncio
 async def test_signal_handling(handler, mock_bot):
     """Test signal handling."""
@@ -326,7 +391,7 @@ async def test_signal_handling(handler, mock_bot):
         args=(),
         exc_info=None,
     )
-    await handler.emit(record)
+    await handler.aemit(record)
 
     # Simulate SIGTERM
     with patch("signal.signal") as mock_signal:
@@ -378,7 +443,7 @@ async def test_error_handling_per_chat(handler, mock_bot):
         exc_info=None,
     )
 
-    await handler.emit(record)
+    await handler.aemit(record)
     await asyncio.sleep(0.5)  # Wait for async processing and retries
 
     # Check that both chats were attempted
@@ -411,7 +476,7 @@ async def test_rate_limiting(handler, mock_bot):
         exc_info=None,
     )
 
-    await handler.emit(record)
+    await handler.aemit(record)
     await asyncio.sleep(0.3)  # Wait for retries
 
     # Check retries
@@ -432,7 +497,7 @@ async def test_message_batching(batch_handler, mock_bot):
             args=(),
             exc_info=None,
         )
-        await batch_handler.emit(record)
+        await batch_handler.aemit(record)
 
     # Check not sent yet
     assert mock_bot.send_message.call_count == 0
@@ -447,7 +512,7 @@ async def test_message_batching(batch_handler, mock_bot):
         args=(),
         exc_info=None,
     )
-    await batch_handler.emit(record)
+    await batch_handler.aemit(record)
 
     # Wait for batch processing
     await asyncio.sleep(0.2)
@@ -478,7 +543,7 @@ async def test_async_context_manager():
             args=(),
             exc_info=None,
         )
-        await handler.emit(record)
+        await handler.aemit(record)
 
         # Check message was queued
         assert any(not q.empty() for q in handler.message_queue.values())
@@ -486,3 +551,984 @@ async def test_async_context_manager():
     # Check cleanup after context exit
     assert handler._closed
     assert handler._is_shutting_down.is_set()
+
+
+@pytest.mark.asyncio
+async def test_emit_is_synchronous(handler, mock_bot):
+    """Test that stdlib logging calls only enqueue the record."""
+    logger = logging.getLogger("test_sync_emit")
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    try:
+        assert (
+            handler.emit(
+                logging.LogRecord("test", logging.INFO, "", 0, "Direct", (), None)
+            )
+            is None
+        )
+        logger.info("Via logger")
+    finally:
+        logger.removeHandler(handler)
+
+    # Nothing is sent on the caller's thread
+    mock_bot.send_message.assert_not_called()
+    assert handler.message_queue[TEST_CHAT_ID].qsize() == 2
+    assert handler.message_queue[TEST_CHAT_ID].get_nowait() == "ℹ️ Direct"
+    assert handler.message_queue[TEST_CHAT_ID].get_nowait() == "ℹ️ Via logger"
+
+
+@pytest.mark.asyncio
+async def test_bounded_queue_counts_drops(mock_bot):
+    """Test that a bounded queue drops records and reports the loss."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=["123", "456"],
+        batch_size=100,
+        test_mode=True,
+        max_queue_size=3,
+        overflow_policy="drop_oldest",
+    )
+    handler._bot = mock_bot
+
+    for i in range(5):
+        handler.emit(logging.LogRecord("test", logging.INFO, "", 0, f"M{i}", (), None))
+
+    assert handler.message_queue["123"].qsize() == 3
+    assert handler.message_queue["123"].get_nowait() == "ℹ️ M2"
+    assert handler.dropped_records == 4  # Two per chat
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_sender_does_not_block_on_full_queues(mock_bot):
+    """Test that the block policy never makes the sender's loop wait for room."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=["123", "456"],
+        batch_size=100,
+        test_mode=True,
+        max_queue_size=2,
+        overflow_policy="block",
+        overflow_timeout=0.5,
+        deferred_formatting=True,
+    )
+    handler._bot = mock_bot
+    for chat_id in handler.chat_ids:
+        handler.message_queue[chat_id].put_nowait("queued 1")
+        handler.message_queue[chat_id].put_nowait("queued 2")
+
+    for i in range(2):
+        handler.emit(logging.LogRecord("test", logging.INFO, "", 0, f"M{i}", (), None))
+
+    start = time.monotonic()
+    await handler._process_queue()
+    assert time.monotonic() - start < 0.5
+    assert handler.dropped_records == 4
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_queue_bound_covers_all_lanes(mock_bot):
+    """Test that max_queue_size bounds a chat, not each latency lane."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        batch_size=100,
+        test_mode=True,
+        max_queue_size=2,
+        latency_budgets=DEFAULT_LATENCY_BUDGETS,
+    )
+    handler._bot = mock_bot
+
+    for level in (logging.INFO, logging.WARNING, logging.ERROR, logging.CRITICAL):
+        handler.emit(logging.LogRecord("test", level, "", 0, "M", (), None))
+
+    queue = handler.message_queue[TEST_CHAT_ID]
+    assert queue.qsize() == 2
+    assert handler.dropped_records == 2
+    # The least urgent records were evicted
+    assert [queue.get_nowait() for _ in range(2)] == ["🚨 M", "❌ M"]
+
+    await handler.aclose()
+
+
+def test_invalid_overflow_policy():
+    """Test that an unknown overflow policy is rejected."""
+    with pytest.raises(ValueError):
+        TelegramHandler(
+            token=TEST_TOKEN,
+            chat_ids=TEST_CHAT_ID,
+            test_mode=True,
+            overflow_policy="explode",
+        )
+
+
+@pytest.mark.asyncio
+async def test_batches_respect_message_limit(mock_bot):
+    """Test that batches are packed into requests within the length limit."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        batch_size=10,
+        test_mode=True,
+        max_message_length=100,
+    )
+    handler._bot = mock_bot
+
+    for i in range(10):
+        await handler.aemit(
+            logging.LogRecord("test", logging.INFO, "", 0, "x" * 40, (), None)
+        )
+
+    texts = [call[1]["text"] for call in mock_bot.send_message.call_args_list]
+    assert len(texts) == 5
+    assert all(len(text) <= 100 for text in texts)
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_chats_are_dispatched_concurrently(mock_bot):
+    """Test that a slow chat does not delay the other chats."""
+    chat_ids = [str(i) for i in range(5)]
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=chat_ids,
+        batch_size=1,
+        test_mode=True,
+        max_concurrent_chats=2,
+    )
+    handler._bot = mock_bot
+
+    active = 0
+    peak = 0
+
+    async def slow_send(**kwargs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.1)
+        active -= 1
+
+    mock_bot.send_message = AsyncMock(side_effect=slow_send)
+
+    start = time.monotonic()
+    await handler.aemit(
+        logging.LogRecord("test", logging.INFO, "", 0, "Concurrent", (), None)
+    )
+    elapsed = time.monotonic() - start
+
+    assert mock_bot.send_message.call_count == len(chat_ids)
+    assert peak == 2
+    assert elapsed < 0.45  # Three rounds of two, not five in series
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_sends_are_rate_limited(mock_bot):
+    """Test that sends are spaced out by the rate limiter."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        batch_size=1,
+        test_mode=True,
+        rate_limiter=RateLimiter(private_chat_rate=20),
+    )
+    handler._bot = mock_bot
+
+    start = time.monotonic()
+    for i in range(3):
+        await handler.aemit(
+            logging.LogRecord("test", logging.INFO, "", 0, f"M{i}", (), None)
+        )
+
+    assert mock_bot.send_message.call_count == 3
+    assert time.monotonic() - start >= 0.09
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_defaults():
+    """Test that the default limiter is only created outside test mode."""
+    assert (
+        TelegramHandler(
+            token=TEST_TOKEN, chat_ids=TEST_CHAT_ID, test_mode=True
+        ).rate_limiter
+        is None
+    )
+    assert (
+        TelegramHandler(
+            token=TEST_TOKEN,
+            chat_ids=TEST_CHAT_ID,
+            test_mode=True,
+            rate_limit=False,
+            rate_limiter=RateLimiter(),
+        ).rate_limiter
+        is None
+    )
+
+
+@pytest.mark.asyncio
+async def test_long_retry_after_parks_only_that_chat(mock_bot):
+    """Test that a long RetryAfter on one chat does not stall the others."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=["111", "222"],
+        batch_size=1,
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+
+    calls = []
+
+    async def send(chat_id, **kwargs):
+        calls.append(chat_id)
+        if chat_id == "111":
+            raise RetryAfter(60)
+
+    mock_bot.send_message = AsyncMock(side_effect=send)
+
+    start = time.monotonic()
+    for i in range(3):
+        await handler.aemit(
+            logging.LogRecord("test", logging.INFO, "", 0, f"M{i}", (), None)
+        )
+
+    # No inline sleep, chat 111 was tried once and then parked
+    assert time.monotonic() - start < 1
+    assert calls.count("111") == 1
+    assert calls.count("222") == 3
+    assert handler._not_before["111"] > time.monotonic() + 55
+    assert handler.message_queue["111"].qsize() == 3
+
+    # The penalty outlasts SHUTDOWN_TIMEOUT, so close() does not wait for it
+    start = time.monotonic()
+    await handler.aclose()
+    assert time.monotonic() - start < 1
+
+
+@pytest.mark.asyncio
+async def test_backoff_delay_is_exponential_with_jitter():
+    """Test the retry delay growth and cap."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        test_mode=True,
+        retry_delay=1.0,
+        max_retry_delay=5.0,
+    )
+
+    for retries, upper in [(0, 1.0), (1, 2.0), (2, 4.0), (3, 5.0), (10, 5.0)]:
+        delays = [handler._backoff_delay(retries) for _ in range(50)]
+        assert all(upper / 2 <= delay <= upper for delay in delays)
+    assert len(set(delays)) > 1
+
+
+@pytest.mark.asyncio
+async def test_construction_does_not_wait_on_network():
+    """Test that a handler can be created inside a running loop without a round trip."""
+    bot = MagicMock()
+
+    async def slow_initialize():
+        await asyncio.sleep(0.5)
+
+    bot.initialize = AsyncMock(side_effect=slow_initialize)
+    bot.close = AsyncMock()
+
+    with patch("tgbot_logging.handler.Bot", return_value=bot), patch("signal.signal"):
+        start = time.monotonic()
+        handler = TelegramHandler(token=TEST_TOKEN, chat_ids=TEST_CHAT_ID)
+        assert time.monotonic() - start < 0.2
+
+        assert handler.token_valid is None
+        for _ in range(20):
+            if handler.token_valid:
+                break
+            await asyncio.sleep(0.05)
+        assert handler.token_valid is True
+        bot.get_me.assert_not_called()
+
+        await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_spool_replays_unsent_messages(mock_bot, tmp_path):
+    """Test that messages left unsent by a previous run are replayed."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=[TEST_CHAT_ID, "987654321"],
+        test_mode=True,
+        max_retries=0,
+        retry_delay=0.1,
+        spool_dir=str(tmp_path),
+    )
+    failing_bot = AsyncMock(spec=Bot)
+    failing_bot.send_message = AsyncMock(side_effect=NetworkError("Network down"))
+    handler._bot = failing_bot
+    record = logging.LogRecord(
+        name="test",
+        level=logging.ERROR,
+        pathname="test.py",
+        lineno=1,
+        msg="Survives a restart",
+        args=(),
+        exc_info=None,
+    )
+    await handler.aemit(record)
+    await handler.aclose()
+
+    # Only the second chat is still configured
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids="987654321",
+        test_mode=True,
+        spool_dir=str(tmp_path),
+    )
+    handler._bot = mock_bot
+    assert handler.message_queue["987654321"].qsize() == 1
+    mock_bot.send_message.reset_mock()
+    await handler._process_queue()
+
+    mock_bot.send_message.assert_called_once()
+    assert mock_bot.send_message.call_args[1]["text"] == "❌ Survives a restart"
+    assert handler._spool.pending() == []
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_rejected_message_does_not_block_chat(mock_bot, tmp_path):
+    """Test that a message Telegram refuses is dropped instead of retried forever."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        test_mode=True,
+        retry_delay=0.1,
+        spool_dir=str(tmp_path),
+        escape_text=False,
+    )
+    sent = []
+
+    async def send(chat_id, text, parse_mode):
+        if "<" in text:
+            raise BadRequest("Can't parse entities: unsupported start tag")
+        sent.append(text)
+        return MagicMock()
+
+    mock_bot.send_message = AsyncMock(side_effect=send)
+    handler._bot = mock_bot
+    for msg in ("x < y", "ok1", "ok2"):
+        await handler.aemit(
+            logging.LogRecord("test", logging.INFO, "test.py", 1, msg, (), None)
+        )
+
+    # Sent once and once more as plain text, without retries, and dropped
+    assert mock_bot.send_message.call_count == 4
+    assert sent == ["ℹ️ ok1", "ℹ️ ok2"]
+    chat = handler.metrics_snapshot()["chats"][TEST_CHAT_ID]
+    assert chat["rejected"] == 1 and chat["sent"] == 2 and chat["queue_depth"] == 0
+    # Nothing is replayed after a restart
+    assert handler._spool.pending() == []
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_unparsable_markup_is_sent_as_plain_text(mock_bot):
+    """Test that a message with markup Telegram rejects arrives as plain text."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        test_mode=True,
+        fmt="<b>%(levelname)s</b> %(message)s",
+        escape_text=False,
+    )
+    sent = []
+
+    async def send(chat_id, text, parse_mode):
+        if parse_mode == "HTML" and "<3" in text:
+            raise BadRequest('Can\'t parse entities: unsupported start tag "3"')
+        sent.append((text, parse_mode))
+        return MagicMock()
+
+    mock_bot.send_message = AsyncMock(side_effect=send)
+    handler._bot = mock_bot
+    for msg in ("I <3 logs", "ok"):
+        await handler.aemit(
+            logging.LogRecord("test", logging.INFO, "test.py", 1, msg, (), None)
+        )
+
+    assert sent == [("ℹ️ INFO I <3 logs", None), ("ℹ️ <b>INFO</b> ok", "HTML")]
+    chat = handler.metrics_snapshot()["chats"][TEST_CHAT_ID]
+    assert chat["rejected"] == 0 and chat["sent"] == 2
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_records_are_coalesced(mock_bot):
+    """Test that a storm of identical records becomes one message plus a summary."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        test_mode=True,
+        coalesce_window=60,
+    )
+    handler._bot = mock_bot
+
+    for i in range(1284):
+        record = logging.LogRecord(
+            name="test",
+            level=logging.ERROR,
+            pathname="test.py",
+            lineno=1,
+            msg="Connection to %s failed",
+            args=(f"db{i}",),
+            exc_info=None,
+        )
+        await handler.aemit(record)
+
+    assert mock_bot.send_message.call_count == 1
+    assert mock_bot.send_message.call_args[1]["text"] == "❌ Connection to db0 failed"
+
+    await handler.aclose()
+    assert mock_bot.send_message.call_count == 2
+    summary = mock_bot.send_message.call_args[1]["text"]
+    assert summary.startswith("❌ Connection to db1283 failed\n×1,284 in last 60s")
+    assert "first seen" in summary and "last seen" in summary
+
+
+@pytest.mark.asyncio
+async def test_suppressed_records_are_summarized(mock_bot):
+    """Test that stages suppress records and the next batch reports them."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        test_mode=True,
+        max_records_per_minute=2,
+        sample_rates={logging.DEBUG: 0.0},
+    )
+    handler._bot = mock_bot
+
+    def make_record(level, msg):
+        return logging.LogRecord(
+            name="test",
+            level=level,
+            pathname="test.py",
+            lineno=1,
+            msg=msg,
+            args=(),
+            exc_info=None,
+        )
+
+    for _ in range(10):
+        await handler.aemit(make_record(logging.ERROR, "Disk <full>"))
+    await handler.aemit(make_record(logging.DEBUG, "Noise"))
+    assert mock_bot.send_message.call_count == 2
+
+    await handler.aemit(make_record(logging.WARNING, "Something else"))
+    text = mock_bot.send_message.call_args[1]["text"]
+    assert text.startswith("⚠️ Something else\n\nSuppressed 9 records:")
+    assert "8 × rate limit, test: Disk &lt;full&gt;" in text
+    assert "1 × sampling, DEBUG" in text
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_latency_budgets_schedule_by_deadline(mock_bot):
+    """Test that urgent records preempt held low-priority records."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        test_mode=True,
+        batch_size=10,
+        batch_interval=0.1,
+        latency_budgets={
+            logging.CRITICAL: 0.0,
+            logging.ERROR: 0.3,
+            logging.INFO: 30.0,
+        },
+    )
+    handler._bot = mock_bot
+
+    def make_record(level, msg):
+        return logging.LogRecord(
+            name="test",
+            level=level,
+            pathname="test.py",
+            lineno=1,
+            msg=msg,
+            args=(),
+            exc_info=None,
+        )
+
+    assert handler._lane_for(logging.DEBUG) == handler._lane_for(logging.INFO)
+    assert handler._lane_for(logging.WARNING) == handler._lane_for(logging.INFO)
+
+    for i in range(3):
+        handler.emit(make_record(logging.INFO, f"Info {i}"))
+    handler.emit(make_record(logging.ERROR, "Error"))
+
+    # Nothing is due yet: the INFO records are held to batch better
+    await handler._process_queue()
+    mock_bot.send_message.assert_not_called()
+
+    # The error reaches its deadline and takes the held records along
+    await asyncio.sleep(0.25)
+    await handler._process_queue()
+    mock_bot.send_message.assert_called_once()
+    assert mock_bot.send_message.call_args[1]["text"] == "\n\n".join(
+        ["❌ Error", "ℹ️ Info 0", "ℹ️ Info 1", "ℹ️ Info 2"]
+    )
+
+    # A critical record is sent right away
+    handler.emit(make_record(logging.INFO, "Info 3"))
+    handler.emit(make_record(logging.CRITICAL, "Critical"))
+    await handler._process_queue()
+    assert mock_bot.send_message.call_args[1]["text"] == "🚨 Critical\n\nℹ️ Info 3"
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_adaptive_batching_holds_bursts_only(mock_bot):
+    """Test that the adaptive window sends lone records at once and batches bursts."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        test_mode=True,
+        batch_size=100,
+        batch_interval=0.5,
+        adaptive_batching=True,
+    )
+    handler._bot = mock_bot
+
+    def make_record(msg):
+        return logging.LogRecord(
+            name="test",
+            level=logging.INFO,
+            pathname="test.py",
+            lineno=1,
+            msg=msg,
+            args=(),
+            exc_info=None,
+        )
+
+    # A lone record is sent right away
+    handler.emit(make_record("Lone"))
+    await handler._process_queue()
+    assert mock_bot.send_message.call_count == 1
+
+    # During a burst records are held and leave in one request
+    for i in range(60):
+        handler.emit(make_record(f"Burst {i}"))
+    assert handler._hold_window() > 0
+    await handler._process_queue()
+    assert mock_bot.send_message.call_count == 1
+
+    await asyncio.sleep(handler._wait_timeout())
+    await handler._process_queue()
+    assert mock_bot.send_message.call_count == 2
+    assert mock_bot.send_message.call_args[1]["text"].count("Burst") == 60
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_adaptive_batching_backs_off_on_retry_after(mock_bot):
+    """Test that RetryAfter widens the adaptive window."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        test_mode=True,
+        batch_interval=1.0,
+        adaptive_batching=True,
+    )
+    mock_bot.send_message.side_effect = [RetryAfter(0), MagicMock()]
+    handler._bot = mock_bot
+
+    assert handler._hold_window() == 0.0
+    await handler._send_message(TEST_CHAT_ID, "Test")
+    assert handler._hold_window() > 0.4
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_deferred_formatting(mock_bot):
+    """Test that emit only snapshots records and the sender renders them."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        batch_size=10,
+        deferred_formatting=True,
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+
+    items = ["a"]
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        exc_info = sys.exc_info()
+    record = logging.LogRecord(
+        name="test",
+        level=logging.ERROR,
+        pathname="test.py",
+        lineno=1,
+        msg="Items: %s",
+        args=(items,),
+        exc_info=exc_info,
+    )
+    handler.emit(record)
+    items.append("b")
+
+    # Nothing is formatted on the logging thread
+    assert record.exc_text is None
+    assert all(queue.empty() for queue in handler.message_queue.values())
+
+    await handler.aclose()
+    text = mock_bot.send_message.call_args[1]["text"]
+    assert text.startswith("❌ Items: ['a']\n<pre>Traceback")
+    assert "ValueError: boom" in text
+
+
+@pytest.mark.asyncio
+async def test_deferred_backlog_overflow_queues_only_the_new_record(mock_bot):
+    """Test that a record finding the backlog full is queued by the logging thread."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        batch_size=100,
+        max_queue_size=3,
+        deferred_formatting=True,
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+
+    for i in range(4):
+        handler.emit(
+            logging.LogRecord(
+                name="test",
+                level=logging.INFO,
+                pathname="test.py",
+                lineno=1,
+                msg=f"Message {i}",
+                args=(),
+                exc_info=None,
+            )
+        )
+
+    # The backlog is left to the sender; only the fourth record was queued
+    assert len(handler._deferred) == 3
+    assert list(handler.message_queue[TEST_CHAT_ID].lanes[0])[0][0] == ("ℹ️ Message 3")
+
+    await handler.aclose()
+    # Queueing the backlog overflowed the chat and dropped the oldest one
+    assert handler.dropped_records == 1
+
+
+@pytest.mark.asyncio
+async def test_deferred_backlog_is_bounded_by_bytes(mock_bot):
+    """Test that max_queue_bytes bounds the records waiting for the sender."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        batch_size=100,
+        max_queue_bytes=150,
+        deferred_formatting=True,
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+
+    for i in range(5):
+        handler.emit(logging.LogRecord("test", logging.INFO, "", 0, "x" * 40, (), None))
+
+    # Snapshots count their message: three fit, the rest is queued right away
+    assert len(handler._deferred) == 3
+    assert handler.message_queue[TEST_CHAT_ID].qsize() == 2
+
+    handler._render_deferred()
+    assert not handler._deferred
+    assert handler._deferred_bytes_in == handler._deferred_bytes_out == 120
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_overflowing_emit_waits_for_its_own_record_only(mock_bot):
+    """Test that under the block policy an emit waits at most overflow_timeout."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=["123", "456"],
+        batch_size=100,
+        test_mode=True,
+        max_queue_size=2,
+        overflow_policy="block",
+        overflow_timeout=0.2,
+        deferred_formatting=True,
+    )
+    handler._bot = mock_bot
+
+    durations = []
+    for i in range(8):
+        start = time.monotonic()
+        handler.emit(logging.LogRecord("test", logging.INFO, "", 0, f"M{i}", (), None))
+        durations.append(time.monotonic() - start)
+
+    # Two wait in the backlog, two fit and each of the rest waits once per chat
+    assert len(handler._deferred) == 2
+    assert max(durations) < 0.2 * len(handler.chat_ids) + 0.3
+    assert handler.dropped_records == 8
+
+    # The sender never waits for another call queueing the backlog
+    with handler._render_lock:
+        start = time.monotonic()
+        handler._render_deferred()
+        assert time.monotonic() - start < 0.1
+    assert len(handler._deferred) == 2
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_oversized_record_is_sent_as_document(mock_bot):
+    """Test that a huge record is one document upload, in order with the rest."""
+    mock_bot.send_document = AsyncMock(
+        side_effect=[NetworkError("Test network error"), MagicMock()]
+    )
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        batch_size=3,
+        retry_delay=0.1,
+        document_threshold=1000,
+        escape_text=True,
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+
+    for msg in ("Before", "Huge <data>: " + "x " * 10000, "After"):
+        await handler.aemit(
+            logging.LogRecord(
+                name="test",
+                level=logging.ERROR,
+                pathname="test.py",
+                lineno=1,
+                msg=msg,
+                args=(),
+                exc_info=None,
+            )
+        )
+
+    assert mock_bot.send_message.call_count == 2
+    assert mock_bot.send_document.call_count == 2
+    kwargs = mock_bot.send_document.call_args[1]
+    assert kwargs["chat_id"] == TEST_CHAT_ID
+    assert kwargs["filename"].endswith(".txt.gz")
+    assert kwargs["caption"].startswith("❌ Huge &lt;data&gt;: x x x")
+    assert kwargs["parse_mode"] == "HTML"
+    # The retry uploaded the whole file again
+    assert (
+        mock_bot.send_document.call_args_list[0][1]["document"]
+        is not kwargs["document"]
+    )
+    assert gzip.decompress(kwargs["document"].read()).decode() == (
+        "❌ Huge <data>: " + "x " * 10000
+    )
+    sent = [
+        kwargs.get("text", "document")
+        for name, _, kwargs in mock_bot.mock_calls
+        if name in ("send_message", "send_document")
+    ]
+    assert sent == ["❌ Before", "document", "document", "❌ After"]
+    assert handler.metrics_snapshot()["chats"][TEST_CHAT_ID]["sent"] == 3
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_exception_repeats_are_references(mock_bot):
+    """Test that a repeated exception is sent in full once, then referenced."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        exception_window=60,
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+
+    for order in range(5):
+        try:
+            raise ValueError(f"Payment #{order} failed")
+        except ValueError:
+            record = logging.LogRecord(
+                name="billing",
+                level=logging.ERROR,
+                pathname="test.py",
+                lineno=1,
+                msg=f"Order {order} failed",
+                args=(),
+                exc_info=sys.exc_info(),
+            )
+        await handler.aemit(record)
+
+    assert mock_bot.send_message.call_count == 1
+    full = mock_bot.send_message.call_args[1]["text"]
+    assert full.startswith("❌ Order 0 failed\n<pre>Traceback")
+    tag = full.rsplit("\n", 1)[1]
+    assert tag.startswith("#exc_")
+
+    await handler.aclose()
+    assert mock_bot.send_message.call_count == 2
+    reference = mock_bot.send_message.call_args[1]["text"]
+    assert reference.startswith(
+        "❌ ↻ ValueError: Payment #4 failed ×4 in last 60s, 5 since "
+    )
+    assert reference.endswith(tag)
+    # One line of text followed by the tag
+    assert reference.count("\n") == 1
+
+
+@pytest.mark.asyncio
+async def test_digest_mode(mock_bot):
+    """Test that low-level records are summarized and errors sent as usual."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        project_name="Shop",
+        digest_interval=300,
+        digest_spike_thresholds={logging.WARNING: 2},
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+
+    def record(level, msg):
+        return logging.LogRecord(
+            name="shop",
+            level=level,
+            pathname="test.py",
+            lineno=1,
+            msg=msg,
+            args=(),
+            exc_info=None,
+        )
+
+    for i in range(50):
+        await handler.aemit(record(logging.INFO, f"Order {i} placed"))
+    for i in range(3):
+        await handler.aemit(record(logging.WARNING, f"Stock low {i}"))
+    await handler.aemit(record(logging.ERROR, "Payment failed"))
+
+    # The third warning passed the spike threshold; the error is never digested
+    sent = [call[1]["text"] for call in mock_bot.send_message.call_args_list]
+    assert len(sent) == 2
+    assert "Stock low 2" in sent[0]
+    assert "Payment failed" in sent[1]
+
+    await handler.aclose()
+    digest = mock_bot.send_message.call_args[1]["text"]
+    assert digest.startswith("⚠️ 🔷 <b>Shop</b>\n📊 Digest ")
+    assert (
+        ": 52 records\nINFO: 50 (shop 50)\nWARNING: 2 (shop 2), sent immediately since"
+        in digest
+    )
+    assert digest.endswith("#Shop")
+
+
+@pytest.mark.asyncio
+async def test_live_status_is_edited_in_place(mock_bot):
+    """Test that live records update one pinned message at a bounded rate."""
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=TEST_CHAT_ID,
+        live_status=True,
+        live_interval=60,
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+
+    def record(level, msg):
+        return logging.LogRecord(
+            name="worker",
+            level=level,
+            pathname="test.py",
+            lineno=1,
+            msg=msg,
+            args=(),
+            exc_info=None,
+        )
+
+    handler.emit(record(logging.INFO, "Job 1 done"))
+    await handler._process_queue()
+    assert mock_bot.send_message.call_count == 1
+    status = mock_bot.send_message.call_args[1]
+    assert status["text"].startswith("ℹ️ 📟 Live status: INFO 1\n\n")
+    assert status["disable_notification"] is True
+    mock_bot.pin_chat_message.assert_called_once_with(
+        chat_id=TEST_CHAT_ID, message_id=12345, disable_notification=True
+    )
+
+    # Nothing changed, and then the next edit is not due yet
+    await handler._process_queue()
+    handler.emit(record(logging.INFO, "Job 2 done"))
+    await handler._process_queue()
+    assert mock_bot.edit_message_text.call_count == 0
+
+    # Errors are still sent as their own messages
+    await handler.aemit(record(logging.ERROR, "Job 3 failed"))
+    assert mock_bot.send_message.call_args[1]["text"] == "❌ Job 3 failed"
+
+    # The final state is shown when the handler closes
+    await handler.aclose()
+    edit = mock_bot.edit_message_text.call_args[1]
+    assert edit["message_id"] == 12345
+    assert "INFO 2" in edit["text"] and edit["text"].endswith("Job 2 done")
+    assert mock_bot.send_message.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_chats_share_batch_plans(mock_bot):
+    """Test that chats at the same position reuse one packed batch."""
+    chat_ids = [str(100 + i) for i in range(4)]
+    handler = TelegramHandler(
+        token=TEST_TOKEN,
+        chat_ids=chat_ids,
+        batch_size=10,
+        document_threshold=1000,
+        test_mode=True,
+    )
+    handler._bot = mock_bot
+    mock_bot.send_document = AsyncMock()
+
+    for msg in ("First", "x " * 1000, "Second"):
+        handler.emit(
+            logging.LogRecord(
+                name="test",
+                level=logging.INFO,
+                pathname="test.py",
+                lineno=1,
+                msg=msg,
+                args=(),
+                exc_info=None,
+            )
+        )
+    with patch.object(handler, "_plan_sends", wraps=handler._plan_sends) as plan:
+        await handler._process_queue()
+    # Planned once for all four chats
+    assert plan.call_count == 1
+
+    texts = [call[1]["text"] for call in mock_bot.send_message.call_args_list]
+    assert sorted(texts) == ["ℹ️ First"] * 4 + ["ℹ️ Second"] * 4
+    # Every chat is sent the same joined text objects
+    assert len({id(text) for text in texts}) == 2
+    uploads = mock_bot.send_document.call_args_list
+    assert sorted(call[1]["chat_id"] for call in uploads) == chat_ids
+    # One compressed file, shared by every upload without copies
+    contents = [call[1]["document"].read() for call in uploads]
+    assert all(content is contents[0] for content in contents)
+
+    await handler.aclose()
@@ -91,7 +91,7 @@ async def handler(mock_bot):
     )
     handler._bot = mock_bot  # Replace the bot instance directly
     yield handler
-    await handler.close()
+    await handler.aclose()
 
 
 @pytest.mark.asyncio
@@ -114,7 +114,7 @@ async def test_custom_formatting(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send message and wait for processing
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord("test_custom", logging.INFO, "", 0, "Test message", (), None)
     )
     await asyncio.sleep(0.1)
@@ -132,7 +132,7 @@ async def test_batch_processing(handler, mock_bot):
 
     # Send messages directly
     for msg in ["Message 1", "Message 2", "Message 3"]:
-        await handler.emit(
+        await handler.aemit(
             logger.makeRecord("test_batch", logging.INFO, "", 0, msg, (), None)
         )
 
@@ -192,7 +192,7 @@ async def test_multiple_chat_ids(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send message directly
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord(
             "test_multi", logging.INFO, "", 0, "Multi-chat message", (), None
         )
@@ -249,7 +249,7 @@ async def test_shutdown_handling(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send pre-shutdown message directly
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord(
             "test_shutdown", logging.INFO, "", 0, "Pre-shutdown message", (), None
         )
@@ -257,10 +257,10 @@ async def test_shutdown_handling(mock_bot):
     await asyncio.sleep(0.1)
 
     # Simulate shutdown
-    await handler.close()
+    await handler.aclose()
 
     # Try sending after shutdown
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord(
             "test_shutdown", logging.INFO, "", 0, "Post-shutdown message", (), None
         )
@@ -285,7 +285,7 @@ async def test_async_context_manager(mock_bot):
         logger.addHandler(handler)
 
         # Send message directly
-        await handler.emit(
+        await handler.aemit(
             logger.makeRecord(
                 "test_context", logging.INFO, "", 0, "Context message", (), None
             )
@@ -316,7 +316,7 @@ async def test_custom_level_emojis(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send message directly
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord("test_emoji", logging.INFO, "", 0, "Emoji test", (), None)
     )
     await asyncio.sleep(0.1)
@@ -340,7 +340,7 @@ async def test_signal_handling(mock_bot):
     await asyncio.sleep(0.1)
 
     # Try sending after signal
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord(
             "test_signal", logging.INFO, "", 0, "Post-signal message", (), None
         )
@@ -367,7 +367,7 @@ async def test_custom_date_format(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send message directly
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord(
             "test_date", logging.INFO, "", 0, "Date format test", (), None
         )
@@ -400,7 +400,7 @@ async def test_project_name_and_hashtags(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send message directly
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord("test_project", logging.INFO, "", 0, "Project test", (), None)
     )
     await asyncio.sleep(0.1)
@@ -424,7 +424,7 @@ async def test_html_formatting(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send message directly
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord(
             "test_html",
             logging.INFO,
@@ -454,7 +454,7 @@ async def test_queue_overflow_handling(handler, mock_bot):
 
     # Send many messages directly
     for i in range(10):
-        await handler.emit(
+        await handler.aemit(
             logger.makeRecord(
                 "test_overflow", logging.INFO, "", 0, f"Message {i}", (), None
             )
@@ -466,19 +466,33 @@ async def test_queue_overflow_handling(handler, mock_bot):
     assert mock_bot.send_message.call_count > 5
 
 
-@pytest.mark.asyncio
-async def test_invalid_token_handling():
-    """Test handling of invalid token."""
+def test_invalid_token_handling():
+    """Test that an invalid token is reported in the background."""
     mock_bot = MagicMock()
-    mock_bot.get_me = AsyncMock(side_effect=InvalidToken("Invalid token"))
+    mock_bot.initialize = AsyncMock(side_effect=InvalidToken("Invalid token"))
+    mock_bot.close = AsyncMock()
+    errors = []
+    reported = threading.Event()
+
+    def on_validation_error(error):
+        errors.append(error)
+        reported.set()
+
+    with patch("tgbot_logging.handler.Bot", return_value=mock_bot), patch(
+        "signal.signal"
+    ):
+        # Construction does not touch the network and does not raise
+        handler = CustomTelegramHandler(
+            token="invalid_token",
+            chat_ids=TEST_CHAT_ID,
+            test_mode=False,  # Important: set to False to trigger token validation
+            on_validation_error=on_validation_error,
+        )
 
-    with patch("telegram.Bot", return_value=mock_bot):
-        with pytest.raises(InvalidToken):
-            handler = CustomTelegramHandler(
-                token="invalid_token",
-                chat_ids=TEST_CHAT_ID,
-                test_mode=False,  # Important: set to False to trigger token validation
-            )
+        assert reported.wait(1)
+        assert isinstance(errors[0], InvalidToken)
+        assert handler.token_valid is False
+        handler.close()
 
 
 @pytest.mark.asyncio
@@ -501,7 +515,7 @@ async def test_message_formatting_error_handling(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send message directly
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord(
             "test_format_error", logging.INFO, "", 0, "Test message", (), None
         )
@@ -532,7 +546,7 @@ async def test_signal_handling_with_cleanup(mock_bot):
     record = logging.LogRecord(
         "test_signal", logging.INFO, "", 0, "Post-signal message", (), None
     )
-    await handler.emit(record)
+    await handler.aemit(record)
     await asyncio.sleep(TEST_SLEEP)
 
     # Handler should be closed and cleanup should be done
@@ -616,7 +630,7 @@ async def test_batch_processing_with_force(mock_bot):
 
     # Send messages
     for i in range(3):  # Less than batch size
-        await handler.emit(
+        await handler.aemit(
             logger.makeRecord(
                 "test_batch_force", logging.INFO, "", 0, f"Message {i}", (), None
             )
@@ -654,7 +668,7 @@ async def test_message_queue_overflow(mock_bot):
 
     # Send many messages to overflow the queue
     for i in range(10):  # Reduced from 100 to 10 for faster testing
-        await handler.emit(
+        await handler.aemit(
             logger.makeRecord(
                 "test_overflow", logging.INFO, "", 0, f"Message {i}", (), None
             )
@@ -685,17 +699,17 @@ async def test_graceful_shutdown_with_pending_messages(mock_bot):
 
     # Send messages
     for i in range(3):
-        await handler.emit(
+        await handler.aemit(
             logger.makeRecord(
                 "test_shutdown", logging.INFO, "", 0, f"Message {i}", (), None
             )
         )
 
     # Start shutdown
-    await handler.close()
+    await handler.aclose()
 
     # Try sending after shutdown
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord(
             "test_shutdown", logging.INFO, "", 0, "Post-shutdown message", (), None
         )
@@ -734,10 +748,10 @@ async def test_custom_formatter_with_all_features(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send messages with different levels
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord("test_format", logging.INFO, "", 0, "Info message", (), None)
     )
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord(
             "test_format", logging.ERROR, "", 0, "Error message", (), None
         )
@@ -800,7 +814,7 @@ async def test_event_loop_initialization():
             record = logging.LogRecord(
                 "test_init", logging.INFO, "", 0, "Test message", (), None
             )
-            await handler.emit(record)
+            await handler.aemit(record)
             await asyncio.sleep(TEST_SLEEP * 2)
 
             # Check that message was processed
@@ -808,7 +822,7 @@ async def test_event_loop_initialization():
             assert mock_bot.send_message.call_args[1]["text"] == "Test message"
     finally:
         if handler:
-            await handler.close()
+            await handler.aclose()
 
 
 @pytest.mark.asyncio
@@ -846,7 +860,7 @@ async def test_signal_handler_setup():
             )  # Not complete until close() is called
     finally:
         if handler:
-            await handler.close()
+            await handler.aclose()
 
 
 @pytest.mark.asyncio
@@ -888,7 +902,7 @@ async def test_batch_sender_thread():
             )  # Last message might still be in queue
     finally:
         if handler:
-            await handler.close()
+            await handler.aclose()
 
 
 @pytest.mark.asyncio
@@ -950,12 +964,12 @@ async def test_graceful_shutdown_cleanup(mock_bot):
 
     # Try to send more messages
     handler.message_queue[TEST_CHAT_ID].put_nowait("Message 3")
-    await handler.emit(
+    await handler.aemit(
         logging.LogRecord("test", logging.INFO, "", 0, "Message 4", (), None)
     )
 
     # Close handler
-    await handler.close()
+    await handler.aclose()
 
     # Check cleanup
     assert handler._closed
@@ -987,13 +1001,13 @@ async def test_message_formatting_with_errors(mock_bot):
     logger.setLevel(logging.INFO)
 
     # Send message that will cause formatting error
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord("test_format_error", logging.INFO, "", 0, "error", (), None)
     )
     await asyncio.sleep(TEST_SLEEP)
 
     # Send normal message
-    await handler.emit(
+    await handler.aemit(
         logger.makeRecord("test_format_error", logging.INFO, "", 0, "normal", (), None)
     )
     await asyncio.sleep(TEST_SLEEP)
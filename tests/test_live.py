@@ -0,0 +1,49 @@
+"""
+Tests for the live status message.
+"""
+
+import logging
+from functools import partial
+from tgbot_logging.live import LiveStatus
+from tgbot_logging.packer import visible_length
+from tests.helpers import make_record
+
+worker_record = partial(make_record, name="worker", created=0.0)
+
+
+def plain(text):
+    return text
+
+
+def test_render_counters_and_last_lines():
+    """Test that the status shows counts per level and the newest lines."""
+    status = LiveStatus(max_lines=2, level_emojis={logging.WARNING: "⚠️"})
+    status.add(worker_record("Job 1 done\nwith details"))
+    status.add(worker_record("Queue is long", level=logging.WARNING))
+    status.add(worker_record("Job 2 done"))
+
+    text, generation, version = status.render(plain, 4096)
+    lines = text.splitlines()
+    assert lines[0] == "📟 Live status: INFO 2 · WARNING 1"
+    assert lines[2].endswith(" ⚠️ Queue is long")
+    assert lines[3].endswith(" Job 2 done")
+    assert len(lines) == 4
+    assert (generation, version) == (0, 3)
+
+
+def test_outgrown_status_starts_a_new_message():
+    """Test that the status starts over with the newest lines when too long."""
+    status = LiveStatus(max_lines=100)
+    for i in range(10):
+        status.add(worker_record(f"Line {i} " + "x" * 50))
+    text, generation, _ = status.render(plain, 4096)
+    assert generation == 0
+
+    text, generation, _ = status.render(plain, 400)
+    assert generation == 1
+    assert visible_length(text) <= 200
+    assert "Line 9 " in text and "Line 0 " not in text
+
+    # The new message has room to grow before the next one is started
+    status.add(worker_record("Line 10 " + "x" * 50))
+    assert status.render(plain, 400)[1] == 1
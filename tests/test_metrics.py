@@ -0,0 +1,141 @@
+"""
+Tests for handler metrics.
+"""
+
+import math
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from telegram import Bot
+from telegram.error import NetworkError
+from tgbot_logging import TelegramHandler
+from tgbot_logging.metrics import HandlerMetrics, Histogram, prometheus_text
+from tests.helpers import make_record
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test that bucket counts include every smaller bucket, as in Prometheus."""
+    histogram = Histogram([1, 5, 10])
+    for value in (0.5, 1, 3, 7, 50):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {1: 2, 5: 3, 10: 4, math.inf: 5}
+    assert snapshot["sum"] == 61.5
+    assert snapshot["count"] == 5
+
+
+def test_snapshot_merges_gauges():
+    """Test that per-chat gauges are merged with the counters."""
+    metrics = HandlerMetrics()
+    metrics.add("enqueued", ["1", "2"], 3)
+    metrics.record_sent("1", 2, [0.5, 1.5])
+
+    snapshot = metrics.snapshot({"2": {"queue_depth": 3}, "3": {"queue_depth": 0}})
+    assert snapshot["chats"]["1"]["sent"] == 2
+    assert snapshot["chats"]["2"] == {
+        "enqueued": 3,
+        "sent": 0,
+        "retries": 0,
+        "failed_sends": 0,
+        "rejected": 0,
+        "queue_depth": 3,
+    }
+    assert snapshot["chats"]["3"]["enqueued"] == 0
+    assert snapshot["delivery_latency"]["count"] == 2
+    assert snapshot["batch_size"]["buckets"][2] == 1
+
+
+def test_prometheus_text():
+    """Test the Prometheus exposition of a snapshot."""
+    metrics = HandlerMetrics()
+    metrics.record_emitted()
+    metrics.add("enqueued", ["-100123"])
+    metrics.record_sent("-100123", 1, [0.2])
+    metrics.record_api_call(0.07)
+
+    text = prometheus_text(
+        metrics.snapshot({"-100123": {"queue_depth": 0}}),
+        labels={"project": 'My "App"'},
+    )
+    lines = text.splitlines()
+
+    assert "# TYPE tgbot_logging_records_emitted_total counter" in lines
+    assert 'tgbot_logging_records_emitted_total{project="My \\"App\\""} 1' in lines
+    assert (
+        'tgbot_logging_records_sent_total{project="My \\"App\\"",chat="-100123"} 1'
+        in lines
+    )
+    assert "# TYPE tgbot_logging_queue_depth gauge" in lines
+    assert (
+        'tgbot_logging_delivery_latency_seconds_bucket{project="My \\"App\\"",le="0.25"} 1'
+        in lines
+    )
+    assert (
+        'tgbot_logging_api_call_duration_seconds_bucket{project="My \\"App\\"",le="+Inf"} 1'
+        in lines
+    )
+    assert 'tgbot_logging_batch_size_records_count{project="My \\"App\\""} 1' in lines
+    assert text.endswith("\n")
+
+
+@pytest.mark.asyncio
+async def test_handler_metrics():
+    """Test that the handler counts records, retries and delivery."""
+    bot = AsyncMock(spec=Bot)
+    bot.send_message = AsyncMock(
+        side_effect=[NetworkError("Test network error"), MagicMock()]
+    )
+    handler = TelegramHandler(
+        token="test_token",
+        chat_ids="123456789",
+        batch_size=3,
+        retry_delay=0.1,
+        test_mode=True,
+    )
+    handler._bot = bot
+
+    for i in range(3):
+        await handler.aemit(make_record(f"Message {i}"))
+
+    snapshot = handler.metrics_snapshot()
+    chat = snapshot["chats"]["123456789"]
+    assert snapshot["emitted"] == 3
+    assert chat["enqueued"] == 3
+    assert chat["sent"] == 3
+    assert chat["retries"] == 1
+    assert chat["failed_sends"] == 0
+    assert chat["queue_depth"] == 0 and chat["dropped"] == 0
+    assert snapshot["api_call_duration"]["count"] == 2
+    assert snapshot["batch_size"]["buckets"][5] == 1
+    assert snapshot["delivery_latency"]["count"] == 3
+    assert "tgbot_logging_records_sent_total" in handler.prometheus_metrics()
+
+    await handler.aclose()
+
+
+@pytest.mark.asyncio
+async def test_handler_metrics_failures_and_drops():
+    """Test that failed sends and overflow drops are reported."""
+    bot = AsyncMock(spec=Bot)
+    bot.send_message = AsyncMock(side_effect=NetworkError("Test network error"))
+    handler = TelegramHandler(
+        token="test_token",
+        chat_ids="123456789",
+        batch_size=10,
+        max_queue_size=2,
+        max_retries=0,
+        retry_delay=0.1,
+        test_mode=True,
+    )
+    handler._bot = bot
+
+    for i in range(3):
+        handler.emit(make_record(f"Message {i}"))
+    await handler._process_queue()
+
+    chat = handler.metrics_snapshot()["chats"]["123456789"]
+    assert chat["dropped"] == 1
+    assert chat["failed_sends"] == 1
+    assert chat["sent"] == 0
+    assert chat["queue_depth"] == 2
+    assert chat["queue_bytes"] > 0
@@ -0,0 +1,131 @@
+"""
+Tests for size-aware message packing.
+"""
+
+import pytest
+from tgbot_logging.packer import (
+    MAX_MESSAGE_LENGTH,
+    pack_messages,
+    plain_text,
+    split_message,
+    utf16_len,
+    visible_length,
+)
+from tgbot_logging.rendering import code_block
+
+
+def test_utf16_len():
+    """Test that characters outside the BMP count as two units."""
+    assert utf16_len("abc") == 3
+    assert utf16_len("ёж") == 2
+    assert utf16_len("🚨") == 2
+    assert utf16_len("a🚀b") == 4
+
+
+def test_visible_length_html():
+    """Test that HTML tags are free and entities count once."""
+    assert visible_length("<b>Bold</b> &amp; <a href='x'>link</a>", "HTML") == 11
+    assert visible_length("<b>Bold</b>", None) == 11
+
+
+def test_visible_length_markdown():
+    """Test that MarkdownV2 markup and escapes are not counted."""
+    assert visible_length("*bold* \\. _it_", "MarkdownV2") == 9
+    assert visible_length("[link](http://example.com)", "MarkdownV2") == 4
+
+
+def test_pack_fills_to_limit():
+    """Test that messages are packed greedily in order."""
+    messages = ["a" * 4] * 5
+    groups = pack_messages(messages, limit=10)
+
+    # "aaaa\n\naaaa" is exactly 10 units
+    assert groups == [["aaaa", "aaaa"], ["aaaa", "aaaa"], ["aaaa"]]
+
+
+def test_pack_counts_visible_length():
+    """Test that markup does not use up the limit."""
+    messages = ["<b>aaaa</b>"] * 2
+    assert len(pack_messages(messages, limit=20, parse_mode="HTML")) == 1
+    assert len(pack_messages(messages, limit=20, parse_mode=None)) == 2
+
+
+def test_pack_every_group_fits():
+    """Test that no packed request exceeds Telegram's limit."""
+    messages = [f"Message {i} " + "🚀" * (i * 37 % 900) for i in range(200)]
+    groups = pack_messages(messages, parse_mode="HTML")
+
+    for group in groups:
+        assert visible_length("\n\n".join(group), "HTML") <= MAX_MESSAGE_LENGTH
+    assert sum(len(group) for group in groups) == len(messages)
+
+
+def test_split_prefers_newlines():
+    """Test that oversized messages are split at line boundaries."""
+    text = "\n".join(["x" * 8] * 4)
+    pieces = split_message(text, limit=20)
+
+    assert pieces == ["xxxxxxxx\nxxxxxxxx\n", "xxxxxxxx\nxxxxxxxx"]
+
+
+def test_split_without_boundaries():
+    """Test that text without spaces is cut hard."""
+    pieces = split_message("a" * 25, limit=10)
+    assert pieces == ["a" * 10, "a" * 10, "a" * 5]
+
+
+def test_split_keeps_html_balanced():
+    """Test that tags open at a cut are closed and reopened."""
+    text = "<pre>" + "line of code\n" * 10 + "</pre>"
+    pieces = split_message(text, limit=40, parse_mode="HTML")
+
+    assert len(pieces) > 1
+    for piece in pieces:
+        assert piece.startswith("<pre>")
+        assert piece.endswith("</pre>")
+        assert visible_length(piece, "HTML") <= 40
+    assert "".join(p[5:-6] for p in pieces) == "line of code\n" * 10
+
+
+def test_markdown_code_keeps_markup_characters():
+    """Test that MarkdownV2 markup characters inside code are counted as text."""
+    assert visible_length("`a_b*c`", "MarkdownV2") == 5
+    assert visible_length("```python\nx = [a_b]\n```", "MarkdownV2") == 10
+    assert visible_length("*a* \\`b\\` `c\\`d`", "MarkdownV2") == 9
+
+
+def test_split_keeps_markdown_code_blocks_balanced():
+    """Test that a long MarkdownV2 traceback is split into closed code blocks."""
+    traceback = "Traceback (most recent call last):\n" + "".join(
+        f'  File "/app/job_{i}.py", line {i}, in run_[task]\n    raise `Err`\n'
+        for i in range(150)
+    )
+    text = "Job *failed*\n" + code_block(traceback, "MarkdownV2")
+    pieces = split_message(text, limit=MAX_MESSAGE_LENGTH, parse_mode="MarkdownV2")
+
+    assert len(pieces) > 1
+    for piece in pieces:
+        assert piece.count("```") == 2 and piece.endswith("```")
+        assert visible_length(piece, "MarkdownV2") <= MAX_MESSAGE_LENGTH
+    assert all(piece.startswith("```\n") for piece in pieces[1:])
+    shown = "".join(plain_text(piece, "MarkdownV2") for piece in pieces)
+    assert shown.replace("\n", "") == plain_text(text, "MarkdownV2").replace("\n", "")
+
+
+def test_split_never_cuts_entities():
+    """Test that HTML entities stay intact."""
+    pieces = split_message("&lt;" * 30, limit=7, parse_mode="HTML")
+    assert all(p.count("&") == p.count(";") for p in pieces)
+    assert "".join(pieces) == "&lt;" * 30
+
+
+@pytest.mark.parametrize("parse_mode", [None, "HTML", "MarkdownV2"])
+def test_oversized_record_is_split(parse_mode):
+    """Test that an oversized record is delivered in fitting pieces."""
+    text = "word " * 2000
+    groups = pack_messages(["short", text, "tail"], parse_mode=parse_mode)
+
+    assert groups[0][0] == "short"
+    assert groups[-1][-1] == "tail"
+    for group in groups:
+        assert visible_length("\n\n".join(group), parse_mode) <= MAX_MESSAGE_LENGTH
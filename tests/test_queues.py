@@ -0,0 +1,236 @@
+"""
+Tests for bounded message queues.
+"""
+
+import threading
+import time
+import pytest
+from queue import Empty
+from tgbot_logging.queues import MessageQueue, LaneQueue, QueuedMessage
+
+
+def test_unbounded_queue_is_fifo():
+    """Test that an unbounded queue keeps every message in order."""
+    queue = MessageQueue()
+    for i in range(100):
+        assert queue.put_nowait(f"Message {i}")
+
+    assert queue.qsize() == 100
+    assert queue.get_nowait() == "Message 0"
+    assert queue.dropped == 0
+
+
+def test_get_from_empty_queue():
+    """Test that an empty queue raises queue.Empty."""
+    queue = MessageQueue()
+    assert queue.empty()
+    with pytest.raises(Empty):
+        queue.get_nowait()
+
+
+def test_invalid_policy():
+    """Test that unknown overflow policies are rejected."""
+    with pytest.raises(ValueError):
+        MessageQueue(max_size=1, overflow_policy="explode")
+
+
+def test_drop_oldest():
+    """Test that drop_oldest evicts the oldest messages."""
+    queue = MessageQueue(max_size=3, overflow_policy="drop_oldest")
+    for i in range(5):
+        assert queue.put(f"Message {i}")
+
+    assert queue.qsize() == 3
+    assert queue.dropped == 2
+    assert queue.get_nowait() == "Message 2"
+
+
+def test_drop_newest():
+    """Test that drop_newest rejects incoming messages."""
+    queue = MessageQueue(max_size=3, overflow_policy="drop_newest")
+    results = [queue.put(f"Message {i}") for i in range(5)]
+
+    assert results == [True, True, True, False, False]
+    assert queue.dropped == 2
+    assert queue.get_nowait() == "Message 0"
+
+
+def test_byte_limit():
+    """Test that the byte limit counts UTF-8 size."""
+    queue = MessageQueue(max_bytes=10, overflow_policy="drop_oldest")
+    queue.put("ab")
+    queue.put("ёё")  # 4 bytes
+    queue.put("abcdef")  # 6 bytes, evicts "ab"
+
+    assert queue.nbytes == 10
+    assert queue.dropped == 1
+    assert queue.get_nowait() == "ёё"
+
+
+def test_oversized_message_is_kept_alone():
+    """Test that a single message larger than the byte limit is not lost."""
+    queue = MessageQueue(max_bytes=4, overflow_policy="drop_oldest")
+    queue.put("abc")
+    queue.put("abcdefgh")
+
+    assert queue.qsize() == 1
+    assert queue.get_nowait() == "abcdefgh"
+
+
+def test_block_times_out():
+    """Test that block waits for the timeout and then drops."""
+    queue = MessageQueue(max_size=1, overflow_policy="block", overflow_timeout=0.05)
+    queue.put("first")
+
+    start = time.monotonic()
+    assert not queue.put("second")
+    assert time.monotonic() - start >= 0.05
+    assert queue.dropped == 1
+
+    # put_nowait never waits
+    start = time.monotonic()
+    assert not queue.put_nowait("third")
+    assert time.monotonic() - start < 0.05
+
+
+def test_block_waits_for_room():
+    """Test that block admits the message once a consumer makes room."""
+    queue = MessageQueue(max_size=1, overflow_policy="block", overflow_timeout=2)
+    queue.put("first")
+
+    consumer = threading.Timer(0.05, queue.get_nowait)
+    consumer.start()
+    assert queue.put("second")
+    consumer.join()
+
+    assert queue.dropped == 0
+    assert queue.get_nowait() == "second"
+
+
+def test_downsample():
+    """Test that downsample keeps one in every N overflowing messages."""
+    queue = MessageQueue(max_size=2, overflow_policy="downsample", downsample_rate=3)
+    results = [queue.put(f"Message {i}") for i in range(8)]
+
+    # Two fit, then overflow #1, #4 are admitted
+    assert results == [True, True, True, False, False, True, False, False]
+    assert queue.dropped == 6
+    assert queue.get_nowait() == "Message 2"
+    assert queue.get_nowait() == "Message 5"
+
+
+def test_requeue_goes_to_front():
+    """Test that failed messages are put back in front of newer ones."""
+    queue = MessageQueue(max_size=3)
+    queue.put("new")
+    queue.requeue(["old 1", "old 2"])
+
+    assert [queue.get_nowait() for _ in range(3)] == ["old 1", "old 2", "new"]
+
+
+def test_requeue_respects_bounds():
+    """Test that requeueing trims according to the policy."""
+    oldest = MessageQueue(max_size=2, overflow_policy="drop_oldest")
+    oldest.put("new")
+    oldest.requeue(["old 1", "old 2"])
+    assert [oldest.get_nowait() for _ in range(2)] == ["old 2", "new"]
+    assert oldest.dropped == 1
+
+    newest = MessageQueue(max_size=2, overflow_policy="drop_newest")
+    newest.put("new")
+    newest.requeue(["old 1", "old 2"])
+    assert [newest.get_nowait() for _ in range(2)] == ["old 1", "old 2"]
+    assert newest.dropped == 1
+
+
+def test_lane_queue_is_earliest_deadline_first():
+    """Test that lanes are drained by deadline, not by arrival."""
+    queue = LaneQueue([0.5, 30.0])
+    queue.put("info 1", lane=1)
+    queue.put("info 2", lane=1)
+    queue.put("critical", lane=0)
+
+    assert queue.qsize() == 3
+    assert queue.get_nowait() == "critical"
+    assert queue.get_nowait() == "info 1"
+    assert queue.get_nowait() == "info 2"
+    assert queue.empty()
+    with pytest.raises(Empty):
+        queue.get_nowait()
+
+
+def test_lane_queue_old_low_priority_beats_new_high_priority():
+    """Test that a low-priority message past its deadline is not starved."""
+    queue = LaneQueue([0.5, 1.0])
+    queue.put("info", lane=1)
+    time.sleep(0.6)
+    queue.put("critical", lane=0)
+
+    assert queue.get_nowait() == "info"
+    assert queue.get_nowait() == "critical"
+
+
+def test_lane_queue_next_deadline_and_retry():
+    """Test deadlines and that failed messages are retried first."""
+    queue = LaneQueue([2.0, 30.0])
+    assert queue.next_deadline() is None
+
+    before = time.monotonic()
+    queue.put("info", lane=1)
+    queue.put("error", lane=0)
+    assert before + 2.0 <= queue.next_deadline() <= time.monotonic() + 2.0
+
+    queue.requeue(["failed"])
+    assert queue.next_deadline() <= time.monotonic()
+    assert [queue.get_nowait() for _ in range(3)] == ["failed", "error", "info"]
+
+
+def test_lane_queue_bounds_the_whole_chat():
+    """Test that one bound covers every lane and evicts the least urgent lane."""
+    queue = LaneQueue([0.5, 30.0], max_size=2)
+    queue.put("low 1", lane=1)
+    queue.put("high 1", lane=0)
+    queue.put("high 2", lane=0)
+
+    assert queue.qsize() == 2 and queue.dropped == 1
+    assert [queue.get_nowait() for _ in range(2)] == ["high 1", "high 2"]
+
+
+def test_lane_queue_evicts_retry_lane_last():
+    """Test that requeued messages are kept over fresh ones when trimming."""
+    dropped = []
+    queue = LaneQueue([0.5, 30.0], max_size=2, on_drop=dropped.append)
+    queue.put("info", lane=1)
+    queue.put("error", lane=0)
+    queue.requeue(["failed"])
+
+    assert dropped == ["info"]
+    assert [queue.get_nowait() for _ in range(2)] == ["failed", "error"]
+
+    queue.requeue(["failed 1", "failed 2", "failed 3"])
+    assert queue.qsize() == 2 and queue.dropped == 2
+    assert [queue.get_nowait() for _ in range(2)] == ["failed 2", "failed 3"]
+
+
+def test_lane_queue_block_waits_for_any_lane():
+    """Test that the block policy is woken by a message leaving another lane."""
+    queue = LaneQueue([0.5, 30.0], max_size=1, overflow_policy="block")
+    queue.put("info", lane=1)
+    threading.Timer(0.1, queue.get_nowait).start()
+
+    start = time.monotonic()
+    assert queue.put("error", lane=0)
+    assert time.monotonic() - start < 1.0
+    assert queue.get_nowait() == "error"
+
+
+def test_queued_message_size_is_measured_once():
+    """Test that queues use the size a QueuedMessage carries."""
+    message = QueuedMessage("ёж", seq=1)
+    assert message.nbytes == 4
+
+    # The queue trusts the carried size instead of encoding the text again
+    message.nbytes = 7
+    queue = MessageQueue(max_bytes=10)
+    queue.put(message)
+    assert queue.nbytes == 7
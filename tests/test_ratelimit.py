@@ -0,0 +1,86 @@
+"""
+Tests for token-bucket rate limiting.
+"""
+
+import asyncio
+import time
+import pytest
+from tgbot_logging.ratelimit import RateLimiter, TokenBucket
+
+
+def test_bucket_allows_burst_then_spaces_tokens():
+    """Test that a bucket admits a burst and then one token per interval."""
+    bucket = TokenBucket(rate=2, burst=3)
+    times = []
+    for _ in range(5):
+        at = bucket.earliest(0.0)
+        bucket.consume(at)
+        times.append(at)
+
+    assert times == [0.0, 0.0, 0.0, 0.5, 1.0]
+
+
+def test_bucket_refills_over_time():
+    """Test that an idle bucket is full again."""
+    bucket = TokenBucket(rate=1, burst=2)
+    for _ in range(2):
+        bucket.consume(bucket.earliest(0.0))
+
+    assert bucket.earliest(0.0) == 1.0
+    assert bucket.earliest(10.0) == 10.0
+
+
+def test_bucket_penalty():
+    """Test that a penalty empties the bucket until the deadline."""
+    bucket = TokenBucket(rate=10, burst=5)
+    bucket.penalize(30.0)
+    assert bucket.earliest(0.0) == 30.0
+
+
+def test_invalid_rate():
+    """Test that a non-positive rate is rejected."""
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_private_and_group_chat_quotas():
+    """Test the default per-chat quotas."""
+    limiter = RateLimiter()
+
+    private = [limiter.chat_bucket("123").reserve(0.0) for _ in range(3)]
+    group = [limiter.chat_bucket("-100123").reserve(0.0) for _ in range(3)]
+
+    assert private == [0.0, 1.0, 2.0]
+    assert group == pytest.approx([0.0, 3.0, 6.0])
+    assert limiter.is_group_chat("@channel")
+
+
+@pytest.mark.asyncio
+async def test_global_quota_spans_chats():
+    """Test that the global bucket limits sends across all chats."""
+    limiter = RateLimiter(global_rate=20, global_burst=2)
+
+    start = time.monotonic()
+    await asyncio.gather(*(limiter.acquire(str(chat_id)) for chat_id in range(4)))
+
+    # Two sends in the burst, then one every 50ms
+    assert time.monotonic() - start >= 0.09
+
+
+def test_chat_limit_overrides():
+    """Test per-chat overrides."""
+    limiter = RateLimiter(chat_limits={123: (100.0, 10)})
+
+    assert all(limiter.chat_bucket("123").reserve(0.0) == 0.0 for _ in range(10))
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_slot():
+    """Test that acquire sleeps until the reserved slot."""
+    limiter = RateLimiter(private_chat_rate=20, private_chat_burst=1)
+
+    start = time.monotonic()
+    for _ in range(3):
+        await limiter.acquire("123")
+
+    assert time.monotonic() - start >= 0.09
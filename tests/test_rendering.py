@@ -0,0 +1,114 @@
+"""
+Tests for message rendering.
+"""
+
+import logging
+from functools import partial
+import re
+import sys
+from tgbot_logging.rendering import MessageRenderer, hashtag
+from tests.helpers import make_record
+
+disk_error = partial(make_record, msg="Disk full", level=logging.ERROR, name="app")
+
+LEVEL_EMOJIS = {logging.INFO: "ℹ️", logging.ERROR: "❌"}
+
+
+def test_default_message_has_level_emoji_only():
+    """Test that without a project only the level emoji is added."""
+    renderer = MessageRenderer(level_emojis=LEVEL_EMOJIS)
+    assert renderer.render(disk_error()) == "❌ Disk full"
+
+
+def test_project_header_and_hashtag():
+    """Test the full header with an escaped project name and sanitized hashtag."""
+    renderer = MessageRenderer(
+        project_name="Billing <API> v2",
+        project_emoji="🚀",
+        level_emojis=LEVEL_EMOJIS,
+    )
+    assert renderer.render(disk_error()) == (
+        "❌ 🚀 <b>Billing &lt;API&gt; v2</b>\nDisk full\n#Billing_API_v2"
+    )
+
+
+def test_markdown_header():
+    """Test that MarkdownV2 headers are bold and escaped."""
+    renderer = MessageRenderer(
+        parse_mode="MarkdownV2",
+        project_name="my-app",
+        level_emojis=LEVEL_EMOJIS,
+        include_level_emoji=False,
+    )
+    assert renderer.render(disk_error()) == "🔷 *my\\-app*\nDisk full\n\\#my\\_app"
+
+
+def test_header_options():
+    """Test the include and hashtag switches."""
+    renderer = MessageRenderer(
+        project_name="App",
+        level_emojis=LEVEL_EMOJIS,
+        include_project_name=False,
+        add_hashtags=False,
+    )
+    assert renderer.render(disk_error()) == "❌ Disk full"
+    assert hashtag("  --  ") == ""
+
+
+def test_headers_are_cached_per_level_and_logger():
+    """Test that the context is built once and reused."""
+    contexts = []
+
+    def message_format(record, context):
+        contexts.append(context)
+        return f"{context['header']} {record.getMessage()} {context['hashtags']}"
+
+    renderer = MessageRenderer(
+        project_name="App", level_emojis=LEVEL_EMOJIS, message_format=message_format
+    )
+    assert renderer.render(disk_error()) == "❌ 🔷 <b>App</b> Disk full #App"
+    renderer.render(disk_error(msg="Other"))
+    renderer.render(disk_error(level=logging.INFO))
+    renderer.render(disk_error(name="other"))
+
+    assert contexts[0] is contexts[1]
+    assert contexts[2] is not contexts[0]
+    assert contexts[3] is not contexts[0]
+    assert contexts[0]["level_emoji"] == "❌"
+    assert contexts[0]["logger_name"] == "app"
+    assert renderer.context(disk_error()) is contexts[0]
+
+
+def test_message_format_errors_fall_back():
+    """Test that a failing message_format does not lose the record."""
+
+    def message_format(record, context):
+        raise ValueError("boom")
+
+    renderer = MessageRenderer(level_emojis=LEVEL_EMOJIS, message_format=message_format)
+    assert renderer.render(disk_error()) == "❌ Disk full"
+
+
+def test_traceback_is_escaped_in_pre_block():
+    """Test that tracebacks cannot break HTML parsing."""
+    try:
+        raise ValueError("bad <value>")
+    except ValueError:
+        exc_info = sys.exc_info()
+
+    text = MessageRenderer().render(disk_error(exc_info=exc_info))
+    assert text.startswith("Disk full\n<pre>Traceback (most recent call last):")
+    assert "ValueError: bad &lt;value&gt;</pre>" in text
+    assert "<module>" not in text
+
+
+def test_timestamp_and_formatter():
+    """Test the datefmt timestamp and switching formatters."""
+    renderer = MessageRenderer(datefmt="%Y-%m-%d")
+    assert re.fullmatch(r"\d{4}-\d{2}-\d{2} Disk full", renderer.render(disk_error()))
+
+    # A format that prints the time itself does not get a second timestamp
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s", "%H:%M")
+    text = renderer.render(disk_error(), formatter)
+    assert re.fullmatch(r"\d{2}:\d{2} ERROR Disk full", text)
+    assert renderer.context(disk_error())["formatter"] is formatter
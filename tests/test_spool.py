@@ -0,0 +1,223 @@
+"""
+Tests for the durable message spool.
+"""
+
+import os
+import pytest
+from tgbot_logging.queues import MessageQueue, QueuedMessage
+from tgbot_logging.packer import pack_messages
+from tgbot_logging.spool import Spool
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".log"))
+
+
+def test_append_and_ack(tmp_path):
+    """Test that messages stay pending until every chat acknowledged them."""
+    spool = Spool(str(tmp_path))
+    first = spool.append("first", ["1", "2"])
+    second = spool.append("second", ["1"])
+    assert second == first + 1
+
+    spool.ack([first, second], "1")
+    assert spool.pending() == [(first, {"2"}, "first")]
+
+    spool.ack([first], "2")
+    assert spool.pending() == []
+    spool.close()
+
+
+def test_replay_after_restart(tmp_path):
+    """Test that unacknowledged messages survive a restart."""
+    spool = Spool(str(tmp_path))
+    seqs = [spool.append(f"Message {i}", ["1", "2"]) for i in range(5)]
+    spool.ack(seqs[:3], "1")
+    spool.ack(seqs[:1], "2")
+    spool.close()
+
+    spool = Spool(str(tmp_path))
+    assert [(seq, chats) for seq, chats, _ in spool.pending()] == [
+        (seqs[1], {"2"}),
+        (seqs[2], {"2"}),
+        (seqs[3], {"1", "2"}),
+        (seqs[4], {"1", "2"}),
+    ]
+    assert spool.pending()[0][2] == "Message 1"
+    # Sequence numbers keep increasing across restarts
+    assert spool.append("new", ["1"]) > seqs[-1]
+    spool.close()
+
+
+def test_replay_without_close(tmp_path):
+    """Test that a crash without close loses nothing written to the mapping."""
+    spool = Spool(str(tmp_path), fsync="never")
+    seq = spool.append("unclean", ["1"])
+
+    replayed = Spool(str(tmp_path))
+    assert replayed.pending() == [(seq, {"1"}, "unclean")]
+    replayed.close()
+    spool.close()
+
+
+def test_torn_tail_is_ignored(tmp_path):
+    """Test that a corrupted entry at the end stops the replay cleanly."""
+    spool = Spool(str(tmp_path))
+    spool.append("intact", ["1"])
+    spool.append("torn", ["1"])
+    spool.close()
+
+    path = os.path.join(str(tmp_path), segment_files(str(tmp_path))[0])
+    with open(path, "r+b") as f:
+        data = f.read()
+        f.seek(data.index(b"torn"))
+        f.write(b"xxxx")
+
+    spool = Spool(str(tmp_path))
+    assert [text for _, _, text in spool.pending()] == ["intact"]
+    spool.close()
+
+
+def test_unicode_and_control_text(tmp_path):
+    """Test that arbitrary text round-trips through the spool."""
+    text = "🚨 <b>Ошибка</b>\nline two"
+    spool = Spool(str(tmp_path))
+    spool.append(text, ["-100123", "@channel"])
+    spool.close()
+
+    spool = Spool(str(tmp_path))
+    assert spool.pending()[0][1:] == ({"-100123", "@channel"}, text)
+    spool.close()
+
+
+def test_acknowledged_segments_are_deleted(tmp_path):
+    """Test that segments are removed once everything in them is delivered."""
+    spool = Spool(str(tmp_path), segment_size=1024)
+    for i in range(100):
+        seq = spool.append(f"Message {i} " + "x" * 50, ["1"])
+        spool.ack([seq], "1")
+
+    assert len(segment_files(str(tmp_path))) <= 2
+    assert spool.disk_usage <= 2 * 1024
+    spool.close()
+
+
+def test_compaction_bounds_disk_use(tmp_path):
+    """Test that a few stuck messages do not pin every old segment."""
+    spool = Spool(str(tmp_path), segment_size=1024)
+    stuck = []
+    for i in range(200):
+        seq = spool.append(f"Message {i} " + "x" * 50, ["1"])
+        if i % 20 == 0:
+            stuck.append(seq)
+        else:
+            spool.ack([seq], "1")
+
+    assert len(segment_files(str(tmp_path))) <= 3
+    assert [seq for seq, _, _ in spool.pending()] == stuck
+    spool.close()
+
+    spool = Spool(str(tmp_path), segment_size=1024)
+    assert [seq for seq, _, _ in spool.pending()] == stuck
+    spool.close()
+
+
+def test_rotation_without_acks_keeps_every_message(tmp_path):
+    """Test that an outage with nothing delivered spans many segments."""
+    spool = Spool(str(tmp_path), segment_size=64 * 1024)
+    seqs = [spool.append(f"Message {i} " + "x" * 100, ["1"]) for i in range(5000)]
+
+    assert len(segment_files(str(tmp_path))) > 5
+    assert [seq for seq, _, _ in spool.pending()] == seqs
+    spool.close()
+
+    spool = Spool(str(tmp_path), segment_size=64 * 1024)
+    pending = spool.pending()
+    assert [seq for seq, _, _ in pending] == seqs
+    assert pending[-1][2] == "Message 4999 " + "x" * 100
+    spool.close()
+
+
+def test_compaction_larger_than_a_segment(tmp_path):
+    """Test that compacting more live data than a segment holds keeps it all."""
+    spool = Spool(str(tmp_path), segment_size=1024)
+    live = []
+    for i in range(400):
+        seq = spool.append(f"Message {i} " + "x" * 50, ["1"])
+        if i % 5 < 2:
+            live.append(seq)
+        else:
+            spool.ack([seq], "1")
+
+    assert [seq for seq, _, _ in spool.pending()] == live
+    spool.close()
+
+    spool = Spool(str(tmp_path), segment_size=1024)
+    assert [seq for seq, _, _ in spool.pending()] == live
+    spool.close()
+
+
+def test_compaction_keeps_partial_acks(tmp_path):
+    """Test that compacted messages only go to chats that still need them."""
+    spool = Spool(str(tmp_path), segment_size=1024)
+    first = spool.append("partly delivered", ["1", "2"])
+    spool.ack([first], "1")
+    for i in range(100):
+        seq = spool.append(f"Message {i} " + "x" * 50, ["1"])
+        spool.ack([seq], "1")
+    spool.close()
+
+    spool = Spool(str(tmp_path), segment_size=1024)
+    assert spool.pending() == [(first, {"2"}, "partly delivered")]
+    spool.close()
+
+
+@pytest.mark.parametrize("fsync", ["always", "interval", "never"])
+def test_fsync_modes(tmp_path, fsync):
+    """Test that every fsync mode persists messages."""
+    spool = Spool(str(tmp_path), fsync=fsync, fsync_interval=0)
+    seq = spool.append("message", ["1"])
+    spool.sync()
+    spool.close()
+
+    spool = Spool(str(tmp_path))
+    assert spool.pending() == [(seq, {"1"}, "message")]
+    spool.close()
+
+
+def test_invalid_fsync_mode(tmp_path):
+    """Test that unknown fsync modes are rejected."""
+    with pytest.raises(ValueError):
+        Spool(str(tmp_path), fsync="sometimes")
+
+
+def test_closed_spool(tmp_path):
+    """Test that a closed spool refuses writes and ignores late acks."""
+    spool = Spool(str(tmp_path))
+    seq = spool.append("message", ["1"])
+    spool.close()
+
+    with pytest.raises(ValueError):
+        spool.append("late", ["1"])
+    spool.ack([seq], "1")
+
+
+def test_queue_reports_drops():
+    """Test that the queue passes dropped messages to on_drop."""
+    dropped = []
+    queue = MessageQueue(max_size=2, on_drop=dropped.append)
+    for i in range(4):
+        queue.put_nowait(QueuedMessage(f"Message {i}", i))
+
+    assert [message.seq for message in dropped] == [0, 1]
+
+
+def test_split_message_keeps_seq_on_last_piece():
+    """Test that only the last piece of a split message carries its seq."""
+    message = QueuedMessage("word " * 20, 7)
+    groups = pack_messages([message], limit=30, parse_mode=None)
+    pieces = [piece for group in groups for piece in group]
+
+    assert len(pieces) > 1
+    assert isinstance(pieces[-1], QueuedMessage) and pieces[-1].seq == 7
+    assert not any(isinstance(piece, QueuedMessage) for piece in pieces[:-1])
@@ -0,0 +1,72 @@
+"""
+Tests for record stages.
+"""
+
+import logging
+from functools import partial
+import random
+import pytest
+from tgbot_logging.stages import RecordStage, FingerprintRateLimit, LevelSampler
+from tests.helpers import make_record
+
+db_error = partial(
+    make_record,
+    msg="Connection to %s failed",
+    args=("db",),
+    level=logging.ERROR,
+    name="app",
+    created=0.0,
+)
+
+
+def test_fingerprint_rate_limit():
+    """Test that each logger and template gets its own per-period allowance."""
+    stage = FingerprintRateLimit(max_records=3, period=60)
+    admitted = [stage(db_error(created=i)) for i in range(10)]
+    assert admitted == [True] * 3 + [False] * 7
+
+    # Another template and another logger have their own allowance
+    assert stage(db_error(msg="Other", created=10))
+    assert stage(db_error(name="other", created=10))
+
+    # The allowance refills over the period
+    assert stage(db_error(created=30))
+    assert stage.drain_suppressed() == {"rate limit, app: Connection to %s failed": 7}
+    assert stage.drain_suppressed() == {}
+
+
+def test_fingerprint_rate_limit_is_bounded():
+    """Test that the number of tracked fingerprints is capped."""
+    stage = FingerprintRateLimit(max_records=1, max_fingerprints=10)
+    for i in range(100):
+        stage(db_error(msg=f"Message {i}"))
+    assert len(stage._buckets) == 10
+
+
+def test_level_sampler():
+    """Test that sampled levels keep roughly their share and others pass."""
+    stage = LevelSampler({logging.DEBUG: 0.0, logging.INFO: 0.1}, rng=random.Random(42))
+    kept = sum(stage(db_error(level=logging.INFO)) for _ in range(10000))
+    assert 800 < kept < 1200
+    assert not any(stage(db_error(level=logging.DEBUG)) for _ in range(100))
+    assert all(stage(db_error(level=logging.ERROR)) for _ in range(100))
+
+    suppressed = stage.drain_suppressed()
+    assert suppressed["sampling, DEBUG"] == 100
+    assert suppressed["sampling, INFO"] == 10000 - kept
+
+
+def test_custom_stage():
+    """Test that custom stages only need to implement admit."""
+
+    class DropHealthChecks(RecordStage):
+        def admit(self, record):
+            return "healthz" not in record.msg
+
+    stage = DropHealthChecks()
+    assert stage(db_error(msg="GET /users"))
+    assert not stage(db_error(msg="GET /healthz"))
+    assert stage.drain_suppressed() == {"DropHealthChecks": 1}
+
+    with pytest.raises(NotImplementedError):
+        RecordStage().admit(db_error())
@@ -0,0 +1,94 @@
+"""
+Tests for exception fingerprinting and aggregation.
+"""
+
+import logging
+import sys
+from tgbot_logging.tracebacks import (
+    ExceptionTracker,
+    exception_fingerprint,
+    exception_summary,
+)
+
+
+def charge(order):
+    raise ValueError(f"Payment #{order} failed")
+
+
+def refund(order):
+    raise ValueError(f"Refund #{order} failed")
+
+
+def record_for(func, order, created=0.0):
+    try:
+        try:
+            func(order)
+        except ValueError as e:
+            raise RuntimeError("Billing failed") from e
+    except RuntimeError:
+        record = logging.LogRecord(
+            name="billing",
+            level=logging.ERROR,
+            pathname="billing.py",
+            lineno=1,
+            msg=f"Order {order} failed",
+            args=(),
+            exc_info=sys.exc_info(),
+        )
+    record.created = created
+    return record
+
+
+def test_fingerprint_ignores_messages():
+    """Test that the same stack with different messages has one fingerprint."""
+    first, second = record_for(charge, 1), record_for(charge, 2)
+    assert exception_fingerprint(first) == exception_fingerprint(second)
+    assert exception_fingerprint(first) != exception_fingerprint(record_for(refund, 1))
+    assert exception_fingerprint(logging.makeLogRecord({"msg": "No error"})) is None
+
+
+def test_fingerprint_from_text():
+    """Test that a forwarded traceback has the fingerprint of the exception."""
+    record = record_for(charge, 1)
+    forwarded = logging.makeLogRecord(
+        {
+            "msg": "Order 1 failed",
+            "exc_text": logging.Formatter().formatException(record.exc_info),
+        }
+    )
+    assert exception_fingerprint(forwarded) == exception_fingerprint(record)
+    assert exception_summary(forwarded) == "RuntimeError: Billing failed"
+
+
+def test_tracker_aggregates_repeats():
+    """Test that repeats are counted and reported once per window."""
+    tracker = ExceptionTracker(window=60)
+
+    assert tracker.admit(record_for(charge, 1, created=100))
+    assert not tracker.admit(record_for(charge, 2, created=110))
+    assert not tracker.admit(record_for(charge, 3, created=150))
+    assert tracker.admit(record_for(refund, 1, created=150))
+    assert tracker.collect(now=169) == []
+
+    (repeats,) = tracker.collect(now=170)
+    assert repeats.count == 2 and repeats.total == 3
+    assert (repeats.first_seen, repeats.last_seen) == (100, 150)
+    assert repeats.record.msg == "Order 3 failed"
+    assert tracker.suppressed == 2
+
+    # Later repeats are still references, with the total carried on
+    assert not tracker.admit(record_for(charge, 4, created=300))
+    (repeats,) = tracker.collect_all()
+    assert repeats.count == 1 and repeats.total == 4
+
+
+def test_tracker_forgets_least_recent():
+    """Test that a forgotten exception is sent in full again."""
+    tracker = ExceptionTracker(window=60, max_fingerprints=1)
+    assert tracker.admit(record_for(charge, 1))
+    assert not tracker.admit(record_for(charge, 2))
+    assert tracker.admit(record_for(refund, 1))
+
+    # The pending repeat was reported when the fingerprint was forgotten
+    assert [repeats.count for repeats in tracker.collect_all()] == [1]
+    assert tracker.admit(record_for(charge, 3))
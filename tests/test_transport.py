@@ -0,0 +1,73 @@
+"""
+Tests for the pooled HTTP transport.
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from tgbot_logging import TelegramHandler
+from tgbot_logging.transport import PooledHTTPXRequest, http2_available
+
+
+def test_pool_and_keepalive_settings():
+    """Test that pool size, keep-alive and timeouts reach the httpx client."""
+    request = PooledHTTPXRequest(
+        connection_pool_size=4,
+        keepalive_expiry=12.5,
+        connect_timeout=1.0,
+        read_timeout=2.0,
+        write_timeout=3.0,
+        pool_timeout=0.5,
+    )
+
+    limits = request._client_kwargs["limits"]
+    assert limits.max_connections == 4
+    assert limits.max_keepalive_connections == 4
+    assert limits.keepalive_expiry == 12.5
+
+    timeout = request._client.timeout
+    assert (timeout.connect, timeout.read, timeout.write, timeout.pool) == (
+        1.0,
+        2.0,
+        3.0,
+        0.5,
+    )
+
+
+def test_http2_falls_back_without_h2():
+    """Test that HTTP/2 is only enabled when h2 is installed."""
+    request = PooledHTTPXRequest(http2=True)
+    assert request.http2 == http2_available()
+
+
+@pytest.mark.asyncio
+async def test_handler_builds_pooled_bot():
+    """Test that the handler passes its transport settings to the Bot."""
+    with patch("tgbot_logging.handler.Bot") as bot_class:
+        handler = TelegramHandler(
+            token="test_token",
+            chat_ids="123",
+            test_mode=True,
+            connection_pool_size=3,
+            keepalive_expiry=5.0,
+        )
+
+    request = bot_class.call_args[1]["request"]
+    assert isinstance(request, PooledHTTPXRequest)
+    assert request.connection_pool_size == 3
+    assert request.keepalive_expiry == 5.0
+    assert handler.request_kwargs["connection_pool_size"] == 3
+
+
+def test_prewarm_initializes_bot_in_background():
+    """Test that the connection is warmed up on the sender loop."""
+    bot = MagicMock()
+    bot.get_me = AsyncMock()
+    bot.initialize = AsyncMock()
+    bot.close = AsyncMock()
+    with patch("tgbot_logging.handler.Bot", return_value=bot), patch("signal.signal"):
+        handler = TelegramHandler(token="test_token", chat_ids="123", rate_limit=False)
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), handler.loop).result(1)
+
+        bot.initialize.assert_awaited_once()
+        handler.close()